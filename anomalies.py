@@ -0,0 +1,62 @@
+"""Vectorized fuel-discrepancy classification and journey status derivation.
+
+The route monitor, the PDF report and the checkpoint confirmation modal all
+classify readings through this module, so they agree on the thresholds.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+OVERDUE_AFTER = timedelta(days=3)
+
+# A discrepancy is the previous reading minus the current one, in liters.
+FUEL_INCREASE_LIMIT = -50
+SUSPICIOUS_LOSS_LIMIT = 250
+CRITICAL_LOSS_LIMIT = 1000
+
+SEVERITIES = ('increase', 'critical', 'suspicious', 'normal')
+# Readings in these classes must be confirmed by the officer before they are logged.
+CONFIRMATION_SEVERITIES = ('increase', 'critical')
+
+
+def overdue_cutoff(now=None):
+    """Returns the created_at value before which an in-transit journey is overdue, as stored in SQLite."""
+    return ((now or datetime.now()) - OVERDUE_AFTER).isoformat(' ')
+
+
+def classify_discrepancies(discrepancies):
+    """Maps an array of discrepancies to severity labels."""
+    d = np.asarray(discrepancies, dtype=float)
+    return np.select([d < FUEL_INCREASE_LIMIT, d > CRITICAL_LOSS_LIMIT, d > SUSPICIOUS_LOSS_LIMIT],
+                     list(SEVERITIES[:3]), default=SEVERITIES[3])
+
+
+def classify_discrepancy(discrepancy):
+    """Severity label for a single discrepancy."""
+    return str(classify_discrepancies([discrepancy])[0])
+
+
+def checkpoint_deltas(checkpoints, initial_fuel, journey_col='vehicle_id'):
+    """Adds previous_fuel, discrepancy and severity columns to checkpoint rows.
+
+    Rows must be in chain order within each journey. initial_fuel is either a
+    scalar or a Series aligned with the rows, giving the journey's registered
+    fuel volume for the first checkpoint of each journey.
+    """
+    readings = checkpoints['fuel_volume_check'].astype(float)
+    discrepancy = -readings.groupby(checkpoints[journey_col], sort=False).diff()
+    first = discrepancy.isna()
+    start = initial_fuel[first] if isinstance(initial_fuel, pd.Series) else initial_fuel
+    discrepancy[first] = start - readings[first]
+    return checkpoints.assign(previous_fuel=readings + discrepancy, discrepancy=discrepancy,
+                              severity=classify_discrepancies(discrepancy))
+
+
+def derive_status(status, created_at, now=None):
+    """Replaces 'in_transit' with 'overdue' for journeys older than OVERDUE_AFTER."""
+    cutoff = pd.Timestamp((now or datetime.now()) - OVERDUE_AFTER)
+    created = pd.to_datetime(created_at)
+    return np.where((np.asarray(status) == 'in_transit') & (np.asarray(created) < cutoff.to_datetime64()),
+                    'overdue', np.asarray(status))
@@ -1,7 +1,7 @@
 
 import dash
 import dash_auth
-from dash import dcc, html, Input, Output, State, dash_table
+from dash import dcc, html, Input, Output, State, ClientsideFunction, dash_table
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import plotly.express as px
@@ -9,25 +9,36 @@ import pandas as pd
 import sqlite3
 import hashlib
 import Dashauth
-import qrcode
-import io
+from database import ConnectionPool, apply_migrations, audit_query_plans, backfill_truck_ids, enable_wal
+import queries
+import repository
+from kpis import monitor_counts, read_kpis
+from cache import ResultCache
+from events import ChangeFeed
+from uploads import UploadStore
+from images import VARIANTS, variant_path
+from blobs import BLOB_DIR, BlobStore
+from reports import ReportService
+from integrity import checkpoint_signature, verify_ledger
+from ledger import append_checkpoints, begin_immediate
+from merkle import build_rollup
+from plates import PlateIndex
+from refdata import ReferenceData
+from archive import ARCHIVE_DIR, LedgerArchive
+from anomalies import CONFIRMATION_SEVERITIES, checkpoint_deltas, classify_discrepancy, derive_status
+from flask import Response, abort, jsonify, request, send_from_directory
+from werkzeug.exceptions import HTTPException
 import os
-import base64
+import threading
 from datetime import datetime, timedelta
-import json
 import random
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.utils import ImageReader
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak, Flowable
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 from PIL import Image as PILImage, ImageDraw, ImageFont
 
 # --- App Initialization with Bootstrap Theme and Font Awesome Icons ---
 FA = "https://use.fontawesome.com/releases/v5.15.4/css/all.css"
-app = dash.Dash(__name__, suppress_callback_exceptions=True, external_stylesheets=[dbc.themes.FLATLY, FA])
+# The service worker is served from the site root by /pwabuilder-sw.js, not loaded into the page.
+app = dash.Dash(__name__, suppress_callback_exceptions=True, external_stylesheets=[dbc.themes.FLATLY, FA],
+                assets_ignore=r'pwabuilder-sw\.js')
 
 app.index_string = '''<!DOCTYPE html>
 <html>
@@ -49,7 +60,7 @@ app.index_string = '''<!DOCTYPE html>
     window.addEventListener('load', ()=> {
       navigator
       .serviceWorker
-      .register('./assets/pwabuilder-sw.js')
+      .register('/pwabuilder-sw.js')
       .then(()=>console.log("Ready."))
       .catch(()=>console.log("Err..."));
     });
@@ -70,13 +81,140 @@ DB_FILE = 'fuel_transport_ledger_v7.6_final.db'
 LOGO_FILE = "logo.PNG"
 
 server = app.server
-
+db_pool = ConnectionPool(DB_FILE)
+# Dashboard output is the same for every session; writes invalidate it across workers.
+dashboard_cache = ResultCache(ttl=30, stamp_file=f"{DB_FILE}.cache-stamp")
+change_feed = ChangeFeed(DB_FILE)
+# Plates of in-transit journeys with their last reading, for typeahead on the checkpoint form.
+plate_index = PlateIndex(DB_FILE, change_feed)
+# Locations, officers and invoices for the forms, checked against the database's version every few seconds.
+reference_data = ReferenceData(DB_FILE)
+# Pages are refreshed by change events; the interval only covers time-based state such as overdue journeys.
+FALLBACK_REFRESH_MS = 5 * 60 * 1000
+# Uploaded images wait here, outside the public assets folder, until a form submission claims them.
+upload_store = UploadStore(os.path.join('uploads', 'incoming'))
+# Evidence and passport images, named by the SHA-256 of the master and stored with their variants.
+blob_store = BlobStore(BLOB_DIR, companions=[v[1] for v in VARIANTS.values()])
+report_service = ReportService(DB_FILE, 'report_cache', logo_path=os.path.join('assets', LOGO_FILE),
+                               archive_dir=ARCHIVE_DIR)
+# Completed journeys older than archive.ARCHIVE_AFTER_DAYS are moved here by `python archive.py run`.
+ledger_archive = LedgerArchive(DB_FILE, ARCHIVE_DIR)
+SYNC_BATCH_LIMIT = 50
+BATCH_CHECKPOINT_LIMIT = 1000
 
 auth = dash_auth.BasicAuth(
     app,
     Dashauth.VALID_USERNAME_PASSWORD_PAIRS
 )
 
+
+@server.route('/metrics')
+def metrics():
+    """Exposes per-worker connection pool, cache and plate index counters as JSON."""
+    return jsonify({'db_pool': db_pool.stats(), 'dashboard_cache': dashboard_cache.stats(),
+                    'plate_index': plate_index.stats(), 'reference_data': reference_data.stats()})
+
+
+@server.route('/events')
+def events_stream():
+    """Server-Sent Events stream of ledger writes, consumed by assets/live-updates.js."""
+    return Response(change_feed.stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _export_journeys(conn, filters):
+    """Journeys matching a bulk export's filters, archived ones (registered earlier) first."""
+    archived = ledger_archive.query(conn, queries.EXPORT_JOURNEYS, filters, filters['start'], filters['end'])
+    return archived + conn.execute(queries.EXPORT_JOURNEYS, filters).fetchall()
+
+
+@server.route('/exports/<export_id>.zip')
+def export_reports(export_id):
+    """Streams a bulk export prepared on the receipt page as a ZIP of journey reports."""
+    export = report_service.load_export(export_id)
+    if export is None: abort(404)
+    with db_pool.connection() as conn:
+        journeys = _export_journeys(conn, export['filters'])
+    return Response(report_service.stream_export(export, journeys), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="journey-reports-{export_id}.zip"',
+                             'X-Accel-Buffering': 'no'})
+
+
+@server.route('/upload', methods=['POST'])
+def upload_image():
+    """Receives one image from assets/uploads.js and returns the handle the forms submit."""
+    try:
+        handle, filename = upload_store.receive(request)
+    except HTTPException as e:
+        return jsonify({'error': e.description}), e.code
+    return jsonify({'handle': handle, 'filename': filename})
+
+
+@server.route('/pwabuilder-sw.js')
+def service_worker():
+    """Serves the service worker from the root so that its scope covers every page, not just /assets/."""
+    return send_from_directory('assets', 'pwabuilder-sw.js', mimetype='text/javascript', max_age=0)
+
+
+@server.route('/api/checkpoints', methods=['POST'])
+def ingest_checkpoints():
+    """Logs a batch of checkpoints, e.g. a convoy at a border post, in one transaction.
+
+    The body is a JSON array of {plate, loc, officer, fuel, notes, img_handle}
+    records; img_handle is optional and comes from /upload. Each record is
+    validated and chained on its own, in array order, and the response
+    holds one result per record in the same order.
+    """
+    records = request.get_json(silent=True)
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        return jsonify({'error': "Expected a JSON array of checkpoint objects."}), 400
+    if len(records) > BATCH_CHECKPOINT_LIMIT:
+        return jsonify({'error': f"At most {BATCH_CHECKPOINT_LIMIT} checkpoints can be logged per request."}), 413
+    try:
+        with db_pool.connection() as conn:
+            begin_immediate(conn)
+            entries = [_checkpoint_entry(record) for record in records]
+            results = append_checkpoints(conn, entries)
+            _reference_checkpoint_images(conn, entries, results)
+            conn.commit()
+            _move_in_checkpoint_images(entries, results)
+            _checkpoints_logged(conn, results)
+    except sqlite3.Error as e:
+        return jsonify({'error': f"Database error: {e}"}), 503
+    created = sum(result['status'] == 'created' for result in results)
+    return jsonify({'created': created, 'rejected': len(results) - created, 'results': results})
+
+
+@server.route('/sync/checkpoints', methods=['POST'])
+def sync_checkpoints():
+    """Applies a batch of checkpoints queued offline by assets/checkpoint-queue.js and returns one result per entry.
+
+    Entries are applied in the device's sequence order, each in its own
+    transaction, so the hash chain grows exactly as if they had been
+    submitted online one after another. An idempotency key that was already
+    applied returns the original result instead of a second checkpoint. A
+    result's status is 'applied', 'duplicate', 'rejected' (the entry cannot
+    be logged, e.g. the journey is not in transit) or 'retry'.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('device_id'), str) \
+            or not isinstance(payload.get('items'), list) or not payload['device_id']:
+        return jsonify({'error': "Expected a JSON object with 'device_id' and 'items'."}), 400
+    if len(payload['items']) > SYNC_BATCH_LIMIT:
+        return jsonify({'error': f"At most {SYNC_BATCH_LIMIT} checkpoints can be synced per request."}), 413
+    items = [item for item in payload['items'] if isinstance(item, dict)]
+    if len(items) != len(payload['items']) or not all(isinstance(item.get('seq'), int) for item in items):
+        return jsonify({'error': "Every item must be an object with an integer 'seq'."}), 400
+    results = []
+    for item in sorted(items, key=lambda item: item['seq']):
+        # Nothing after an entry that must be retried is applied, or the device's order would be lost.
+        if results and results[-1]['status'] == 'retry':
+            results.append({'key': item.get('key'), 'seq': item['seq'], 'status': 'retry'})
+        else:
+            results.append(_sync_checkpoint(payload['device_id'], item))
+    return jsonify({'results': results})
+
+
 # --- List of African Countries for Dropdown ---
 AFRICAN_COUNTRIES = [
     'Algeria', 'Angola', 'Benin', 'Botswana', 'Burkina Faso', 'Burundi', 'Cabo Verde',
@@ -94,8 +232,71 @@ AFRICAN_COUNTRIES = [
 # --- Database Schema Setup ---
 def init_database():
     """Initializes the database and tables, updating the schema if necessary."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    journal_mode = enable_wal(DB_FILE)
+    if journal_mode.lower() != 'wal':
+        print(f"WARNING: Could not enable WAL journaling (journal_mode={journal_mode}).")
+    with db_pool.connection() as conn:
+        _create_schema(conn.cursor())
+        apply_migrations(conn)
+    threading.Thread(target=_link_journeys_to_trucks, name='truck-backfill', daemon=True).start()
+
+
+def _link_journeys_to_trucks():
+    linked = backfill_truck_ids(DB_FILE)
+    if linked:
+        print(f"INFO: Linked {linked} earlier journeys to their trucks.")
+
+
+_rollup_lock = threading.Lock()
+
+
+def _start_rollup():
+    """Builds today's Merkle roll-up on a background thread. Returns False if a build is already running."""
+    if not _rollup_lock.acquire(blocking=False):
+        return False
+
+    def build():
+        try:
+            with db_pool.connection() as conn:
+                build_rollup(conn)
+        finally:
+            _rollup_lock.release()
+    threading.Thread(target=build, name='merkle-rollup', daemon=True).start()
+    return True
+
+
+_verification_lock = threading.Lock()
+# State of this worker's last ledger verification, read by the integrity view while it polls.
+_verification = {}
+
+
+def _start_verification(full):
+    """Verifies the ledger, and for a full audit the archive, on a background thread.
+
+    Returns False if a verification is already running. Progress and the
+    summaries end up in _verification; the per-journey results are stored
+    in chain_watermarks as the verifier goes.
+    """
+    if not _verification_lock.acquire(blocking=False):
+        return False
+    _verification.clear()
+    _verification.update(state='running', full=full, started_at=datetime.now())
+
+    def verify():
+        try:
+            run = verify_ledger(DB_FILE, full=full)
+            archived = ledger_archive.verify() if full else None
+            _verification.update(state='done', run=run, archived=archived, finished_at=datetime.now())
+        except Exception as e:
+            _verification.update(state='failed', error=str(e), finished_at=datetime.now())
+        finally:
+            _verification_lock.release()
+    threading.Thread(target=verify, name='ledger-verify', daemon=True).start()
+    return True
+
+
+def _create_schema(cursor):
+    """Creates missing tables and upgrades columns of older databases."""
     # Create tables if they don't exist
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS vehicles (
@@ -137,18 +338,18 @@ def init_database():
             print("INFO: Adding 'image_path' column to 'checkpoints' table.")
             cursor.execute("ALTER TABLE checkpoints ADD COLUMN image_path TEXT")
 
-    conn.commit()
-    conn.close()
-
 
 # --- Comprehensive Database Seeder with Scenarios ---
 def seed_database():
     """Populates all database tables with specific scenarios for testing."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    with db_pool.connection() as conn:
+        _seed_scenarios(conn.cursor())
+    reference_data.invalidate()
 
-    if cursor.execute("SELECT COUNT(*) FROM officers").fetchone()[0] > 0:
-        conn.close()
+
+def _seed_scenarios(cursor):
+    """Inserts officers, invoices and scenario journeys unless already seeded."""
+    if cursor.execute(queries.COUNT_OFFICERS).fetchone()[0] > 0:
         return
 
     print("INFO: Seeding database with test data...")
@@ -161,16 +362,17 @@ def seed_database():
     officers_to_add = []
     for i, name in enumerate(officer_names):
         officers_to_add.append((name, f"CP{i + 1:03d}", random.choice(locations)))
-    cursor.executemany('INSERT INTO officers (name, badge_number, checkpoint_location) VALUES (?, ?, ?)',
-                       officers_to_add)
+    cursor.executemany(queries.INSERT_OFFICER, officers_to_add)
+    officers_by_location = {}
+    for name, _, loc in officers_to_add:
+        officers_by_location.setdefault(loc, []).append(name)
 
     simulated_payments = []
     for i in range(30):
         simulated_payments.append((f"INV{random.randint(10000, 99999)}", round(random.uniform(5000.0, 50000.0), 2)))
-    cursor.executemany('INSERT OR IGNORE INTO payment_validation (invoice_number, amount_paid) VALUES (?, ?)',
-                       simulated_payments)
+    cursor.executemany(queries.INSERT_PAYMENT, simulated_payments)
 
-    payment_records = cursor.execute("SELECT invoice_number, amount_paid FROM payment_validation").fetchall()
+    payment_records = cursor.execute(queries.ALL_PAYMENTS).fetchall()
     random.shuffle(payment_records)
 
     sample_drivers = ['Ali Mohammed', 'Grace Nakato', 'Samuel Okech', 'Fatima Yusuf', 'Daniel Wani']
@@ -189,7 +391,7 @@ def seed_database():
     if not os.path.exists(evidence_dir): os.makedirs(evidence_dir)
     placeholder_evidence_path = os.path.join(evidence_dir, 'placeholder_evidence.PNG')
     if not os.path.exists(placeholder_evidence_path):
-        img = PILImage.new('RGB', (400, 100), color=colors.lightgrey.hexval)
+        img = PILImage.new('RGB', (400, 100), color='lightgrey')
         d = ImageDraw.Draw(img)
         try:
             font = ImageFont.truetype("arial.ttf", 20)
@@ -203,7 +405,7 @@ def seed_database():
     total_vehicles = 25
 
     for i in range(total_vehicles):
-        scenario_type = 'normal'
+        scenario_type = scenarios[i] if i < len(scenarios) else 'normal'
         status = 'in_transit' if i < 15 and i % 2 == 0 else 'completed'
         created = datetime.now() - timedelta(days=random.randint(0, 5 if i < 15 else 30), hours=random.randint(1, 23))
 
@@ -223,14 +425,9 @@ def seed_database():
         })
 
     vehicles_to_insert = [{k: v for k, v in d.items() if k != 'scenario'} for d in vehicle_data_list]
-    cursor.executemany('''INSERT INTO vehicles (plate_number, driver_name, driver_id, driver_nationality,
-                         driver_passport_image_path, company_name, company_till_number, invoice_number,
-                         amount_paid, origin, destination, fuel_volume, created_at, status, unique_hash)
-                         VALUES (:plate_number, :driver_name, :driver_id, :driver_nationality, :driver_passport_image_path,
-                         :company_name, :company_till_number, :invoice_number, :amount_paid, :origin, :destination,
-                         :fuel_volume, :created_at, :status, :unique_hash)''', vehicles_to_insert)
-
-    vehicle_db_data = cursor.execute("SELECT id, plate_number FROM vehicles").fetchall()
+    cursor.executemany(queries.INSERT_SEED_VEHICLE, vehicles_to_insert)
+
+    vehicle_db_data = cursor.execute(queries.VEHICLE_IDS_BY_PLATE).fetchall()
     vehicle_id_map = {plate: v_id for v_id, plate in vehicle_db_data}
     checkpoints_to_add = []
 
@@ -246,8 +443,7 @@ def seed_database():
             last_time += timedelta(hours=random.randint(5, 12))
             loc = v_data['destination'] if i == num_stops - 1 and v_data['status'] == 'completed' else random.choice(
                 locations)
-            officers_at_loc = [row[0] for row in cursor.execute("SELECT name FROM officers WHERE checkpoint_location=?",
-                                                                (loc,)).fetchall()]
+            officers_at_loc = officers_by_location.get(loc)
             officer = random.choice(officers_at_loc) if officers_at_loc else "Default Officer"
             notes = ''
 
@@ -264,257 +460,31 @@ def seed_database():
                 last_fuel -= random.uniform(50, 250)
 
             fuel_check = round(max(0, last_fuel), 2)
-            s_hash = generate_unique_hash(
-                f"{v_id}{loc}{officer}{last_time}{fuel_check}{notes or ''}{image_path_to_add or ''}{last_hash}")
+            s_hash = checkpoint_signature(v_id, loc, officer, last_time, fuel_check, notes, image_path_to_add, None,
+                                          last_hash)
             checkpoints_to_add.append(
-                (v_id, loc, officer, last_time, fuel_check, notes, image_path_to_add, last_hash, s_hash))
+                (v_id, i + 1, loc, officer, last_time, fuel_check, notes, image_path_to_add, last_hash, s_hash))
             last_hash = s_hash
             if fuel_check <= 0: break
 
-    cursor.executemany('''INSERT INTO checkpoints (vehicle_id, checkpoint_name, officer_name, timestamp,
-                         fuel_volume_check, notes, image_path, previous_hash, signature_hash)
-                         VALUES (?,?,?,?,?,?,?,?,?)''', checkpoints_to_add)
-
-    conn.commit()
-    conn.close()
+    cursor.executemany(queries.INSERT_SEED_CHECKPOINT, checkpoints_to_add)
     print("INFO: Database seeding process completed.")
 
 
-# --- UTILITY AND PDF FUNCTIONS ---
+# --- UTILITY FUNCTIONS ---
 def generate_unique_hash(data):
     """Generates a SHA-256 hash for given data."""
     return hashlib.sha256(str(data).encode()).hexdigest()
 
 
-def generate_qr_code_b64(data):
-    """Generates a QR code and returns it as a Base64 encoded string."""
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(data);
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = io.BytesIO();
-    img.save(buffer, format='PNG')
-    return base64.b64encode(buffer.getvalue()).decode()
-
-
 def get_checkpoint_locations():
-    """Fetches unique checkpoint locations from the database for dropdowns."""
-    with sqlite3.connect(DB_FILE) as conn:
-        return pd.read_sql_query('SELECT DISTINCT checkpoint_location FROM officers', conn)[
-            'checkpoint_location'].tolist()
+    """Fetches unique checkpoint locations for dropdowns."""
+    return reference_data.locations()
 
 
 def get_officers_by_checkpoint(checkpoint):
-    """Fetches officers based on their assigned checkpoint location."""
-    with sqlite3.connect(DB_FILE) as conn:
-        return pd.read_sql_query('SELECT name, badge_number FROM officers WHERE checkpoint_location = ?', conn,
-                                 params=[checkpoint])
-
-
-class CHRL(Flowable):
-    """A custom ReportLab flowable for a horizontal line."""
-
-    def __init__(self, width, thickness=1, color=colors.black):
-        Flowable.__init__(self)
-        self.width = width
-        self.thickness = thickness
-        self.color = color
-
-    def draw(self):
-        self.canv.setStrokeColor(self.color)
-        self.canv.setLineWidth(self.thickness)
-        self.canv.line(0, 0, self.width, 0)
-
-
-def create_journey_pdf(journey_id):
-    """Generates a comprehensive PDF report for a given journey ID."""
-    try:
-        with sqlite3.connect(DB_FILE) as conn:
-            vehicle = pd.read_sql_query("SELECT * FROM vehicles WHERE id = ?", conn, params=[journey_id]).iloc[0]
-            checkpoints = pd.read_sql_query("SELECT * FROM checkpoints WHERE vehicle_id = ? ORDER BY timestamp", conn,
-                                            params=[journey_id])
-
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, leftMargin=0.5 * inch, rightMargin=0.5 * inch,
-                                topMargin=0.5 * inch, bottomMargin=0.5 * inch)
-
-        styles = getSampleStyleSheet()
-        styles.add(ParagraphStyle(name='ReportTitle', fontSize=22, fontName='Helvetica-Bold', alignment=TA_RIGHT,
-                                  textColor=colors.HexColor("#0D47A1")))
-        styles.add(ParagraphStyle(name='ReportSubtitle', fontSize=11, fontName='Helvetica-Oblique', alignment=TA_RIGHT,
-                                  textColor=colors.grey))
-        styles.add(
-            ParagraphStyle(name='SectionHeader', fontSize=16, fontName='Helvetica-Bold', spaceBefore=24, spaceAfter=12,
-                           textColor=colors.HexColor("#0D47A1")))
-        styles.add(ParagraphStyle(name='DetailKey', fontSize=9, fontName='Helvetica-Bold'))
-        styles.add(ParagraphStyle(name='DetailValue', fontSize=11, fontName='Helvetica'))
-        styles.add(ParagraphStyle(name='NotesStyle', fontSize=9, fontName='Helvetica', leading=12))
-        styles.add(ParagraphStyle(name='FooterText', fontSize=8, fontName='Helvetica', alignment=TA_CENTER,
-                                  textColor=colors.grey))
-        styles.add(ParagraphStyle(name='RightAlign', alignment=TA_RIGHT))
-        # Style for the hash values to make them smaller
-        styles.add(ParagraphStyle(name='HashStyle', fontSize=7, fontName='Courier', leading=8))
-
-        story = []
-
-        logo_path = os.path.join('assets', LOGO_FILE)
-        logo_img = Image(logo_path, width=1.5 * inch, height=0.75 * inch, kind='proportional') if os.path.exists(
-            logo_path) else Paragraph("[Logo]", styles['Normal'])
-        header_data = [[logo_img, [Paragraph("Official Journey Report", styles['ReportTitle']), Spacer(1, 12),
-                                   Paragraph(f"Vehicle: <b>{vehicle['plate_number']}</b>", styles['ReportSubtitle'])]]]
-        header_table = Table(header_data, colWidths=[2.0 * inch, 5.5 * inch])
-        header_table.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'BOTTOM')]))
-        story.append(header_table)
-        story.append(CHRL(7.5 * inch, thickness=2, color=colors.HexColor("#0D47A1")))
-        story.append(Spacer(1, 0.3 * inch))
-
-        passport_image = Paragraph("[No Image]", styles['Normal'])
-        if vehicle['driver_passport_image_path'] and os.path.exists(vehicle['driver_passport_image_path']):
-            try:
-                passport_image = Image(vehicle['driver_passport_image_path'], width=1.0 * inch, height=1.2 * inch)
-            except Exception:
-                passport_image = Paragraph("[Error]", styles['Normal'])
-
-        final_hash = checkpoints['signature_hash'].iloc[-1] if not checkpoints.empty else vehicle['unique_hash']
-        qr_data = json.dumps({'plate': vehicle['plate_number'], 'final_hash': final_hash})
-        qr_code_image = Image(io.BytesIO(base64.b64decode(generate_qr_code_b64(qr_data))), width=1.2 * inch,
-                              height=1.2 * inch)
-
-        details_data = [
-            [Paragraph("<b>Company</b>", styles['DetailKey']),
-             Paragraph(vehicle['company_name'], styles['DetailValue']), Paragraph("<b>Driver</b>", styles['DetailKey']),
-             Paragraph(f"{vehicle['driver_name']} ({vehicle['driver_nationality']})", styles['DetailValue']),
-             passport_image],
-            [Paragraph("<b>Route</b>", styles['DetailKey']),
-             Paragraph(f"{vehicle['origin']} ➔ {vehicle['destination']}", styles['DetailValue']),
-             Paragraph("<b>Dispatched</b>", styles['DetailKey']),
-             Paragraph(f"{pd.to_datetime(vehicle['created_at']).strftime('%Y-%m-%d %H:%M')}", styles['DetailValue']),
-             ''],
-            [Paragraph("<b>Invoice No.</b>", styles['DetailKey']),
-             Paragraph(vehicle['invoice_number'], styles['DetailValue']),
-             Paragraph("<b>Amount Paid</b>", styles['DetailKey']),
-             Paragraph(f"${vehicle['amount_paid']:,.2f}", styles['DetailValue']), qr_code_image],
-            [Paragraph("<b>Initial Fuel</b>", styles['DetailKey']),
-             Paragraph(f"{vehicle['fuel_volume']:,.0f} Liters", styles['DetailValue']), '', '', '']
-        ]
-        details_table = Table(details_data, colWidths=[1.0 * inch, 2.0 * inch, 1.0 * inch, 2.0 * inch, 1.5 * inch])
-        details_table.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'), ('GRID', (0, 0), (-2, -1), 1, colors.lightgrey),
-            ('SPAN', (4, 0), (4, 1)), ('ALIGN', (4, 0), (4, 1), 'CENTER'),
-            ('SPAN', (4, 2), (4, 3)), ('ALIGN', (4, 2), (4, 3), 'CENTER'),
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor("#E3F2FD")),
-            ('BACKGROUND', (2, 0), (2, -1), colors.HexColor("#E3F2FD")),
-        ]))
-        story.append(details_table)
-        story.append(Spacer(1, 0.3 * inch))
-
-        is_chain_valid = all(
-            row['previous_hash'] == (checkpoints['signature_hash'].iloc[i - 1] if i > 0 else vehicle['unique_hash']) for
-            i, row in checkpoints.iterrows())
-        integrity_p = Paragraph(
-            f'✔ <font color="#2E7D32"><b>Chain Verified:</b> The log is complete and untampered.</font>' if is_chain_valid else f'❌ <font color="#C62828"><b>Chain Broken:</b> The log integrity is compromised!</font>',
-            styles['Normal'])
-        story.append(integrity_p)
-        story.append(Spacer(1, 0.2 * inch))
-
-        # Add Genesis Hash
-        story.append(Paragraph(
-            f"<b>Genesis Hash:</b> <font size=7 face=Courier>{vehicle['unique_hash'][:12]}...{vehicle['unique_hash'][-12:]}</font>",
-            styles['Normal']))
-        story.append(Spacer(1, 0.2 * inch))
-
-        story.append(Paragraph("Checkpoint Ledger", styles['SectionHeader']))
-        story.append(CHRL(7.5 * inch, color=colors.HexColor("#B0BEC5")))
-
-        last_fuel = vehicle['fuel_volume']
-        for i, row in checkpoints.iterrows():
-            discrepancy = last_fuel - row['fuel_volume_check']
-            last_fuel = row['fuel_volume_check']
-
-            if discrepancy < -50:
-                disc_color, disc_text = colors.red, "<b>ANOMALY (INCREASE)</b>"
-            elif discrepancy > 1000:
-                disc_color, disc_text = colors.darkred, "<b>CRITICAL LOSS</b>"
-            elif discrepancy > 250:
-                disc_color, disc_text = colors.orange, "<b>SUSPICIOUS LOSS</b>"
-            else:
-                disc_color, disc_text = colors.darkgreen, "Normal Consumption"
-
-            cp_header_data = [[Paragraph(f"<b>Checkpoint {i + 1}:</b> {row['checkpoint_name']}", styles['Normal']),
-                               Paragraph(
-                                   f"<b>Timestamp:</b> {pd.to_datetime(row['timestamp']).strftime('%Y-%m-%d %H:%M')}",
-                                   styles['RightAlign'])]]
-            story.append(Table(cp_header_data, colWidths=[3.75 * inch, 3.75 * inch],
-                               style=TableStyle([('BACKGROUND', (0, 0), (-1, -1), colors.HexColor("#E3F2FD"))])))
-
-            cp_details_data = [
-                [Paragraph("<b>Officer:</b>", styles['DetailKey']),
-                 Paragraph(row['officer_name'], styles['DetailValue'])],
-                [Paragraph("<b>Fuel Check:</b>", styles['DetailKey']),
-                 Paragraph(f"{row['fuel_volume_check']:,.0f} L", styles['DetailValue'])],
-                [Paragraph("<b>Discrepancy:</b>", styles['DetailKey']),
-                 Paragraph(f"<font color='{disc_color.hexval()}'>{disc_text}: {discrepancy:,.1f} L</font>",
-                           styles['DetailValue'])]
-            ]
-
-            if row['notes']:
-                cp_details_data.append(
-                    [Paragraph("<b>Notes:</b>", styles['DetailKey']), Paragraph(row['notes'], styles['NotesStyle'])])
-
-            # **UPDATED**: Add truncated hashes to the report.
-            if 'previous_hash' in row and row['previous_hash']:
-                prev_hash = row['previous_hash']
-                prev_hash_display = f"{prev_hash[:12]}...{prev_hash[-12:]}"
-                cp_details_data.append([Paragraph("<b>Prev Hash:</b>", styles['DetailKey']),
-                                        Paragraph(prev_hash_display, styles['HashStyle'])])
-
-            if 'signature_hash' in row and row['signature_hash']:
-                sig_hash = row['signature_hash']
-                sig_hash_display = f"{sig_hash[:12]}...{sig_hash[-12:]}"
-                cp_details_data.append([Paragraph("<b>Checkpoint Hash:</b>", styles['DetailKey']),
-                                        Paragraph(sig_hash_display, styles['HashStyle'])])
-
-            if 'image_path' in row and row['image_path'] and os.path.exists(row['image_path']):
-                try:
-                    pil_img = PILImage.open(row['image_path'])
-                    pil_img.verify()  # Verify image integrity
-                    pil_img.close()
-
-                    # Reopen for ReportLab
-                    pil_img_for_reportlab = PILImage.open(row['image_path'])
-                    pil_img_for_reportlab.load()
-                    img_reader = ImageReader(pil_img_for_reportlab)
-
-                    img = Image(img_reader, width=3 * inch, kind='proportional')
-                    img.hAlign = 'LEFT'
-                    cp_details_data.append([Paragraph("<b>Evidence:</b>", styles['DetailKey']), img])
-                except Exception as e:
-                    print(f"PDF Image Error: Could not load or process image from path {row['image_path']}. Error: {e}")
-                    cp_details_data.append([Paragraph("<b>Evidence:</b>", styles['DetailKey']),
-                                            Paragraph("[Image File Error]", styles['NotesStyle'])])
-
-            cp_details_table = Table(cp_details_data, colWidths=[1.2 * inch, 6.3 * inch])
-            cp_details_table.setStyle(
-                TableStyle([('VALIGN', (0, 0), (-1, -1), 'TOP'), ('GRID', (0, 0), (-1, -1), 1, colors.lightgrey)]))
-            story.append(cp_details_table)
-            story.append(Spacer(1, 0.3 * inch))
-
-        def footer(canvas, doc):
-            canvas.saveState()
-            footer_text = "Defyhatenow EA Office | Juba, Hai-Malakal, Nimule Street | Tel: +211 922 007 505"
-            page_num_text = f"Page {doc.page}"
-            canvas.setFont('Helvetica', 8)
-            canvas.setFillColor(colors.grey)
-            canvas.drawCentredString(letter[0] / 2.0, 0.3 * inch, footer_text)
-            canvas.drawRightString(letter[0] - 0.5 * inch, 0.3 * inch, page_num_text)
-            canvas.restoreState()
-
-        doc.build(story, onFirstPage=footer, onLaterPages=footer)
-        buffer.seek(0)
-        return buffer.getvalue()
-    except Exception as e:
-        print(f"CRITICAL ERROR in create_journey_pdf: {e}")
-        return None
+    """Fetches (name, badge_number) of the officers assigned to a checkpoint location."""
+    return reference_data.officers(checkpoint)
 
 
 # --- APP LAYOUT AND STYLING ---
@@ -531,6 +501,9 @@ def create_navbar():
             dbc.NavItem(dbc.NavLink("Checkpoint Login", href="/checkpoint")),
             dbc.NavItem(dbc.NavLink("Route Monitor", href="/monitor")),
             dbc.NavItem(dbc.NavLink("Download Reports", href="/receipt")),
+            dbc.NavItem(dbc.NavLink("Ledger Integrity", href="/integrity")),
+            # Filled in by assets/offline-checkpoints.js while checkpoints wait on this device.
+            dbc.NavItem(html.Span(id='offline-queue-badge', className="d-none")),
         ], brand=html.Span([logo_display, "Fuel Transport Ledger"]), brand_href="/", color="primary", dark=True,
         className="mb-4",
     )
@@ -538,6 +511,7 @@ def create_navbar():
 
 app.layout = html.Div([
     dcc.Store(id='checkpoint-data-store'),
+    dcc.Store(id='live-event'),
     dcc.Location(id='url', refresh=False),
     create_navbar(),
     dbc.Container(id='page-content', fluid=True)
@@ -573,7 +547,7 @@ def dashboard_layout():
             html.H4(html.Span([html.I(className="fas fa-history me-2"), " Recent Journeys"])),
             html.Div(id='active-transports-table')
         ])),
-        dcc.Interval(id='interval-component', interval=30 * 1000, n_intervals=0)
+        dcc.Interval(id='interval-component', interval=FALLBACK_REFRESH_MS, n_intervals=0)
     ])
 
 
@@ -602,6 +576,7 @@ def register_layout():
                            style={'width': '100%', 'height': '60px', 'lineHeight': '60px', 'borderWidth': '1px',
                                   'borderStyle': 'dashed', 'borderRadius': '5px', 'textAlign': 'center'},
                            multiple=False),
+                dcc.Store(id='passport-upload'),
                 html.Div(id='output-passport-upload', className='text-center mt-2')
             ], className="mb-3 border rounded p-3"),
             html.Hr(),
@@ -665,7 +640,9 @@ def checkpoint_layout():
         dbc.Form([
             html.Div([dbc.Label("Vehicle Plate Number"),
                       dbc.Input(id='cp-plate-number', placeholder='Enter plate number to fetch last reading',
-                                persistence=True, persistence_type='session')], className="mb-3", ),
+                                list='active-plates', autocomplete='off', persistence=True,
+                                persistence_type='session'),
+                      html.Datalist(id='active-plates')], className="mb-3", ),
             html.Div(id='last-reading-info', className="mb-3 p-3 border rounded bg-light"),
             dbc.Row([
                 dbc.Col(html.Div([dbc.Label("Checkpoint Location"),
@@ -683,6 +660,7 @@ def checkpoint_layout():
                            children=html.Div(['Drag and Drop or ', html.A('Select Image')]),
                            style={'width': '100%', 'height': '60px', 'lineHeight': '60px', 'borderWidth': '1px',
                                   'borderStyle': 'dashed', 'borderRadius': '5px', 'textAlign': 'center'}, ),
+                dcc.Store(id='checkpoint-upload'),
                 html.Div(id='output-checkpoint-image-upload', className='text-center mt-2')
             ], className="mb-3"),
             html.Div(
@@ -690,6 +668,7 @@ def checkpoint_layout():
                 className="mb-3"),
             dbc.Button(html.Span([html.I(className="fas fa-book-open me-2"), " Submit Log to Ledger"]),
                        id='checkpoint-btn', color='primary', className="w-100"),
+            dcc.Store(id='checkpoint-submit'),
             html.Div(id='checkpoint-output', className='mt-4')
         ])
     ])), lg=8, md=10), justify="center")
@@ -704,17 +683,78 @@ def monitor_layout():
             {'label': 'Completed', 'value': 'completed'},
             {'label': 'Overdue', 'value': 'overdue'}], value='all'), md=4), className="mb-4"),
         dbc.Row(dbc.Col(dcc.Loading(html.Div(id='route-monitoring-content')))),
-        dcc.Interval(id='monitor-interval', interval=30 * 1000, n_intervals=0)
+        dcc.Store(id='monitor-page-ids'),
+        dcc.Store(id='monitor-cursors'),
+        dbc.Row(dbc.Col([
+            dbc.Button(html.Span([html.I(className="fas fa-chevron-left me-2"), "Newer"]), id='monitor-newer',
+                       color="secondary", outline=True, className="me-2", disabled=True),
+            dbc.Button(html.Span(["Older", html.I(className="fas fa-chevron-right ms-2")]), id='monitor-older',
+                       color="secondary", outline=True, disabled=True)
+        ], className="d-flex justify-content-center mb-4")),
+        dcc.Interval(id='monitor-interval', interval=FALLBACK_REFRESH_MS, n_intervals=0)
     ])
 
 
 def receipt_layout():
     return dbc.Row(dbc.Col(dbc.Card(dbc.CardBody([
         html.H3(html.Span([html.I(className="fas fa-file-invoice me-2"), " Journey Report & Verification"])), html.Hr(),
-        dcc.Dropdown(id='journey-select', placeholder='Select a completed journey to generate its verifiable report',
-                     className="mb-4"),
+        dbc.Row([
+            dbc.Col(html.Div([dbc.Label("Registered Between"), html.Br(), dcc.DatePickerRange(id='picker-dates')],
+                             className="mb-3"), md=12),
+            dbc.Col(html.Div([dbc.Label("Company"), dcc.Dropdown(id='picker-company', placeholder="All companies")],
+                             className="mb-3"), md=6),
+            dbc.Col(html.Div([dbc.Label("Destination"),
+                              dcc.Dropdown(id='picker-destination', options=get_checkpoint_locations(),
+                                           placeholder="All destinations")], className="mb-3"), md=6),
+        ]),
+        dcc.Dropdown(id='journey-select', className="mb-2",
+                     placeholder='Type a plate or pick a completed journey to generate its verifiable report'),
+        dbc.Button("Show older journeys", id='picker-more', color="link", size="sm", className="mb-4 p-0",
+                   disabled=True),
+        dcc.Store(id='picker-cursor'),
         html.Div(id='receipt-content', className='text-center'),
-        dcc.Download(id="download-pdf-component")
+        html.Div(id='report-status', className='text-center mt-3'),
+        dcc.Store(id='report-job'),
+        dcc.Interval(id='report-poll', interval=1000, disabled=True),
+        dcc.Download(id="download-pdf-component"),
+        html.Hr(className="my-4"),
+        html.H4(html.Span([html.I(className="fas fa-file-archive me-2"), " Bulk Export for Audits"])),
+        dbc.Row([
+            dbc.Col(html.Div([dbc.Label("Dispatched Between"), html.Br(), dcc.DatePickerRange(id='export-dates')],
+                             className="mb-3"), md=12),
+            dbc.Col(html.Div([dbc.Label("Company"), dcc.Dropdown(id='export-company', placeholder="All companies")],
+                             className="mb-3"), md=6),
+            dbc.Col(html.Div([dbc.Label("Destination"),
+                              dcc.Dropdown(id='export-destination', options=get_checkpoint_locations(),
+                                           placeholder="All destinations")], className="mb-3"), md=6),
+        ]),
+        dbc.Button(html.Span([html.I(className="fas fa-file-archive me-2"), "Prepare ZIP Export"]), id='export-btn',
+                   color="secondary", className="w-100"),
+        html.Div(id='export-link', className='text-center mt-3'),
+        html.Div(id='export-progress', className='mt-3'),
+        dcc.Store(id='export-id'),
+        dcc.Interval(id='export-poll', interval=1000, disabled=True),
+    ])), lg=8, md=10), justify="center")
+
+
+def integrity_layout():
+    return dbc.Row(dbc.Col(dbc.Card(dbc.CardBody([
+        html.H3(html.Span([html.I(className="fas fa-shield-alt me-2"), " Ledger Integrity"])), html.Hr(),
+        html.P("Recomputes every checkpoint signature and evidence digest. New entries are checked from each "
+               "journey's last verified point; a full audit rehashes the whole ledger. The daily roll-up publishes "
+               "a Merkle root over the chain tips that changed since the previous one, which reports print with "
+               "their inclusion proof.",
+               className="text-muted"),
+        dbc.Row([
+            dbc.Col(dbc.Button(html.Span([html.I(className="fas fa-check-double me-2"), "Verify New Entries"]),
+                               id='verify-btn', color="primary", className="w-100"), md=4),
+            dbc.Col(dbc.Button(html.Span([html.I(className="fas fa-redo me-2"), "Full Audit"]),
+                               id='verify-full-btn', color="secondary", outline=True, className="w-100"), md=4),
+            dbc.Col(dbc.Button(html.Span([html.I(className="fas fa-sitemap me-2"), "Build Today's Roll-up"]),
+                               id='rollup-btn', color="secondary", outline=True, className="w-100"), md=4),
+        ], className="mb-4"),
+        dcc.Loading(html.Div(id='integrity-content')),
+        dcc.Interval(id='integrity-poll', interval=2000, disabled=True),
     ])), lg=8, md=10), justify="center")
 
 
@@ -727,44 +767,58 @@ def display_page(pathname):
     if pathname == '/checkpoint': return checkpoint_layout()
     if pathname == '/monitor': return monitor_layout()
     if pathname == '/receipt': return receipt_layout()
+    if pathname == '/integrity': return integrity_layout()
     return dashboard_layout()
 
 
 # Dashboard Callbacks
+JOURNEY_TOPICS = ('journey_registered', 'journey_completed', 'resync')
+CHECKPOINT_TOPICS = ('checkpoint_logged', 'resync')
+
+
+def _live_event_topic(event):
+    """Returns the change topic if the callback was triggered by a live event, otherwise None."""
+    return event.get('topic') if event and dash.ctx.triggered_id == 'live-event' else None
+
+
 @app.callback(
     [Output('active-transports', 'children'), Output('completed-today', 'children'),
      Output('overdue-transports', 'children'), Output('total-fuel', 'children')],
-    Input('interval-component', 'n_intervals')
+    [Input('interval-component', 'n_intervals'), Input('live-event', 'data')]
 )
-def update_kpis(n):
-    with sqlite3.connect(DB_FILE) as conn:
-        now, today_str = datetime.now(), datetime.now().strftime('%Y-%m-%d')
-        overdue_threshold = (now - timedelta(days=3)).isoformat()
-        active = conn.execute("SELECT COUNT(*) FROM vehicles WHERE status = 'in_transit' AND created_at >= ?",
-                              (overdue_threshold,)).fetchone()[0]
-        completed = conn.execute("SELECT COUNT(*) FROM vehicles WHERE status = 'completed' AND DATE(created_at) = ?",
-                                 (today_str,)).fetchone()[0]
-        overdue = conn.execute("SELECT COUNT(*) FROM vehicles WHERE status = 'in_transit' AND created_at < ?",
-                               (overdue_threshold,)).fetchone()[0]
-        total_fuel_query = conn.execute("SELECT SUM(fuel_volume) FROM vehicles WHERE status = 'in_transit'").fetchone()
-        total_fuel = total_fuel_query[0] or 0
+def update_kpis(n, event):
+    topic = _live_event_topic(event)
+    if topic and topic not in JOURNEY_TOPICS: raise PreventUpdate
+    return _dashboard_kpis()
+
+
+@dashboard_cache.memoize()
+def _dashboard_kpis():
+    with db_pool.connection() as conn:
+        active, completed, overdue, total_fuel = read_kpis(conn)
     return f"{active}", f"{completed}", f"{overdue}", f"{total_fuel:,.0f}"
 
 
 @app.callback(
     [Output('transport-status-chart', 'figure'), Output('checkpoint-activity-chart', 'figure')],
-    Input('interval-component', 'n_intervals')
+    [Input('interval-component', 'n_intervals'), Input('live-event', 'data')]
 )
-def update_charts(n):
-    with sqlite3.connect(DB_FILE) as conn:
-        df = pd.read_sql_query("SELECT status, created_at FROM vehicles", conn, parse_dates=['created_at'])
-        df['status'] = df.apply(
-            lambda r: 'overdue' if r['status'] == 'in_transit' and r['created_at'].to_pydatetime() < (
-                        datetime.now() - timedelta(days=3)) else r['status'], axis=1)
+def update_charts(n, event):
+    topic = _live_event_topic(event)
+    status_fig, activity_fig = _dashboard_charts()
+    if topic:
+        status_fig = status_fig if topic in JOURNEY_TOPICS else dash.no_update
+        activity_fig = activity_fig if topic in CHECKPOINT_TOPICS else dash.no_update
+    return status_fig, activity_fig
+
+
+@dashboard_cache.memoize()
+def _dashboard_charts():
+    with db_pool.connection() as conn:
+        df = pd.read_sql_query(queries.STATUS_TIMELINE, conn, parse_dates=['created_at'])
+        df['status'] = derive_status(df['status'], df['created_at'])
         status_df = df.groupby('status').size().reset_index(name='count')
-        activity_df = pd.read_sql_query(
-            "SELECT checkpoint_name, COUNT(*) as count FROM checkpoints WHERE timestamp > date('now', '-1 day') GROUP BY checkpoint_name",
-            conn)
+        activity_df = pd.read_sql_query(queries.CHECKPOINT_ACTIVITY, conn)
 
     status_fig = px.pie(status_df, values='count', names='status', title='Transport Status Distribution',
                         color_discrete_map={'in_transit': '#2c3e50', 'completed': '#4E8575', 'overdue': '#DF691A'})
@@ -777,27 +831,40 @@ def update_charts(n):
 
 @app.callback(
     Output('active-transports-table', 'children'),
-    Input('interval-component', 'n_intervals')
+    [Input('interval-component', 'n_intervals'), Input('live-event', 'data')]
 )
-def update_active_transports_table(n):
-    with sqlite3.connect(DB_FILE) as conn:
-        df = pd.read_sql_query(
-            "SELECT plate_number, driver_name, origin, destination, fuel_volume, created_at, status FROM vehicles ORDER BY created_at DESC LIMIT 10",
-            conn)
+def update_active_transports_table(n, event):
+    topic = _live_event_topic(event)
+    if topic and topic not in JOURNEY_TOPICS: raise PreventUpdate
+    return _recent_journeys_table()
+
+
+@dashboard_cache.memoize()
+def _recent_journeys_table():
+    with db_pool.connection() as conn:
+        df = pd.read_sql_query(queries.RECENT_JOURNEYS, conn)
     if df.empty: return dbc.Alert("No recent journeys.", color="info")
     df['created_at'] = pd.to_datetime(df['created_at']).dt.strftime('%Y-%m-%d %H:%M')
     return dbc.Table.from_dataframe(df, striped=True, bordered=True, hover=True, responsive=True)
 
 
+def _upload_preview(upload):
+    """Preview of an image being uploaded by assets/uploads.js, shown from the browser's own object URL."""
+    if not upload: return None
+    if upload.get('error'): status = html.P(upload['error'], className="small text-danger")
+    elif not upload.get('handle'): status = html.P("Uploading...", className="small text-muted")
+    else: status = None
+    return html.Div([html.Img(src=upload['preview'], style={'height': '100px'}),
+                     html.P(upload['filename'], className="small"), status])
+
+
 # Registration Callbacks
 @app.callback(
     Output('output-passport-upload', 'children'),
-    Input('upload-passport-image', 'contents'),
-    State('upload-passport-image', 'filename')
+    Input('passport-upload', 'data')
 )
-def update_passport_output(contents, filename):
-    if contents:
-        return html.Div([html.Img(src=contents, style={'height': '100px'}), html.P(filename, className="small")])
+def update_passport_output(upload):
+    return _upload_preview(upload)
 
 
 @app.callback(
@@ -806,9 +873,7 @@ def update_passport_output(contents, filename):
 )
 def show_invoice_list(n_clicks):
     if not n_clicks: raise PreventUpdate
-    with sqlite3.connect(DB_FILE) as conn:
-        df = pd.read_sql_query("SELECT invoice_number, amount_paid FROM payment_validation ORDER BY invoice_number",
-                               conn)
+    df = pd.DataFrame(reference_data.invoices(), columns=['invoice_number', 'amount_paid'])
     if df.empty: return html.P("No payment records found.")
     df['amount_paid'] = df['amount_paid'].apply(lambda x: f"${x:,.2f}")
     return dbc.Table.from_dataframe(df.rename(columns={"invoice_number": "Invoice #", "amount_paid": "Amount"}),
@@ -820,53 +885,52 @@ def show_invoice_list(n_clicks):
     Input('register-btn', 'n_clicks'),
     [State('plate-number', 'value'), State('driver-name', 'value'), State('driver-id', 'value'),
      State('driver-nationality', 'value'),
-     State('upload-passport-image', 'contents'), State('upload-passport-image', 'filename'),
+     State('passport-upload', 'data'),
      State('company-name', 'value'), State('company-till', 'value'), State('invoice-number', 'value'),
      State('amount-paid', 'value'), State('origin', 'value'), State('destination', 'value'),
      State('fuel-volume', 'value')],
     prevent_initial_call=True
 )
-def register_vehicle(n, plate, name, drv_id, nat, pass_cont, pass_fname, co_name, co_till, inv_num, amt_paid, origin,
+def register_vehicle(n, plate, name, drv_id, nat, pass_upload, co_name, co_till, inv_num, amt_paid, origin,
                      dest, vol):
-    if not all([plate, name, drv_id, nat, pass_cont, co_name, co_till, inv_num, amt_paid, origin, dest, vol]):
+    if not all([plate, name, drv_id, nat, pass_upload, co_name, co_till, inv_num, amt_paid, origin, dest, vol]):
         return dbc.Alert("Please fill all fields and upload passport image.", color="danger")
+    if not pass_upload.get('handle'):
+        return dbc.Alert(pass_upload.get('error') or "Passport image is still uploading, please wait.", color="danger")
     if origin == dest: return dbc.Alert("Departure and Destination cannot be the same.", color="danger")
 
-    with sqlite3.connect(DB_FILE) as conn:
-        payment = conn.execute("SELECT amount_paid FROM payment_validation WHERE invoice_number = ?",
-                               (inv_num,)).fetchone()
+    with db_pool.connection() as conn:
+        payment = conn.execute(queries.PAYMENT_FOR_INVOICE, (inv_num,)).fetchone()
         if not payment or abs(payment[0] - float(amt_paid)) > 0.01:
             return dbc.Alert("Payment validation failed. Check invoice number and amount.", color="danger")
 
-    pass_path = None
-    if pass_cont:
-        try:
-            pass_dir = os.path.join('assets', 'passports')
-            if not os.path.exists(pass_dir): os.makedirs(pass_dir)
-            pass_path = os.path.join(pass_dir,
-                                     f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{os.path.basename(pass_fname)}")
-            with open(pass_path, 'wb') as f:
-                f.write(base64.b64decode(pass_cont.split(',')[1]))
-        except Exception as e:
-            return dbc.Alert(f"Error saving passport image: {e}", color="danger")
+    pass_src = upload_store.path(pass_upload['handle'])
+    if not pass_src:
+        return dbc.Alert("Passport upload has expired, please upload the image again.", color="danger")
 
-    with sqlite3.connect(DB_FILE) as conn:
+    with db_pool.connection() as conn:
         try:
+            pass_digest, pass_path = blob_store.add(conn, pass_src)
             h = generate_unique_hash(f"{plate}{name}{datetime.now()}")
             params = (
             plate.upper(), name, drv_id, nat, pass_path, co_name, co_till, inv_num, amt_paid, origin, dest, vol,
             datetime.now(), 'in_transit', h)
-            conn.execute('''INSERT INTO vehicles (plate_number, driver_name, driver_id, driver_nationality, driver_passport_image_path,
-                            company_name, company_till_number, invoice_number, amount_paid, origin, destination, fuel_volume, created_at, status, unique_hash)
-                            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)''', params)
+            cursor = conn.execute(queries.INSERT_VEHICLE, params)
+            ChangeFeed.record(conn, 'journey_registered', cursor.lastrowid)
+            trip = conn.execute(queries.TRUCK_TRIP_COUNT, (cursor.lastrowid,)).fetchone()[0]
             conn.commit()
+            blob_store.move_in(pass_src, pass_digest)
+            dashboard_cache.invalidate()
+            change_feed.notify()
             return dbc.Alert(html.Div([
-                html.Strong("Success! Vehicle Registered."),
+                html.Strong(f"Success! Vehicle Registered (trip {trip} for {plate.upper()})."),
                 html.P(f"Genesis Hash: {h}", className="small text-muted", style={'wordBreak': 'break-all'})
             ]), color="success")
         except sqlite3.IntegrityError:
+            conn.rollback()
             return dbc.Alert(f"Plate '{plate.upper()}' has an active journey.", color="danger")
         except Exception as e:
+            conn.rollback()
             return dbc.Alert(f"Database error: {e}", color="danger")
 
 
@@ -877,18 +941,15 @@ def register_vehicle(n, plate, name, drv_id, nat, pass_cont, pass_fname, co_name
 )
 def update_officer_options(loc):
     if not loc: return []
-    return [{'label': f"{r['name']} ({r['badge_number']})", 'value': r['name']} for _, r in
-            get_officers_by_checkpoint(loc).iterrows()]
+    return [{'label': f"{name} ({badge})", 'value': name} for name, badge in get_officers_by_checkpoint(loc)]
 
 
 @app.callback(
     Output('output-checkpoint-image-upload', 'children'),
-    Input('upload-checkpoint-image', 'contents'),
-    State('upload-checkpoint-image', 'filename')
+    Input('checkpoint-upload', 'data')
 )
-def update_checkpoint_image_output(contents, filename):
-    if contents:
-        return html.Div([html.Img(src=contents, style={'height': '100px'}), html.P(filename, className="small")])
+def update_checkpoint_image_output(upload):
+    return _upload_preview(upload)
 
 
 @app.callback(
@@ -897,68 +958,151 @@ def update_checkpoint_image_output(contents, filename):
 )
 def update_last_reading_info(plate):
     if not plate: return [html.Strong("Enter vehicle plate number.")]
-    with sqlite3.connect(DB_FILE) as conn:
-        v = conn.execute("SELECT id, fuel_volume FROM vehicles WHERE plate_number = ? AND status = 'in_transit'",
-                         (plate.upper(),)).fetchone()
-        if not v: return dbc.Alert(f"No active journey for '{plate.upper()}'.", color="warning")
-        v_id, init_fuel = v
-        cp = conn.execute(
-            "SELECT checkpoint_name, timestamp, fuel_volume_check FROM checkpoints WHERE vehicle_id = ? ORDER BY timestamp DESC LIMIT 1",
-            (v_id,)).fetchone()
-        if cp:
-            ts = pd.to_datetime(cp[1]).strftime('%Y-%m-%d %H:%M')
-            return [html.P(f"Last stop: {cp[0]} at {ts}"), html.H6(f"Last Fuel: {cp[2]:,.0f} L")]
-        else:
-            return [html.P("First checkpoint for this journey."), html.H6(f"Initial Fuel: {init_fuel:,.0f} L")]
+    journey = plate_index.lookup(plate)
+    if not journey: return dbc.Alert(f"No active journey for '{plate.upper()}'.", color="warning")
+    if journey['last_stop'] is not None:
+        ts = pd.to_datetime(journey['last_time']).strftime('%Y-%m-%d %H:%M')
+        return [html.P(f"Last stop: {journey['last_stop']} at {ts}"), html.H6(f"Last Fuel: {journey['last_fuel']:,.0f} L")]
+    else:
+        return [html.P("First checkpoint for this journey."),
+                html.H6(f"Initial Fuel: {journey['initial_fuel']:,.0f} L")]
 
 
-def _submit_checkpoint_to_db(data):
-    """Saves checkpoint image, then inserts the log into the database."""
-    image_path = None
-    if data.get('img_content'):
-        try:
-            content_type, content_string = data['img_content'].split(',')
-            decoded = base64.b64decode(content_string)
-            evidence_dir = os.path.join('assets', 'checkpoint_evidence')
-            if not os.path.exists(evidence_dir):
-                os.makedirs(evidence_dir)
-            img_filename = f"evidence_{data['plate'].upper().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d%H%M%S')}.PNG"
-            image_path = os.path.join(evidence_dir, img_filename)
-            with open(image_path, 'wb') as f:
-                f.write(decoded)
-        except Exception as e:
-            print(f"Error saving checkpoint image: {e}")
-            image_path = None
-
+@app.callback(
+    Output('active-plates', 'children'),
+    Input('cp-plate-number', 'value')
+)
+def suggest_active_plates(prefix):
+    """Fills the plate box's suggestion list with active plates starting with what has been typed."""
+    return [html.Option(value=plate) for plate in plate_index.complete(prefix)]
+
+
+def _checkpoint_entry(data):
+    """The ledger entry for a submitted checkpoint, with the digest and blob path of its image if it has one.
+
+    An image that has expired or cannot be read puts an 'error' on the entry,
+    so the checkpoint is rejected instead of being logged without its
+    evidence; 'retry' is set when reading the image failed.
+    """
+    entry = {name: data.get(name) for name in ('plate', 'loc', 'officer', 'fuel', 'notes')}
+    if not data.get('img_handle'):
+        return entry
+    image_src = upload_store.path(data['img_handle'])
+    if not image_src:
+        entry['error'] = "The image upload has expired or is unknown. Please attach the photo again."
+        return entry
+    try:
+        entry['image_sha256'], entry['image_path'] = blob_store.locate(image_src)
+    except OSError:
+        entry['error'], entry['retry'] = "The image could not be read. Please submit the checkpoint again.", True
+        return entry
+    entry['image_src'] = image_src
+    return entry
+
+
+def _reference_checkpoint_images(conn, entries, results):
+    """References the images of the checkpoints that were created, in conn's transaction."""
+    for entry, result in zip(entries, results):
+        if result['status'] == 'created' and entry.get('image_src'):
+            blob_store.add(conn, entry['image_src'], entry['image_sha256'])
+
+
+def _move_in_checkpoint_images(entries, results):
+    """Moves the images of committed checkpoints into the blob store; rejected entries keep their upload."""
+    for entry, result in zip(entries, results):
+        if result['status'] == 'created' and entry.get('image_src'):
+            blob_store.move_in(entry['image_src'], entry['image_sha256'])
+
+
+def _checkpoints_logged(conn, results):
+    """Follow-up after checkpoints were committed: pre-renders completed journeys' reports and pushes the change."""
+    for result in results:
+        # Completed journeys no longer change, so their report can be rendered ahead of the first download.
+        if result['status'] == 'created' and result['completed']: report_service.request(conn, result['journey_id'])
+    if any(result['status'] == 'created' for result in results):
+        dashboard_cache.invalidate()
+        change_feed.notify()
+
+
+def _append_checkpoint(data, submission=None):
+    """Appends the log to the journey's chain with its image reference in one transaction, then moves the image in.
+
+    submission is (idempotency_key, device_id, device_seq, captured_at) for
+    entries synced from the offline queue and is recorded with the
+    checkpoint. Returns a dict whose 'color' is 'info' or 'success' when the
+    checkpoint was written and 'danger' otherwise; 'retry' is set when the
+    failure was in the database or in reading the image rather than in the
+    entry.
+    """
+    entry = _checkpoint_entry(data)
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            c = conn.cursor()
-            v = c.execute(
-                "SELECT id, destination, unique_hash FROM vehicles WHERE plate_number = ? AND status = 'in_transit'",
-                (data['plate'].upper(),)).fetchone()
-            if not v: return dbc.Alert("Vehicle not found or not in transit.", color="danger")
-            v_id, dest, g_hash = v
-            last_cp = c.execute(
-                "SELECT signature_hash FROM checkpoints WHERE vehicle_id = ? ORDER BY timestamp DESC LIMIT 1",
-                (v_id,)).fetchone()
-            p_hash = last_cp[0] if last_cp else g_hash
-            ts = datetime.now()
-            s_hash = generate_unique_hash(
-                f"{v_id}{data['loc']}{data['officer']}{ts}{data['fuel']}{data['notes']}{image_path or ''}{p_hash}")
-            c.execute(
-                'INSERT INTO checkpoints (vehicle_id, checkpoint_name, officer_name, timestamp, fuel_volume_check, notes, image_path, previous_hash, signature_hash) VALUES (?,?,?,?,?,?,?,?,?)',
-                (v_id, data['loc'], data['officer'], ts, data['fuel'], data['notes'], image_path, p_hash, s_hash))
-            msg, color = (f"Journey continues for {data['plate'].upper()}.", "info")
-            if data['loc'] == dest:
-                c.execute("UPDATE vehicles SET status = 'completed' WHERE id = ?", (v_id,));
-                msg, color = "Final destination reached. Journey COMPLETED.", "success"
+        with db_pool.connection() as conn:
+            begin_immediate(conn)
+            result, = append_checkpoints(conn, [entry])
+            if result['status'] == 'rejected':
+                conn.rollback()
+                return {'color': "danger", 'message': result['error'], 'retry': entry.get('retry', False)}
+            _reference_checkpoint_images(conn, [entry], [result])
+            if submission:
+                key, device_id, device_seq, captured_at = submission
+                conn.execute(queries.INSERT_SUBMISSION, (key, device_id, device_seq, result['checkpoint_id'],
+                                                         result['hash'], captured_at, datetime.now()))
             conn.commit()
-        return dbc.Alert(html.Div([
-            html.Strong(msg),
-            html.P(f"Checkpoint Hash: {s_hash}", className="small text-muted mt-2", style={'wordBreak': 'break-all'})
-        ]), color=color)
+            _move_in_checkpoint_images([entry], [result])
+            _checkpoints_logged(conn, [result])
+        if result['completed']: return {'color': "success", 'message': "Final destination reached. Journey COMPLETED.",
+                                        'hash': result['hash']}
+        return {'color': "info", 'message': f"Journey continues for {data['plate'].upper()}.", 'hash': result['hash']}
     except Exception as e:
-        return dbc.Alert(f"Database error: {e}", color="danger")
+        return {'color': "danger", 'message': f"Database error: {e}", 'retry': True}
+
+
+def _submit_checkpoint_to_db(data):
+    result = _append_checkpoint(data)
+    if result['color'] == "danger": return dbc.Alert(result['message'], color="danger")
+    return dbc.Alert(html.Div([
+        html.Strong(result['message']),
+        html.P(f"Checkpoint Hash: {result['hash']}", className="small text-muted mt-2", style={'wordBreak': 'break-all'})
+    ]), color=result['color'])
+
+
+def _sync_checkpoint(device_id, item):
+    """Applies one offline entry unless its key was applied before. Returns its result for the sync response."""
+    key = item.get('key')
+    result = {'key': key, 'seq': item['seq']}
+    if not isinstance(key, str) or not 0 < len(key) <= 64 or not isinstance(item.get('plate'), str):
+        return dict(result, status='rejected', message="Every entry needs a key and a plate.")
+
+    def applied_before():
+        with db_pool.connection() as conn:
+            return conn.execute(queries.SUBMISSION_BY_KEY, (key,)).fetchone()
+
+    prior = applied_before()
+    if prior: return dict(result, status='duplicate', checkpoint_id=prior[0], hash=prior[1])
+    with db_pool.connection() as conn:
+        last_seq = conn.execute(queries.LAST_DEVICE_SEQ, (device_id,)).fetchone()[0]
+    if last_seq is not None and item['seq'] <= last_seq:
+        return dict(result, status='rejected', message=f"Out of order: this device already synced entry {last_seq}.")
+
+    data = {'plate': item['plate'], 'fuel': item.get('fuel'), 'loc': item.get('loc'), 'officer': item.get('officer'),
+            'notes': item.get('notes'), 'img_handle': item.get('img_handle')}
+    outcome = _append_checkpoint(data, (key, device_id, item['seq'], item.get('captured_at')))
+    if outcome['color'] != "danger":
+        return dict(result, status='applied', message=outcome['message'], hash=outcome['hash'])
+    # A concurrent retry of the same entry may have won the race for the key.
+    prior = applied_before()
+    if prior: return dict(result, status='duplicate', checkpoint_id=prior[0], hash=prior[1])
+    return dict(result, status='retry' if outcome.get('retry') else 'rejected', message=outcome['message'])
+
+
+# Online submissions go straight to the server callback; offline ones are queued on the device.
+app.clientside_callback(
+    ClientsideFunction(namespace='offline', function_name='routeCheckpoint'),
+    [Output('checkpoint-submit', 'data'), Output('checkpoint-output', 'children', allow_duplicate=True)],
+    Input('checkpoint-btn', 'n_clicks'),
+    [State('cp-plate-number', 'value'), State('fuel-check', 'value'), State('checkpoint-location', 'value'),
+     State('officer-select', 'value'), State('checkpoint-notes', 'value'), State('checkpoint-upload', 'data')],
+    prevent_initial_call=True)
 
 
 @app.callback(
@@ -967,26 +1111,26 @@ def _submit_checkpoint_to_db(data):
      Output('confirm-modal-body', 'children'),
      Output('checkpoint-data-store', 'data'),
      Output('url', 'href', allow_duplicate=True)],
-    Input('checkpoint-btn', 'n_clicks'),
+    Input('checkpoint-submit', 'data'),
     [State('cp-plate-number', 'value'), State('fuel-check', 'value'), State('checkpoint-location', 'value'),
      State('officer-select', 'value'), State('checkpoint-notes', 'value'),
-     State('upload-checkpoint-image', 'contents')],
+     State('checkpoint-upload', 'data')],
     prevent_initial_call=True)
-def handle_initial_submit(n, plate, fuel, loc, officer, notes, img_content):
+def handle_initial_submit(n, plate, fuel, loc, officer, notes, img_upload):
     if not all([plate, fuel, loc, officer]):
         return dbc.Alert("Please fill all required fields: Plate Number, Fuel Check, Location, and Officer.",
                          color="warning"), False, "", None, dash.no_update
+    if img_upload and not img_upload.get('handle') and not img_upload.get('error'):
+        return dbc.Alert("Image evidence is still uploading, please wait.", color="warning"), False, "", None, \
+            dash.no_update
 
-    with sqlite3.connect(DB_FILE) as conn:
-        v = conn.execute("SELECT id, fuel_volume FROM vehicles WHERE plate_number = ? AND status = 'in_transit'",
-                         (plate.upper(),)).fetchone()
+    with db_pool.connection() as conn:
+        v = conn.execute(queries.ACTIVE_JOURNEY_FUEL, (plate.upper(),)).fetchone()
         if not v:
             return dbc.Alert(f"Vehicle '{plate.upper()}' not found or journey is not active.",
                              color="warning"), False, "", None, dash.no_update
         last_fuel = v[1]
-        cp = conn.execute(
-            "SELECT fuel_volume_check FROM checkpoints WHERE vehicle_id = ? ORDER BY timestamp DESC LIMIT 1",
-            (v[0],)).fetchone()
+        cp = conn.execute(queries.LAST_CHECKPOINT_FUEL, (v[0],)).fetchone()
         if cp: last_fuel = cp[0]
 
     try:
@@ -996,11 +1140,11 @@ def handle_initial_submit(n, plate, fuel, loc, officer, notes, img_content):
 
     discrepancy = last_fuel - fuel_float
     data_to_store = {'plate': plate, 'fuel': fuel_float, 'loc': loc, 'officer': officer, 'notes': notes,
-                     'img_content': img_content}
+                     'img_handle': (img_upload or {}).get('handle')}
 
     refresh_url = f'/checkpoint?refresh={datetime.now().timestamp()}'
 
-    if discrepancy < -200 or discrepancy > 1500:
+    if classify_discrepancy(discrepancy) in CONFIRMATION_SEVERITIES:
         modal_body = html.Div([
             dbc.Row(
                 [dbc.Col(html.Strong("Last Recorded Fuel:")), dbc.Col(f"{last_fuel:,.1f} L", className="text-end")]),
@@ -1048,43 +1192,94 @@ def close_confirmation_modal(n):
 
 
 # Route Monitor Callbacks
+MONITOR_PAGE_SIZE = 20
+
+
+def _evidence_thumbnail(image_path):
+    """Small evidence preview linking to the full image; both are served from the assets folder."""
+    if not os.path.exists(image_path): return None
+    asset_url = lambda path: app.get_asset_url(os.path.relpath(path, 'assets').replace(os.sep, '/'))
+    return html.A(html.Img(src=asset_url(variant_path(image_path, 'thumb')), className="rounded float-end",
+                           style={'height': '48px'}), href=asset_url(image_path), target="_blank")
+
+
+MONITOR_SEVERITY_BADGES = {
+    'increase': ("warning", "Anomaly: Fuel volume INCREASED. Indicates potential measurement error or adulteration of fuel (e.g., adding water)."),
+    'critical': ("danger", "Critical Warning: Significant fuel loss detected. Indicates a potential major leak or large-scale siphoning."),
+    'suspicious': ("warning", "Suspicious Loss: Fuel loss is higher than expected for transit. Monitor this pattern as it could indicate systematic skimming."),
+    'normal': ("secondary", "Normal variance: Represents expected fuel consumption."),
+}
+
+
 @app.callback(
-    Output('route-monitoring-content', 'children'),
-    [Input('monitor-interval', 'n_intervals'), Input('status-filter', 'value')]
+    [Output('route-monitoring-content', 'children'), Output('monitor-newer', 'disabled'),
+     Output('monitor-older', 'disabled'), Output('monitor-page-ids', 'data'), Output('monitor-cursors', 'data')],
+    [Input('monitor-interval', 'n_intervals'), Input('status-filter', 'value'), Input('monitor-newer', 'n_clicks'),
+     Input('monitor-older', 'n_clicks'), Input('live-event', 'data')],
+    [State('monitor-page-ids', 'data'), State('monitor-cursors', 'data')]
 )
-def update_route_monitoring(n, status_filter):
-    with sqlite3.connect(DB_FILE) as conn:
-        df = pd.read_sql_query('SELECT * FROM vehicles', conn, parse_dates=['created_at'])
-    df['calculated_status'] = df.apply(
-        lambda r: 'overdue' if r['status'] == 'in_transit' and r['created_at'].to_pydatetime() < (
-                    datetime.now() - timedelta(days=3)) else r['status'], axis=1)
-    if status_filter != 'all': df = df[df['calculated_status'] == status_filter]
-    if df.empty: return dbc.Alert("No vehicles match filter.", color="info", className="mt-4")
-
-    cards = []
-    for _, v in df.sort_values(by='created_at', ascending=False).iterrows():
-        with sqlite3.connect(DB_FILE) as conn:
-            cp_df = pd.read_sql_query('SELECT * FROM checkpoints WHERE vehicle_id = ? ORDER BY timestamp', conn,
-                                      params=[v['id']])
+def update_route_monitoring(n, status_filter, n_newer, n_older, event, page_ids, cursors):
+    """Renders one page of journeys, newest first.
+
+    Pages are read past the (created_at, id) of the last journey on the
+    previous one, and cursors holds the cursor of every page up to the one on
+    screen plus that of the next, so paging costs the same at any depth.
+    """
+    topic = _live_event_topic(event)
+    # Checkpoints on journeys that are not on screen do not change this page.
+    if topic in ('checkpoint_logged', 'journey_completed') and event.get('vehicle_id') not in (page_ids or []):
+        raise PreventUpdate
+    if status_filter not in queries.MONITOR_FILTERS: status_filter = 'all'
+    stack, older = (cursors or {}).get('stack') or [None], (cursors or {}).get('next')
+    trigger = dash.ctx.triggered_id
+    if trigger == 'status-filter':
+        stack = [None]
+    elif trigger == 'monitor-older':
+        if not older: raise PreventUpdate
+        stack = stack + [older]
+    elif trigger == 'monitor-newer':
+        stack = stack[:-1] or [None]
+    now = datetime.now()
+    with db_pool.connection() as conn:
+        counts, threshold = monitor_counts(conn, now)
+        while True:
+            before = stack[-1] or ('9999-12-31', 0)
+            rows = pd.read_sql_query(queries.MONITOR_PAGE[status_filter], conn, params={
+                'overdue_threshold': threshold, 'before_ts': before[0], 'before_id': before[1],
+                'limit': MONITOR_PAGE_SIZE + 1})
+            # The journeys of this page may have been archived meanwhile; start over from the newest.
+            if not rows.empty or len(stack) == 1: break
+            stack = [None]
+    if rows.empty: return dbc.Alert("No vehicles match filter.", color="info", className="mt-4"), True, True, [], None
+
+    # One journey past the page is read to tell whether there is an older page.
+    page = rows['id'].drop_duplicates()
+    older = None
+    if len(page) > MONITOR_PAGE_SIZE:
+        rows = rows[rows['id'].isin(page.iloc[:MONITOR_PAGE_SIZE])]
+        last = rows.iloc[-1]
+        older = (last['created_at'], int(last['id']))
+    rows = rows.assign(created_at=pd.to_datetime(rows['created_at'], format='ISO8601'))
+    df = rows.drop_duplicates('id').copy()
+    df['calculated_status'] = derive_status(df['status'], df['created_at'], now)
+    cp_rows = rows.dropna(subset=['checkpoint_id'])
+    cp_rows = checkpoint_deltas(cp_rows, cp_rows['fuel_volume'], journey_col='id')
+    checkpoints_by_vehicle = {v_id: cp_df for v_id, cp_df in cp_rows.groupby('id', sort=False)}
+
+    first = (len(stack) - 1) * MONITOR_PAGE_SIZE + 1
+    cards = [html.P(f"Showing {first}-{first + len(df) - 1} of {counts[status_filter]} journeys",
+                    className="text-muted")]
+    for _, v in df.iterrows():
+        cp_df = checkpoints_by_vehicle.get(v['id'], cp_rows.iloc[0:0])
         timeline = [dbc.ListGroupItem([html.Strong("Departure:"), f" {v['origin']} at {v['created_at']:%Y-%m-%d %H:%M}",
                                        html.Small(f" | Initial Fuel: {v['fuel_volume']:,.0f}L",
                                                   className="text-muted ms-2")])]
-        last_fuel = v['fuel_volume']
         for i_cp, cp in cp_df.iterrows():
-            discrepancy = last_fuel - cp['fuel_volume_check']
-            last_fuel = cp['fuel_volume_check']
-            if discrepancy < -50:
-                color, tooltip_text = "warning", "Anomaly: Fuel volume INCREASED. Indicates potential measurement error or adulteration of fuel (e.g., adding water)."
-            elif discrepancy > 1000:
-                color, tooltip_text = "danger", "Critical Warning: Significant fuel loss detected. Indicates a potential major leak or large-scale siphoning."
-            elif 250 < discrepancy <= 1000:
-                color, tooltip_text = "warning", "Suspicious Loss: Fuel loss is higher than expected for transit. Monitor this pattern as it could indicate systematic skimming."
-            else:
-                color, tooltip_text = "secondary", "Normal variance: Represents expected fuel consumption."
-
-            discrepancy_display = dbc.Badge(f"Δ: {discrepancy:,.0f}L", color=color, className="ms-2")
+            color, tooltip_text = MONITOR_SEVERITY_BADGES[cp['severity']]
+            discrepancy_display = dbc.Badge(f"Δ: {cp['discrepancy']:,.0f}L", color=color, className="ms-2")
             tooltip_id = f"tip-{v['id']}-{i_cp}"
-            timeline.append(dbc.ListGroupItem([html.Strong(f"✅ {cp['checkpoint_name']}"), html.Br(), html.Span(
+            evidence = _evidence_thumbnail(cp['image_path']) if pd.notna(cp['image_path']) else None
+            timeline.append(dbc.ListGroupItem([html.Strong(f"✅ {cp['checkpoint_name']}"), evidence, html.Br(), html.Span(
                 [html.Small(f"Fuel: {cp['fuel_volume_check']:,.0f}L", className="text-muted"),
                  html.Span(discrepancy_display, id=tooltip_id)]),
                                                dbc.Tooltip(tooltip_text, target=tooltip_id, placement="right")]))
@@ -1099,23 +1294,34 @@ def update_route_monitoring(n, status_filter):
             html.H6(f"{v['origin']} ➔ {v['destination']}", className="card-subtitle mb-2 text-muted"), html.Hr(),
             dbc.ListGroup(timeline, flush=True)
         ]), className="mb-3 shadow-sm"))
-    return cards
+    return (cards, len(stack) == 1, older is None, [int(v_id) for v_id in df['id']],
+            {'stack': stack, 'next': older})
 
 
 # Receipt/Report Callbacks
 @app.callback(
-    Output('journey-select', 'options'),
-    Input('url', 'pathname')
+    [Output('journey-select', 'options'), Output('picker-cursor', 'data'), Output('picker-more', 'disabled')],
+    [Input('url', 'pathname'), Input('journey-select', 'search_value'), Input('picker-dates', 'start_date'),
+     Input('picker-dates', 'end_date'), Input('picker-company', 'value'), Input('picker-destination', 'value'),
+     Input('picker-more', 'n_clicks')],
+    [State('journey-select', 'value'), State('journey-select', 'options'), State('picker-cursor', 'data')]
 )
-def update_journey_dropdown(pn):
+def update_journey_dropdown(pn, plate, start, end, company, destination, n_more, selected, options, cursor):
+    """Fetches the first page of matching journeys as the auditor types or filters, and older pages on request."""
     if pn != '/receipt': raise PreventUpdate
-    with sqlite3.connect(DB_FILE) as conn:
-        df = pd.read_sql_query(
-            "SELECT id, plate_number, destination, created_at FROM vehicles WHERE status = 'completed' ORDER BY created_at DESC",
-            conn)
-    return [{
-                'label': f"{r['plate_number']} to {r['destination']} on {pd.to_datetime(r['created_at']).strftime('%Y-%m-%d')}",
-                'value': r['id']} for _, r in df.iterrows()]
+    more = dash.ctx.triggered_id == 'picker-more'
+    if more and not cursor: raise PreventUpdate
+    until = (pd.to_datetime(end) + timedelta(days=1)).strftime('%Y-%m-%d') if end else None
+    with db_pool.connection() as conn:
+        journeys, cursor = repository.journey_page(conn, plate, company, destination, start and start[:10], until,
+                                                   after=cursor if more else None)
+    page = [{'label': f"{j.plate_number} to {j.destination} on {j.created_at[:10]}", 'value': j.id} for j in journeys]
+    if more:
+        page = options + page
+    elif selected is not None and all(o['value'] != selected for o in page):
+        # Keeps the chosen journey selectable when a new search no longer lists it.
+        page = [o for o in options or [] if o['value'] == selected] + page
+    return page, cursor, cursor is None
 
 
 @app.callback(
@@ -1129,28 +1335,155 @@ def generate_receipt_view(j_id):
 
 
 @app.callback(
-    Output("download-pdf-component", "data"),
-    Input("download-pdf-btn", "n_clicks"),
-    State("journey-select", "value"),
+    [Output("download-pdf-component", "data"), Output('report-job', 'data'), Output('report-poll', 'disabled'),
+     Output('report-status', 'children')],
+    [Input("download-pdf-btn", "n_clicks"), Input('report-poll', 'n_intervals')],
+    [State("journey-select", "value"), State('report-job', 'data')],
     prevent_initial_call=True
 )
-def download_pdf_report(n, j_id):
+def download_pdf_report(n, n_polls, j_id, job):
+    """Requests the report and polls until the render pool has produced it."""
+    if dash.ctx.triggered_id == 'report-poll':
+        if not job: return dash.no_update, None, True, dash.no_update
+        j_id = job['journey_id']
     if not j_id: raise PreventUpdate
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            plate = pd.read_sql_query("SELECT plate_number FROM vehicles WHERE id = ?", conn, params=[j_id]).iloc[0][
-                'plate_number']
-
-        pdf_bytes = create_journey_pdf(j_id)
-        if pdf_bytes is None:
-            print(f"Failed to generate PDF for journey ID {j_id}. Check logs for errors.")
-            raise PreventUpdate
-
-        filename = f"Report-{plate}-{datetime.now():%Y%m%d}.pdf"
-        return dcc.send_bytes(pdf_bytes, filename)
+        with db_pool.connection() as conn:
+            job = report_service.request(conn, j_id)
     except Exception as e:
         print(f"Error in download_pdf_report callback: {e}")
-        raise PreventUpdate
+        return dash.no_update, None, True, dbc.Alert("The report could not be generated.", color="danger")
+
+    if job['state'] == 'rendering':
+        return dash.no_update, job, False, html.Span([dbc.Spinner(size="sm"), " Rendering report..."],
+                                                      className="text-muted")
+    if job['state'] == 'failed':
+        print(f"Failed to generate PDF for journey ID {j_id}: {job['error']}")
+        return dash.no_update, None, True, dbc.Alert("The report could not be generated.", color="danger")
+    filename = f"Report-{job['plate']}-{datetime.now():%Y%m%d}.pdf"
+    return dcc.send_file(job['path'], filename=filename), None, True, None
+
+
+@app.callback(
+    [Output('export-company', 'options'), Output('picker-company', 'options')],
+    Input('url', 'pathname')
+)
+def update_export_companies(pn):
+    if pn != '/receipt': raise PreventUpdate
+    with db_pool.connection() as conn:
+        companies = [r[0] for r in conn.execute(queries.COMPANY_NAMES).fetchall() if r[0]]
+    return companies, companies
+
+
+@app.callback(
+    [Output('export-link', 'children'), Output('export-id', 'data'), Output('export-poll', 'disabled'),
+     Output('export-progress', 'children', allow_duplicate=True)],
+    Input('export-btn', 'n_clicks'),
+    [State('export-dates', 'start_date'), State('export-dates', 'end_date'), State('export-company', 'value'),
+     State('export-destination', 'value')],
+    prevent_initial_call=True
+)
+def prepare_export(n, start, end, company, destination):
+    if not start or not end:
+        return dbc.Alert("Select the dispatch date range to export.", color="warning"), None, True, None
+    filters = {'start': start[:10], 'end': (pd.to_datetime(end) + timedelta(days=1)).strftime('%Y-%m-%d'),
+               'company': company, 'destination': destination}
+    with db_pool.connection() as conn:
+        total = len(_export_journeys(conn, filters))
+    if not total:
+        return dbc.Alert("No completed journeys match these filters.", color="info"), None, True, None
+    export_id = report_service.create_export(filters, total)
+    link = html.A(dbc.Button(html.Span([html.I(className="fas fa-download me-2"), f"Download ZIP ({total} reports)"]),
+                             color="primary", size="lg"), href=f"/exports/{export_id}.zip")
+    return link, export_id, False, None
+
+
+@app.callback(
+    [Output('export-progress', 'children', allow_duplicate=True), Output('export-poll', 'disabled', allow_duplicate=True)],
+    Input('export-poll', 'n_intervals'),
+    State('export-id', 'data'),
+    prevent_initial_call=True
+)
+def update_export_progress(n, export_id):
+    export = report_service.load_export(export_id)
+    if export is None: return None, True
+    if export['state'] == 'pending': return html.P("Waiting for the download to start...", className="text-muted"), False
+    done, total = export['done'], export['total']
+    stats = (f"{done} of {total} reports · {export['failed']} failed · {export['reports_per_s']} reports/s · "
+             f"{export['mb_per_s']} MB/s · {export['bytes'] / 1e6:,.1f} MB")
+    finished = export['state'] in ('done', 'aborted')
+    color = {'done': 'success', 'aborted': 'danger'}.get(export['state'], 'primary')
+    return html.Div([dbc.Progress(value=100 * done / max(total, 1), color=color, striped=not finished,
+                                  animated=not finished),
+                     html.Small(stats if export['state'] != 'aborted' else f"Download interrupted. {stats}",
+                                className="text-muted")]), finished
+
+
+# Integrity Callbacks
+@app.callback(
+    [Output('integrity-content', 'children'), Output('integrity-poll', 'disabled')],
+    [Input('url', 'pathname'), Input('verify-btn', 'n_clicks'), Input('verify-full-btn', 'n_clicks'),
+     Input('rollup-btn', 'n_clicks'), Input('integrity-poll', 'n_intervals')]
+)
+def update_integrity_view(pn, n, n_full, n_rollup, n_polls):
+    """Starts verifications and roll-ups in the background and polls the page until they finish."""
+    if pn != '/integrity': raise PreventUpdate
+    verification_started = rollup_started = None
+    if dash.ctx.triggered_id in ('verify-btn', 'verify-full-btn'):
+        verification_started = _start_verification(full=dash.ctx.triggered_id == 'verify-full-btn')
+    if dash.ctx.triggered_id == 'rollup-btn':
+        rollup_started = _start_rollup()
+    job = dict(_verification)
+    run, archived = job.get('run'), job.get('archived')
+    with db_pool.connection() as conn:
+        verified, broken_count, last_run = conn.execute(queries.WATERMARK_SUMMARY).fetchone()
+        broken = pd.read_sql_query(queries.BROKEN_CHAINS, conn)
+        rollups = pd.read_sql_query(queries.RECENT_ROLLUPS, conn, params=[7])
+
+    content = []
+    if verification_started is False:
+        content.append(dbc.Alert("A verification is already running.", color="info"))
+    if job.get('state') == 'running':
+        content.append(dbc.Alert([dbc.Spinner(size="sm"), f" {'Full audit' if job['full'] else 'Verification'} "
+                                  f"running since {job['started_at']:%H:%M:%S}..."], color="info"))
+    elif job.get('state') == 'failed':
+        content.append(dbc.Alert(f"The verification failed: {job['error']}", color="danger"))
+    if run:
+        content.append(dbc.Alert(f"Checked {run['rows']:,} entries in {run['journeys']:,} journeys in {run['elapsed']}s "
+                                 f"({run['rows_per_s']:,} entries/s).",
+                                 color="danger" if run['broken'] else "success"))
+    if archived and archived['months']:
+        content.append(dbc.Alert([html.Div(f"Checked {archived['rows']:,} archived entries in {archived['journeys']:,} "
+                                           f"journeys across {archived['months']} month files."),
+                                  *[html.Div(f"Archived journey {b['vehicle_id']}: {b['reason']}")
+                                    for b in archived['broken']]],
+                                 color="danger" if archived['broken'] else "success"))
+    if _rollup_lock.locked():
+        content.append(dbc.Alert([dbc.Spinner(size="sm"), " Building today's roll-up..."], color="info"))
+    elif rollup_started is False:
+        content.append(dbc.Alert("A roll-up is already being built.", color="info"))
+    content.append(dbc.Row([
+        dbc.Col(dbc.Card(dbc.CardBody([html.H6("Journeys Verified"), html.H3(f"{verified:,}")])), md=4),
+        dbc.Col(dbc.Card(dbc.CardBody([html.H6("Broken Chains"), html.H3(f"{broken_count:,}",
+                                                                         className="text-danger" if broken_count else "")])), md=4),
+        dbc.Col(dbc.Card(dbc.CardBody([html.H6("Last Verification"),
+                                       html.H5(pd.to_datetime(last_run).strftime('%Y-%m-%d %H:%M') if last_run else "Never")])), md=4),
+    ], className="mb-4 text-center"))
+    if not broken.empty:
+        broken['verified_at'] = pd.to_datetime(broken['verified_at']).dt.strftime('%Y-%m-%d %H:%M')
+        content.append(dbc.Table.from_dataframe(broken.rename(columns={
+            'vehicle_id': 'Journey', 'plate_number': 'Plate', 'broken_checkpoint_id': 'Checkpoint', 'reason': 'Problem',
+            'verified_at': 'Checked'}), striped=True, bordered=True, hover=True, responsive=True, size='sm'))
+    content.append(html.H5("Daily Roll-ups", className="mt-4"))
+    if rollups.empty:
+        content.append(html.P("No roll-up has been built yet.", className="text-muted"))
+    else:
+        rollups['created_at'] = pd.to_datetime(rollups['created_at']).dt.strftime('%Y-%m-%d %H:%M')
+        rollups['root'] = rollups['root'].map(lambda root: html.Code(root, className="small"))
+        content.append(dbc.Table.from_dataframe(rollups.rename(columns={
+            'day': 'Day', 'root': 'Merkle Root', 'leaf_count': 'Leaves', 'created_at': 'Built'}),
+            striped=True, bordered=True, hover=True, responsive=True, size='sm'))
+    return content, not (_verification_lock.locked() or _rollup_lock.locked())
 
 
 # --- Main Execution Block ---
@@ -1162,4 +1495,6 @@ if __name__ == '__main__':
 
     init_database()
     seed_database()
+    with db_pool.connection() as conn:
+        print(f"INFO: Query plan audit passed for {audit_query_plans(conn)} statements.")
     app.run(debug=True, port=5112)
@@ -0,0 +1,276 @@
+"""Moves completed journeys out of the hot ledger into monthly archive files.
+
+Journeys completed and registered more than N days ago are copied, with
+their checkpoints, verification watermarks and offline submissions, into
+archive/ledger-YYYY-MM.db for the month they were registered in, and then
+deleted from the hot database. Each month file is vacuumed after a run and
+kept read-only. The hot database keeps a catalog (archived_journeys) with
+the file and the chain tip of every archived journey, and all Merkle
+roll-ups, so proofs printed on old reports stay valid.
+
+A journey is copied before it is deleted, in two transactions, because
+SQLite commits attached files one by one in WAL mode. A run interrupted
+between the two leaves the journey in both files; the hot copy wins and the
+next run finishes the move. A journey whose chain does not verify is not
+archived, so it stays on the integrity page.
+
+Reads are routed by LedgerArchive.open_journey(). It opens an archived
+journey's month file as the main database with the hot database attached:
+vehicles and checkpoints resolve to the archive and the Merkle tables to the
+hot file, so report and verification queries run unchanged.
+
+Run it from cron, e.g. nightly:
+
+    python archive.py run [--days 90] [--db FILE] [--dir DIR]
+    python archive.py verify [--db FILE] [--dir DIR]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import stat
+import sys
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import queries
+from database import CONNECTION_PRAGMAS, apply_migrations
+from integrity import verify_chain
+
+DEFAULT_DB_FILE = 'fuel_transport_ledger_v7.6_final.db'
+ARCHIVE_DIR = 'archive'
+ARCHIVE_AFTER_DAYS = 90
+BATCH_SIZE = 500
+# Tables moved with a journey, parents first, and how to select a batch's rows from the hot database.
+ARCHIVED_TABLES = (
+    ('vehicles', "id IN (SELECT value FROM json_each(?))"),
+    ('checkpoints', "vehicle_id IN (SELECT value FROM json_each(?))"),
+    ('chain_watermarks', "vehicle_id IN (SELECT value FROM json_each(?))"),
+    ('checkpoint_submissions',
+     "checkpoint_id IN (SELECT id FROM hot.checkpoints WHERE vehicle_id IN (SELECT value FROM json_each(?)))"),
+)
+
+
+class LedgerArchive:
+    """Monthly archive files of completed journeys, and routing of reads to them."""
+
+    def __init__(self, db_file, archive_dir=ARCHIVE_DIR):
+        self.db_file = db_file
+        self.archive_dir = archive_dir
+
+    def path(self, month):
+        return os.path.join(self.archive_dir, f"ledger-{month}.db")
+
+    def connect(self, month):
+        """Opens a month file read-only with the hot database attached as 'hot'."""
+        conn = sqlite3.connect(f"file:{self.path(month)}?mode=ro", uri=True)
+        conn.execute("ATTACH DATABASE ? AS hot", (f"file:{self.db_file}?mode=ro",))
+        return conn
+
+    def month_of(self, conn, journey_id):
+        """The month file holding an archived journey, or None if the journey is in the hot database."""
+        row = conn.execute(queries.ARCHIVED_JOURNEY_MONTH, (journey_id,)).fetchone()
+        return row[0] if row else None
+
+    def open_journey(self, journey_id):
+        """A read-only connection on which the journey's rows and the Merkle roll-ups can be queried."""
+        conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True)
+        month = self.month_of(conn, journey_id)
+        if month is None:
+            return conn
+        conn.close()
+        return self.connect(month)
+
+    def query(self, conn, sql, params, start, end):
+        """Runs sql against every month file holding journeys registered in [start, end); returns the rows."""
+        rows = []
+        for (month,) in conn.execute(queries.ARCHIVED_MONTHS_BETWEEN, (start, end)).fetchall():
+            with closing(self.connect(month)) as archive:
+                rows += archive.execute(sql, params).fetchall()
+        return rows
+
+    # --- archiving ---
+    def _open_month(self, month):
+        """Opens a month file for writing, creating the archived tables and any columns added since."""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = self.path(month)
+        if os.path.exists(path):
+            os.chmod(path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("ATTACH DATABASE ? AS hot", (self.db_file,))
+        for table, _ in ARCHIVED_TABLES:
+            if not conn.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                                (table,)).fetchone():
+                for (sql,) in conn.execute("SELECT sql FROM hot.sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+                                           "AND type IN ('table', 'index') ORDER BY type DESC", (table,)).fetchall():
+                    conn.execute(sql)
+                continue
+            archived = {row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")}
+            for _, name, col_type, *_ in conn.execute(f"PRAGMA hot.table_info({table})").fetchall():
+                if name not in archived:
+                    conn.execute(f"ALTER TABLE main.{table} ADD COLUMN {name} {col_type}")
+        conn.commit()
+        return conn
+
+    def _copy(self, month, ids):
+        """Copies the journeys and their rows into the month file in one transaction of that file."""
+        batch = json.dumps(ids)
+        with closing(self._open_month(month)) as conn:
+            with conn:
+                for table, where in ARCHIVED_TABLES:
+                    columns = ', '.join(row[1] for row in conn.execute(f"PRAGMA hot.table_info({table})"))
+                    conn.execute(f"INSERT OR REPLACE INTO main.{table} ({columns}) "
+                                 f"SELECT {columns} FROM hot.{table} WHERE {where}", (batch,))
+                copied = conn.execute("SELECT COUNT(*) FROM main.vehicles WHERE id IN (SELECT value FROM json_each(?))",
+                                      (batch,)).fetchone()[0]
+        if copied != len(ids):
+            raise RuntimeError(f"Only {copied} of {len(ids)} journeys reached the {month} archive.")
+
+    def _compact(self, month):
+        path = self.path(month)
+        with closing(sqlite3.connect(path)) as conn:
+            conn.execute("VACUUM")
+        os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+    def archive(self, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE, now=None):
+        """Moves completed journeys registered more than older_than_days ago into their month files.
+
+        Returns a summary with the number of journeys archived, the months
+        written and the journeys kept back because their chain is broken.
+        """
+        now = now or datetime.now()
+        cutoff = now - timedelta(days=older_than_days)
+        summary = {'archived': 0, 'months': set(), 'skipped': []}
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            for name, value in CONNECTION_PRAGMAS:
+                conn.execute(f"PRAGMA {name} = {value}")
+            # Rowids are not AUTOINCREMENT, so the newest journey and checkpoint stay to keep their ids from being reused.
+            last_journey = conn.execute(queries.LAST_JOURNEY_ID).fetchone()[0]
+            last_checkpoint = conn.execute(queries.LAST_CHECKPOINT_ID).fetchone()[0]
+            self._fill_companies(conn)
+            after = {'cutoff': cutoff, 'created_at': '', 'id': 0, 'limit': batch_size}
+            while True:
+                candidates = conn.execute(queries.ARCHIVE_CANDIDATES, after).fetchall()
+                if not candidates:
+                    break
+                after.update(id=candidates[-1][0], created_at=candidates[-1][3])
+                months = {}
+                for v_id, genesis, month, _ in candidates:
+                    if v_id == last_journey:
+                        continue
+                    rows = conn.execute(queries.CHAIN_ROWS_AFTER, (v_id, 0)).fetchall()
+                    _, tip, _, broken_id, reason = verify_chain(genesis, rows, check_blobs=False)
+                    if broken_id or any(row[0] == last_checkpoint for row in rows):
+                        if broken_id:
+                            summary['skipped'].append({'vehicle_id': v_id, 'checkpoint_id': broken_id, 'reason': reason})
+                        continue
+                    months.setdefault(month, []).append((v_id, tip))
+                for month, journeys in months.items():
+                    self._copy(month, [v_id for v_id, _ in journeys])
+                    self._forget(conn, month, journeys, now)
+                    summary['archived'] += len(journeys)
+                    summary['months'].add(month)
+                conn.commit()
+        finally:
+            conn.close()
+        for month in summary['months']:
+            self._compact(month)
+        summary['months'] = sorted(summary['months'])
+        return summary
+
+    def _fill_companies(self, conn):
+        """Copies the company of journeys archived before the catalog recorded it from their month files."""
+        missing = {}
+        for month, v_id in conn.execute(queries.ARCHIVED_WITHOUT_COMPANY).fetchall():
+            missing.setdefault(month, []).append(v_id)
+        for month, ids in missing.items():
+            if not os.path.exists(self.path(month)):
+                continue
+            with closing(sqlite3.connect(f"file:{self.path(month)}?mode=ro", uri=True)) as archive:
+                companies = archive.execute(queries.JOURNEY_COMPANIES, (json.dumps(ids),)).fetchall()
+            with conn:
+                conn.executemany(queries.SET_ARCHIVED_COMPANY, [(company, v_id) for v_id, company in companies])
+
+    @staticmethod
+    def _forget(conn, month, journeys, now):
+        """Catalogs archived journeys and deletes them from the hot database in one transaction."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(queries.INSERT_ARCHIVED_JOURNEY,
+                             [{'id': v_id, 'month': month, 'tip': tip, 'now': now} for v_id, tip in journeys])
+            ids = [(v_id,) for v_id, _ in journeys]
+            for sql in (queries.DELETE_JOURNEY_SUBMISSIONS, queries.DELETE_JOURNEY_CHECKPOINTS,
+                        queries.DELETE_JOURNEY_WATERMARK, queries.DELETE_JOURNEY):
+                conn.executemany(sql, ids)
+            # The KPI triggers count a deleted journey out of its day; archived journeys still completed that day.
+            conn.execute(queries.RECOUNT_ARCHIVED_COMPLETIONS, (json.dumps([v_id for v_id, _ in journeys]),))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    # --- verification ---
+    def verify(self, check_blobs=True):
+        """Rehashes every archived chain and checks its tip against the hot catalog. Returns a summary dict."""
+        summary = {'months': 0, 'journeys': 0, 'rows': 0, 'broken': []}
+        with closing(sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True)) as hot:
+            months = hot.execute(queries.ARCHIVED_MONTHS).fetchall()
+            for month, _ in months:
+                tips = dict(hot.execute(queries.ARCHIVED_JOURNEY_TIPS, (month,)).fetchall())
+                summary['months'] += 1
+                try:
+                    archive = self.connect(month)
+                except sqlite3.OperationalError as e:
+                    summary['broken'] += [{'vehicle_id': v_id, 'checkpoint_id': None, 'reason': f"{month} archive: {e}"}
+                                          for v_id in tips]
+                    continue
+                with closing(archive):
+                    for v_id, genesis, _, _ in archive.execute(queries.ALL_JOURNEY_GENESIS).fetchall():
+                        if v_id not in tips:
+                            continue
+                        rows = archive.execute(queries.CHAIN_ROWS_AFTER, (v_id, 0)).fetchall()
+                        _, tip, checked, broken_id, reason = verify_chain(genesis, rows, check_blobs)
+                        if not broken_id and tip != tips[v_id]:
+                            reason = "archived chain tip differs from the one recorded when it was archived"
+                        if reason:
+                            summary['broken'].append({'vehicle_id': v_id, 'checkpoint_id': broken_id, 'reason': reason})
+                        summary['journeys'] += 1
+                        summary['rows'] += checked
+                        del tips[v_id]
+                summary['broken'] += [{'vehicle_id': v_id, 'checkpoint_id': None,
+                                       'reason': f"missing from the {month} archive"} for v_id in tips]
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive completed journeys of the fuel ledger into monthly files.")
+    parser.add_argument('--db', default=DEFAULT_DB_FILE, help="ledger database file")
+    parser.add_argument('--dir', default=ARCHIVE_DIR, help="directory of the monthly archive files")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="archive completed journeys older than --days")
+    run.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help="age in days of the journeys to archive")
+    verify = commands.add_parser('verify', help="verify the hash chains of archived journeys")
+    verify.add_argument('--skip-blobs', action='store_true', help="do not rehash evidence files")
+    args = parser.parse_args(argv)
+
+    with sqlite3.connect(args.db, timeout=30) as conn:
+        apply_migrations(conn)
+    archive = LedgerArchive(args.db, args.dir)
+    if args.command == 'run':
+        summary = archive.archive(args.days)
+        print(f"Archived {summary['archived']} journeys into {len(summary['months'])} month files.")
+        for skipped in summary['skipped']:
+            print(f"KEPT journey {skipped['vehicle_id']}: checkpoint {skipped['checkpoint_id']}: {skipped['reason']}")
+        return 0
+    summary = archive.verify(check_blobs=not args.skip_blobs)
+    print(f"Verified {summary['rows']} checkpoints in {summary['journeys']} archived journeys "
+          f"across {summary['months']} month files.")
+    for broken in summary['broken']:
+        print(f"BROKEN archived journey {broken['vehicle_id']}: {broken['reason']}")
+    return 1 if summary['broken'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
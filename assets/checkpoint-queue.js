@@ -0,0 +1,156 @@
+// IndexedDB queue of checkpoint submissions captured while offline. Loaded by
+// the page and imported by the service worker, so either can replay it.
+// Entries are numbered in capture order and sent to /sync/checkpoints in
+// that order, one batch at a time; each carries an idempotency key, so a
+// batch retried after a lost response is not logged twice.
+(function (scope) {
+  const DB_NAME = 'ftl-offline';
+  const STORE = 'checkpoints';
+  const BATCH_SIZE = 20;
+  const SYNC_TAG = 'checkpoint-sync';
+
+  function request(req) {
+    return new Promise((resolve, reject) => {
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  }
+
+  function openDb() {
+    const req = scope.indexedDB.open(DB_NAME, 1);
+    req.onupgradeneeded = () => {
+      const store = req.result.createObjectStore(STORE, {keyPath: 'seq', autoIncrement: true});
+      store.createIndex('status', 'status');
+      req.result.createObjectStore('meta');
+    };
+    return request(req);
+  }
+
+  // Runs fn(store) in one transaction and resolves with the value of the request it returns.
+  function withStore(name, mode, fn) {
+    return openDb().then((db) => new Promise((resolve, reject) => {
+      const tx = db.transaction(name, mode);
+      let result;
+      request(fn(tx.objectStore(name))).then((value) => { result = value; });
+      tx.oncomplete = () => { db.close(); resolve(result); };
+      tx.onerror = tx.onabort = () => { db.close(); reject(tx.error); };
+    }));
+  }
+
+  // A random id per browser, so the server can keep each device's entries in order.
+  async function deviceId() {
+    const id = await withStore('meta', 'readonly', (meta) => meta.get('device_id'));
+    if (id) {
+      return id;
+    }
+    // add() fails if another context created the id first; that id is then read back.
+    await withStore('meta', 'readwrite', (meta) => meta.add(scope.crypto.randomUUID(), 'device_id')).catch(() => null);
+    return withStore('meta', 'readonly', (meta) => meta.get('device_id'));
+  }
+
+  function enqueue(entry) {
+    const record = Object.assign({}, entry, {
+      key: scope.crypto.randomUUID(), captured_at: new Date().toISOString(), status: 'pending', message: null,
+    });
+    return withStore(STORE, 'readwrite', (store) => store.add(record));
+  }
+
+  function byStatus(status, limit) {
+    return withStore(STORE, 'readonly', (store) => store.index('status').getAll(status, limit));
+  }
+
+  function update(seq, changes) {
+    return withStore(STORE, 'readwrite', (store) => {
+      const req = store.get(seq);
+      req.addEventListener('success', () => store.put(Object.assign(req.result, changes)));
+      return req;
+    });
+  }
+
+  function remove(seq) {
+    return withStore(STORE, 'readwrite', (store) => store.delete(seq));
+  }
+
+  // Pending count and the entries the server refused, for the page's status badge.
+  function summary() {
+    return Promise.all([withStore(STORE, 'readonly', (store) => store.index('status').count('pending')),
+                        byStatus('rejected')])
+      .then(([pending, rejected]) => ({pending: pending, rejected: rejected}));
+  }
+
+  function uploadImage(entry) {
+    const body = new FormData();
+    body.append('file', entry.image, entry.image_name || 'evidence');
+    return scope.fetch('/upload', {method: 'POST', body: body, credentials: 'same-origin'}).then((response) => {
+      if (response.status === 413 || response.status === 415) {
+        return response.json().then((json) => ({error: json.error}));
+      }
+      if (!response.ok) {
+        throw new Error(`Image upload failed with HTTP ${response.status}`);
+      }
+      return response.json();
+    });
+  }
+
+  // Sends pending entries in order until none are left or one has to wait for a retry.
+  async function drain() {
+    const device = await deviceId();
+    let applied = 0;
+    for (;;) {
+      const batch = await byStatus('pending', BATCH_SIZE);
+      if (!batch.length) {
+        return applied;
+      }
+      const items = [];
+      for (const entry of batch) {
+        let handle = null;
+        if (entry.image) {
+          const uploaded = await uploadImage(entry);
+          if (uploaded.error) {
+            await update(entry.seq, {status: 'rejected', message: uploaded.error});
+            continue;
+          }
+          handle = uploaded.handle;
+        }
+        items.push({key: entry.key, seq: entry.seq, captured_at: entry.captured_at, plate: entry.plate,
+                    fuel: entry.fuel, loc: entry.loc, officer: entry.officer, notes: entry.notes,
+                    img_handle: handle});
+      }
+      if (!items.length) {
+        continue;
+      }
+      const response = await scope.fetch('/sync/checkpoints', {
+        method: 'POST', credentials: 'same-origin', headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({device_id: device, items: items}),
+      });
+      if (!response.ok) {
+        throw new Error(`Checkpoint sync failed with HTTP ${response.status}`);
+      }
+      const {results} = await response.json();
+      if (!results.length) {
+        return applied;
+      }
+      for (const result of results) {
+        if (result.status === 'retry') {
+          return applied;
+        }
+        if (result.status === 'rejected') {
+          await update(result.seq, {status: 'rejected', message: result.message});
+        } else {
+          await remove(result.seq);
+          applied += 1;
+        }
+      }
+    }
+  }
+
+  // Only one context (page or service worker) drains the queue at a time.
+  function sync() {
+    if (scope.navigator.locks) {
+      return scope.navigator.locks.request(SYNC_TAG, {ifAvailable: true}, (lock) => (lock ? drain() : 0));
+    }
+    return drain();
+  }
+
+  scope.CheckpointQueue = {SYNC_TAG: SYNC_TAG, enqueue: enqueue, remove: remove, summary: summary, sync: sync};
+})(self);
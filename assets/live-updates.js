@@ -0,0 +1,13 @@
+// Pushes ledger change events from /events into the 'live-event' store so that
+// dashboard and monitor callbacks refresh only when something they show changed.
+(function () {
+  if (!window.EventSource) {
+    return;
+  }
+  const source = new EventSource('/events');
+  source.addEventListener('change', (e) => {
+    if (window.dash_clientside && window.dash_clientside.set_props) {
+      window.dash_clientside.set_props('live-event', {data: JSON.parse(e.data)});
+    }
+  });
+})();
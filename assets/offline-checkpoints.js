@@ -0,0 +1,109 @@
+// Routes checkpoint submissions. While the device is online and nothing is
+// waiting, the click goes to the server callback as before (through the
+// 'checkpoint-submit' store). Offline, or behind entries that have not
+// synced yet, the reading and its photo are queued by checkpoint-queue.js
+// and sent when the connection returns. Keeps the navbar badge in step.
+// Browsers without IndexedDB cannot queue, so every click goes to the server.
+(function () {
+  const queue = window.indexedDB ? window.CheckpointQueue : null;
+
+  function alert(children, color) {
+    return {namespace: 'dash_bootstrap_components', type: 'Alert', props: {children: children, color: color}};
+  }
+
+  function setProps(id, props) {
+    if (window.dash_clientside && window.dash_clientside.set_props && document.getElementById(id)) {
+      window.dash_clientside.set_props(id, props);
+    }
+  }
+
+  function refreshBadge() {
+    return queue.summary().then(({pending, rejected}) => {
+      const parts = [];
+      if (pending) {
+        parts.push(`${pending} waiting to sync`);
+      }
+      if (rejected.length) {
+        parts.push(`${rejected.length} rejected`);
+      }
+      setProps('offline-queue-badge', {
+        children: parts.join(', '),
+        className: parts.length ? `badge ${rejected.length ? 'bg-danger' : 'bg-warning text-dark'} ms-2 mt-2` : 'd-none',
+        title: rejected.map((e) => `${e.plate} at ${e.loc}: ${e.message}`).join('\n'),
+      });
+      return pending;
+    });
+  }
+
+  function syncNow() {
+    if (!navigator.onLine) {
+      return Promise.resolve();
+    }
+    return queue.sync().catch((e) => console.warn(e)).then(refreshBadge);
+  }
+
+  // Lets the service worker finish the sync if the page is closed first.
+  function requestBackgroundSync() {
+    if (navigator.serviceWorker && window.SyncManager) {
+      navigator.serviceWorker.ready.then((reg) => reg.sync.register(queue.SYNC_TAG)).catch(() => null);
+    }
+  }
+
+  window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    offline: {
+      routeCheckpoint: async function (n, plate, fuel, loc, officer, notes, upload) {
+        const noUpdate = window.dash_clientside.no_update;
+        if (!queue) {
+          return [n, noUpdate];
+        }
+        const {pending} = await queue.summary();
+        if (navigator.onLine && !pending && !(upload && upload.offline)) {
+          return [n, noUpdate];
+        }
+        if (!plate || fuel === null || fuel === undefined || fuel === '' || !loc || !officer) {
+          return [noUpdate, alert('Please fill all required fields: Plate Number, Fuel Check, Location, and Officer.',
+                                  'warning')];
+        }
+        const file = upload && window.ftlUploads ? window.ftlUploads.file('checkpoint-upload') : null;
+        await queue.enqueue({plate: plate.trim().toUpperCase(), fuel: Number(fuel), loc: loc, officer: officer,
+                             notes: notes || null, image: file, image_name: file ? file.name : null});
+        setProps('checkpoint-upload', {data: null});
+        setProps('fuel-check', {value: null});
+        setProps('checkpoint-notes', {value: ''});
+        requestBackgroundSync();
+        const waiting = await refreshBadge();
+        syncNow();
+        return [noUpdate, alert(`Saved on this device: ${plate.toUpperCase()} at ${loc}. ${waiting} ` +
+                                `checkpoint(s) will be added to the ledger, in order, when the connection returns.`,
+                                'secondary')];
+      },
+    },
+  });
+
+  if (!queue) {
+    return;
+  }
+
+  document.addEventListener('click', (e) => {
+    const badge = document.getElementById('offline-queue-badge');
+    if (!badge || !badge.contains(e.target)) {
+      return;
+    }
+    queue.summary().then(({rejected}) => {
+      if (rejected.length && window.confirm(`Discard ${rejected.length} rejected checkpoint(s)?\n\n${badge.title}`)) {
+        Promise.all(rejected.map((entry) => queue.remove(entry.seq))).then(refreshBadge);
+      }
+    });
+  });
+
+  if (navigator.serviceWorker) {
+    navigator.serviceWorker.addEventListener('message', (e) => {
+      if (e.data && e.data.type === queue.SYNC_TAG) {
+        refreshBadge();
+      }
+    });
+  }
+  window.addEventListener('online', syncNow);
+  window.addEventListener('load', () => setTimeout(syncNow, 1000));
+  setInterval(syncNow, 60 * 1000);
+})();
@@ -1,12 +1,25 @@
-// This is the "Offline page" service worker
+// This is the "Offline page" service worker, extended to keep the app usable at
+// checkpoints without a connection: the app shell and the callbacks that draw
+// the checkpoint form are served from cache when the network fails, and the
+// checkpoint queue (checkpoint-queue.js) is synced in the background.
+// It is served from /pwabuilder-sw.js so that its scope is the whole site.
 
 importScripts('https://storage.googleapis.com/workbox-cdn/releases/5.1.2/workbox-sw.js');
+importScripts('/assets/checkpoint-queue.js');
 
 const CACHE = "pwabuilder-page";
+const SHELL_CACHE = "ftl-shell-v1";
 
 // TODO: replace the following with the correct offline fallback page i.e.: const offlineFallbackPage = "offline.html";
 const offlineFallbackPage = "/assets/offline.html";
 
+// Dash serves the same index page for every path.
+const shellPage = "/";
+// Callbacks whose last response is replayed offline, keyed by their inputs and state.
+const OFFLINE_CALLBACKS = ['page-content.children', 'officer-select.options', 'last-reading-info.children'];
+// Live data, uploads and evidence files are never cached.
+const NETWORK_ONLY = /^\/(events|upload|sync\/|exports\/|metrics|pwabuilder-sw\.js|assets\/blobs\/)/;
+
 self.addEventListener("message", (event) => {
   if (event.data && event.data.type === "SKIP_WAITING") {
     self.skipWaiting();
@@ -20,28 +33,94 @@ self.addEventListener('install', async (event) => {
   );
 });
 
+self.addEventListener('activate', (event) => {
+  event.waitUntil(self.clients.claim());
+});
+
 if (workbox.navigationPreload.isSupported()) {
   workbox.navigationPreload.enable();
 }
 
+async function networkFirst(request, key) {
+  try {
+    const response = await fetch(request);
+    if (response.ok || response.type === 'opaque') {
+      const cache = await caches.open(SHELL_CACHE);
+      await cache.put(key || request, response.clone());
+    }
+    return response;
+  } catch (error) {
+    const cached = await caches.match(key || request);
+    if (cached) {
+      return cached;
+    }
+    throw error;
+  }
+}
+
+async function callbackKey(request) {
+  let payload;
+  try {
+    payload = JSON.parse(await request.clone().text());
+  } catch (error) {
+    return null;
+  }
+  if (!OFFLINE_CALLBACKS.includes(payload.output)) {
+    return null;
+  }
+  const data = new TextEncoder().encode(JSON.stringify([payload.output, payload.inputs, payload.state || []]));
+  const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', data));
+  const hex = Array.from(digest, (b) => b.toString(16).padStart(2, '0')).join('');
+  return new Request(`/__offline-callbacks/${hex}`);
+}
+
 self.addEventListener('fetch', (event) => {
-  if (event.request.mode === 'navigate') {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) {
+    // Stylesheets, fonts and scripts from CDNs, so the shell keeps its look offline.
+    if (request.method === 'GET' && ['style', 'font', 'script'].includes(request.destination)) {
+      event.respondWith(networkFirst(request));
+    }
+    return;
+  }
+  if (NETWORK_ONLY.test(url.pathname)) {
+    return;
+  }
+
+  if (request.mode === 'navigate') {
     event.respondWith((async () => {
       try {
         const preloadResp = await event.preloadResponse;
 
-        if (preloadResp) {
-          return preloadResp;
+        const networkResp = preloadResp || await fetch(request);
+        if (networkResp.ok) {
+          const cache = await caches.open(SHELL_CACHE);
+          await cache.put(shellPage, networkResp.clone());
         }
-
-        const networkResp = await fetch(event.request);
         return networkResp;
       } catch (error) {
 
+        const cachedShell = await caches.match(shellPage);
+        if (cachedShell) {
+          return cachedShell;
+        }
         const cache = await caches.open(CACHE);
         const cachedResp = await cache.match(offlineFallbackPage);
         return cachedResp;
       }
     })());
+  } else if (request.method === 'POST' && url.pathname === '/_dash-update-component') {
+    event.respondWith(callbackKey(request).then((key) => (key ? networkFirst(request, key) : fetch(request))));
+  } else if (request.method === 'GET') {
+    event.respondWith(networkFirst(request));
   }
-});
\ No newline at end of file
+});
+
+self.addEventListener('sync', (event) => {
+  if (event.tag === CheckpointQueue.SYNC_TAG) {
+    event.waitUntil(CheckpointQueue.sync()
+      .then(() => self.clients.matchAll())
+      .then((clients) => clients.forEach((client) => client.postMessage({type: CheckpointQueue.SYNC_TAG}))));
+  }
+});
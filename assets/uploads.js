@@ -0,0 +1,84 @@
+// Sends files dropped on or picked in the image upload zones to /upload as a
+// streamed multipart request, instead of letting dcc.Upload read them into a
+// base64 data URI that travels through the callbacks. The zone's store gets
+// an object URL for the preview and, once the upload finishes, its handle.
+// The last file of each zone stays available to offline-checkpoints.js,
+// which queues it with the checkpoint when the upload cannot reach the server.
+(function () {
+  const ZONES = {
+    'upload-passport-image': 'passport-upload',
+    'upload-checkpoint-image': 'checkpoint-upload',
+  };
+  const previews = {};
+  const files = {};
+
+  window.ftlUploads = {
+    file: (storeId) => files[Object.keys(ZONES).find((zoneId) => ZONES[zoneId] === storeId)] || null,
+  };
+
+  function zoneOf(target) {
+    for (const zoneId of Object.keys(ZONES)) {
+      const zone = document.getElementById(zoneId);
+      if (zone && zone.contains(target)) {
+        return zoneId;
+      }
+    }
+    return null;
+  }
+
+  function setUpload(zoneId, data) {
+    window.dash_clientside.set_props(ZONES[zoneId], {data: data});
+  }
+
+  function upload(zoneId, file) {
+    if (previews[zoneId]) {
+      URL.revokeObjectURL(previews[zoneId]);
+    }
+    const preview = previews[zoneId] = URL.createObjectURL(file);
+    files[zoneId] = file;
+    const state = {filename: file.name, preview: preview, handle: null, error: null};
+    setUpload(zoneId, state);
+
+    const body = new FormData();
+    body.append('file', file, file.name);
+    fetch('/upload', {method: 'POST', body: body, credentials: 'same-origin'})
+      .then((response) => response.json().then((json) => ({ok: response.ok, json: json})))
+      .then(({ok, json}) => {
+        if (previews[zoneId] !== preview) {
+          return;  // superseded by a newer file
+        }
+        setUpload(zoneId, ok ? Object.assign({}, state, {handle: json.handle})
+                             : Object.assign({}, state, {error: json.error || 'Upload failed.'}));
+      })
+      .catch(() => {
+        if (previews[zoneId] === preview) {
+          // Only checkpoint logs can be queued on the device; registration needs the server.
+          const queued = ZONES[zoneId] === 'checkpoint-upload';
+          setUpload(zoneId, Object.assign({}, state, {
+            offline: true,
+            error: queued ? 'Offline: the image will be sent with the checkpoint when it syncs.' : 'Upload failed.'}));
+        }
+      });
+  }
+
+  // Capture-phase listeners run before React's, so dcc.Upload never reads the file.
+  document.addEventListener('change', (e) => {
+    const zoneId = zoneOf(e.target);
+    if (!zoneId || !e.target.files || !e.target.files.length) {
+      return;
+    }
+    e.stopPropagation();
+    upload(zoneId, e.target.files[0]);
+    e.target.value = '';
+  }, true);
+
+  document.addEventListener('drop', (e) => {
+    const zoneId = zoneOf(e.target);
+    if (!zoneId || !e.dataTransfer || !e.dataTransfer.files.length) {
+      return;
+    }
+    e.preventDefault();
+    e.stopPropagation();
+    upload(zoneId, e.dataTransfer.files[0]);
+  }, true);
+})();
@@ -0,0 +1,234 @@
+"""Benchmarks the Dash callbacks, the checkpoint write path and the PDF renderer on ledgers of several sizes.
+
+For each size a ledger is generated once with loadgen.py and kept in
+--data-dir. Each run restores a copy of it into a scratch directory and
+starts a fresh interpreter there, which imports the app and calls the
+callback functions directly, as Dash would after decoding a request. The
+dashboard cache is cleared before every call, so the numbers are those of a
+cold cache. Every case reports the p50, p95 and p99 latency, the SQL
+statements per call on the app's connection pool (and on the renderer's own
+connection), and the peak memory of one call as seen by tracemalloc.
+
+Results are printed as a table and written as JSON with --out. Pass the
+JSON of an earlier commit to --compare to print the change of each case.
+
+    python bench_callbacks.py [--sizes 1000,10000,100000] [--repeat 30] [--out FILE] [--compare FILE]
+"""
+
+import argparse
+import contextvars
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+DEFAULT_SIZES = '1000,10000,100000'
+DATA_DIR = 'bench_data'
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement):
+        # Statements run by triggers are reported as comments; only count what the code issued.
+        if not statement.startswith('--'):
+            self.count += 1
+
+
+def _percentile(values, fraction):
+    return values[int(fraction * (len(values) - 1))]
+
+
+def _measure(func, repeat, counter, setup=None):
+    if setup:
+        setup()
+    func()
+    timings, before = [], counter.count
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    statements = (counter.count - before) / repeat
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    timings.sort()
+    return {'p50_ms': round(_percentile(timings, 0.5) * 1e3, 3), 'p95_ms': round(_percentile(timings, 0.95) * 1e3, 3),
+            'p99_ms': round(_percentile(timings, 0.99) * 1e3, 3),
+            'mean_ms': round(sum(timings) / len(timings) * 1e3, 3), 'statements': round(statements, 1),
+            'peak_bytes': peak}
+
+
+def _triggered_by(prop_id, func, *args):
+    """Calls a callback as if prop_id had triggered it, so that dash.ctx works outside a request."""
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    def call():
+        context_value.set(AttributeDict(triggered_inputs=[{'prop_id': prop_id, 'value': None}]))
+        return func(*args)
+    return contextvars.copy_context().run(call)
+
+
+def _placeholder_images():
+    """Creates the passport and evidence images the generated journeys point to, so reports embed them."""
+    from PIL import Image as PILImage
+    import loadgen
+    for path, size, color in ((loadgen.PASSPORT_PATH, (100, 120), 'grey'),
+                              (loadgen.EVIDENCE_PATH, (400, 100), 'lightgrey')):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        PILImage.new('RGB', size, color=color).save(path, 'PNG')
+
+
+def _run_cases(size, repeat, seed_file):
+    """Worker: seeds or restores the ledger in the current directory, then measures every case."""
+    import app
+    import loadgen
+    import queries
+    import repository
+    from reports import create_journey_pdf
+
+    if os.path.exists(seed_file):
+        with sqlite3.connect(seed_file) as source, sqlite3.connect(app.DB_FILE) as target:
+            source.backup(target)
+        app.init_database()
+    else:
+        app.init_database()
+        loadgen.seed(app.DB_FILE, size)
+        with sqlite3.connect(app.DB_FILE) as source, sqlite3.connect(seed_file) as target:
+            source.backup(target)
+    _placeholder_images()
+
+    counter = _StatementCounter()
+    app.db_pool.set_trace_callback(counter)
+    conn = sqlite3.connect(app.DB_FILE)
+    conn.set_trace_callback(counter)
+    try:
+        journey_id = repository.journey_page(conn, limit=1)[0][0].id
+        plate, destination, fuel = conn.execute(queries.ACTIVE_JOURNEY_ROUTES).fetchone()
+        stop = next(loc for loc in app.reference_data.locations() if loc != destination)
+        officer = app.reference_data.officers(stop)[0][0]
+        readings = itertools.count()
+        # The cursor just past the oldest completed journey, so its page is the last one.
+        oldest_id, _, _, oldest_at = conn.execute(queries.ARCHIVE_CANDIDATES, {
+            'cutoff': '9999-12-31', 'created_at': '', 'id': 0, 'limit': 1}).fetchone()
+        oldest = (oldest_at, oldest_id + 1)
+
+        def submit_checkpoint():
+            # The journey stays in transit, so every call appends to the same chain.
+            return app._submit_checkpoint_to_db({'plate': plate, 'loc': stop, 'officer': officer, 'notes': None,
+                                                 'fuel': max(0.0, fuel - next(readings)), 'img_handle': None})
+
+        cases = {
+            'update_kpis': (lambda: app.update_kpis(None, None), app.dashboard_cache.invalidate),
+            'update_charts': (lambda: app.update_charts(None, None), app.dashboard_cache.invalidate),
+            'update_active_transports_table': (lambda: app.update_active_transports_table(None, None),
+                                               app.dashboard_cache.invalidate),
+            'update_route_monitoring all': (lambda: _triggered_by(
+                'monitor-interval.n_intervals', app.update_route_monitoring, None, 'all', None, None, None, [],
+                None), None),
+            'update_route_monitoring overdue': (lambda: _triggered_by(
+                'status-filter.value', app.update_route_monitoring, None, 'overdue', None, None, None, [], None), None),
+            'update_route_monitoring oldest page': (lambda: _triggered_by(
+                'monitor-older.n_clicks', app.update_route_monitoring, None, 'all', None, 1, None, [],
+                {'stack': [None], 'next': oldest}), None),
+            'update_last_reading_info': (lambda: app.update_last_reading_info(plate), None),
+            'suggest_active_plates': (lambda: app.suggest_active_plates(plate[:6]), None),
+            'update_journey_dropdown': (lambda: _triggered_by(
+                'journey-select.search_value', app.update_journey_dropdown, '/receipt', plate[:6], None, None, None,
+                None, None, None, None, None), None),
+            'create_journey_pdf': (lambda: create_journey_pdf(conn, journey_id,
+                                                              os.path.join(REPO_DIR, 'assets', app.LOGO_FILE)), None),
+            '_submit_checkpoint_to_db': (submit_checkpoint, None),
+        }
+        return {name: _measure(func, repeat, counter, setup) for name, (func, setup) in cases.items()}
+    finally:
+        conn.close()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat=30, data_dir=DATA_DIR):
+    """Measures every case on a ledger of each size; returns the results with the commit and environment."""
+    data_dir = os.path.abspath(data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    results = {'commit': _git_commit(), 'created_at': datetime.now().isoformat(timespec='seconds'),
+               'python': sys.version.split()[0], 'sqlite': sqlite3.sqlite_version, 'repeat': repeat, 'sizes': {}}
+    for size in sizes:
+        scratch = os.path.join(data_dir, f"run-{size}")
+        shutil.rmtree(scratch, ignore_errors=True)
+        os.makedirs(scratch)
+        output = os.path.join(scratch, 'results.json')
+        # A fresh interpreter per size, in its own directory: the app opens its database and caches there.
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', str(size), '--repeat', str(repeat),
+                        '--out', output, '--data-dir', data_dir], cwd=scratch, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            results['sizes'][str(size)] = json.load(f)
+    return results
+
+
+def _print_results(results, baseline=None):
+    header = f"{'journeys':>9}  {'case':<36}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'sql':>7}{'peak KiB':>10}"
+    print(header + (f"{'p50 vs ' + str(baseline.get('commit')):>18}" if baseline else ''))
+    for size, cases in results['sizes'].items():
+        for name, stats in cases.items():
+            line = (f"{size:>9}  {name:<36}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+                    f"{stats['statements']:>7}{stats['peak_bytes'] // 1024:>10}")
+            before = (baseline or {}).get('sizes', {}).get(size, {}).get(name)
+            if before:
+                line += f"{(stats['p50_ms'] / max(before['p50_ms'], 1e-3) - 1) * 100:>+17.1f}%"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app's callbacks and PDF renderer.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="comma-separated journey counts")
+    parser.add_argument('--repeat', type=int, default=30, help="timed calls per case")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="directory of the generated ledgers")
+    parser.add_argument('--out', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        seed_file = os.path.join(args.data_dir, f"ledger-{args.worker}.db")
+        with open(args.out, 'w') as f:
+            json.dump(_run_cases(args.worker, args.repeat, seed_file), f)
+        os._exit(0)  # The app's background threads and pools have nothing left to do.
+
+    results = run([int(size) for size in args.sizes.split(',')], args.repeat, args.data_dir)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    _print_results(results, baseline)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Compares pandas.read_sql_query with repository.py on the lookups it replaced.
+
+Each case runs both implementations against the ledger database and prints
+the median and 95th percentile latency per call, and the bytes allocated
+per call as seen by tracemalloc (peak above the starting point). Cases are
+run on one warm connection, as the app's pool would serve them.
+
+    python bench_repository.py [--db FILE] [--repeat N] [--json]
+"""
+
+import argparse
+import json
+import sqlite3
+import statistics
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+import queries
+import repository
+
+DEFAULT_DB_FILE = 'fuel_transport_ledger_v7.6_final.db'
+
+
+def _pandas_journey(conn, journey_id):
+    return pd.read_sql_query(queries.JOURNEY_BY_ID, conn, params=[journey_id]).iloc[0]
+
+
+# The first page of the report picker, with no filters, as repository.journey_page reads it.
+_FIRST_PAGE = {'plate': None, 'plate_end': None, 'company': None, 'destination': None, 'since': '',
+               'before_ts': '9999-12-31', 'before_id': 0, 'limit': repository.PAGE_SIZE + 1}
+
+
+def _pandas_options(conn):
+    df = pd.concat([pd.read_sql_query(queries.COMPLETED_JOURNEY_PAGES[None], conn, params=_FIRST_PAGE),
+                    pd.read_sql_query(queries.ARCHIVED_JOURNEY_PAGES[None], conn, params=_FIRST_PAGE)
+                    .rename(columns={'vehicle_id': 'id'})], ignore_index=True)
+    df = df.sort_values(['created_at', 'id'], ascending=False).head(repository.PAGE_SIZE)
+    return [{'label': f"{r['plate_number']} to {r['destination']} on "
+                      f"{pd.to_datetime(r['created_at']).strftime('%Y-%m-%d')}", 'value': r['id']}
+            for _, r in df.iterrows()]
+
+
+def _repository_options(conn):
+    return [{'label': f"{j.plate_number} to {j.destination} on {j.created_at[:10]}", 'value': j.id}
+            for j in repository.journey_page(conn)[0]]
+
+
+def _measure(func, repeat):
+    func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    timings.sort()
+    return {'median_us': round(statistics.median(timings) * 1e6, 1),
+            'p95_us': round(timings[int(0.95 * (len(timings) - 1))] * 1e6, 1), 'alloc_bytes': peak}
+
+
+def run(db_file, repeat=200):
+    """Returns {case: {'pandas': stats, 'repository': stats}} for the journey lookup and the report picker."""
+    conn = sqlite3.connect(db_file)
+    try:
+        journey_id = conn.execute(queries.LAST_JOURNEY_ID).fetchone()[0]
+        cases = {
+            'journey by id': (lambda: _pandas_journey(conn, journey_id),
+                              lambda: repository.journey(conn, journey_id)),
+            'report picker page': (lambda: _pandas_options(conn), lambda: _repository_options(conn)),
+        }
+        return {name: {'pandas': _measure(with_pandas, repeat), 'repository': _measure(with_rows, repeat)}
+                for name, (with_pandas, with_rows) in cases.items()}
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pandas against row-mapping reads.")
+    parser.add_argument('--db', default=DEFAULT_DB_FILE, help="ledger database file")
+    parser.add_argument('--repeat', type=int, default=200, help="timed calls per case and implementation")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.db, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'case':<24}{'implementation':<16}{'median us':>12}{'p95 us':>12}{'alloc bytes':>14}")
+    for name, implementations in results.items():
+        for implementation, stats in implementations.items():
+            print(f"{name:<24}{implementation:<16}{stats['median_us']:>12}{stats['p95_us']:>12}"
+                  f"{stats['alloc_bytes']:>14}")
+        speedup = implementations['pandas']['median_us'] / max(implementations['repository']['median_us'], 0.1)
+        print(f"{'':<24}{'speed-up':<16}{speedup:>11.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
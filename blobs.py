@@ -0,0 +1,109 @@
+"""Content-addressed storage for evidence and passport images.
+
+A blob is named by the SHA-256 of its bytes and stored under two levels of
+directories taken from the digest (ab/cd/abcd....webp), so no directory
+grows beyond a few hundred entries and identical photos are stored once.
+The blobs table lists every stored blob; a row is added inside the
+transaction of the ledger row that references it and the files are moved
+in only after that commits. Ledger rows are never deleted, only moved into
+the monthly archive files, which still reference their evidence, so blobs
+are kept for good and there is nothing to collect.
+
+    python blobs.py verify [--db FILE] [--dir DIR]
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import queries
+from database import apply_migrations
+from images import VARIANTS
+
+DEFAULT_DB_FILE = 'fuel_transport_ledger_v7.6_final.db'
+BLOB_DIR = os.path.join('assets', 'blobs')
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file, read in chunks."""
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+class BlobStore:
+    """Sharded directory of files named by their digest, with sibling files sharing the same name."""
+
+    def __init__(self, root, suffix='.webp', companions=()):
+        self.root = root
+        self.suffix = suffix
+        # Derived files (e.g. image variants) stored next to the blob as <digest><companion suffix>.
+        self.companions = tuple(companions)
+
+    def path(self, digest, suffix=None):
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}{suffix or self.suffix}")
+
+    def locate(self, src_path):
+        """The digest of src_path and the path it will have in the store, without touching either."""
+        digest = file_sha256(src_path)
+        return digest, self.path(digest)
+
+    def add(self, conn, src_path, digest=None):
+        """Records the blob of src_path in the caller's transaction. Returns (digest, path).
+
+        The files are not moved: call move_in() once the transaction has
+        committed, so a rollback leaves the upload where it was and its
+        handle can be submitted again.
+        """
+        if digest is None:
+            digest = file_sha256(src_path)
+        conn.execute(queries.ADD_BLOB, (digest, os.path.getsize(src_path), datetime.now()))
+        return digest, self.path(digest)
+
+    def move_in(self, src_path, digest):
+        """Moves src_path (and its companions) into the store after add() committed. Returns the blob's path."""
+        dest = self.path(digest)
+        src_root = src_path[:-len(self.suffix)] if src_path.endswith(self.suffix) else os.path.splitext(src_path)[0]
+        incoming = [(f"{src_root}{suffix}", self.path(digest, suffix)) for suffix in self.companions]
+        incoming.append((src_path, dest))
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # The blob itself is moved last, so a blob that exists always has its companions. A copy already in
+        # the store has the same digest and is replaced rather than kept, so the blob is never left missing.
+        for src, dst in incoming:
+            try:
+                os.replace(src, dst)
+            except FileNotFoundError:
+                # A concurrent submission of the same handle already moved it in.
+                if not os.path.exists(dst):
+                    raise
+        return dest
+
+    def verify(self, digest):
+        """True if the stored blob still hashes to its name."""
+        path = self.path(digest)
+        return os.path.exists(path) and file_sha256(path) == digest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the content-addressed store of evidence images.")
+    parser.add_argument('--db', default=DEFAULT_DB_FILE, help="ledger database file")
+    parser.add_argument('--dir', default=BLOB_DIR, help="root directory of the blob store")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('verify', help="rehash every stored blob and report missing or altered files")
+    args = parser.parse_args(argv)
+
+    store = BlobStore(args.dir, companions=[v[1] for v in VARIANTS.values()])
+    with sqlite3.connect(args.db, timeout=30) as conn:
+        apply_migrations(conn)
+        digests = [digest for (digest,) in conn.execute(queries.ALL_BLOBS)]
+    broken = [digest for digest in digests if not store.verify(digest)]
+    print(f"Verified {len(digests)} blobs.")
+    for digest in broken:
+        print(f"{'ALTERED' if os.path.exists(store.path(digest)) else 'MISSING'} blob {digest}")
+    return 1 if broken else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
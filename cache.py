@@ -0,0 +1,104 @@
+"""Process-wide TTL cache for callback results that are identical for every session."""
+
+import functools
+import os
+import threading
+import time
+
+
+class ResultCache:
+    """A thread-safe TTL cache with cross-worker invalidation through a stamp file.
+
+    invalidate() clears this process's entries and atomically replaces the
+    stamp file. Every lookup compares the stamp file's identity with the one
+    seen last, so other gunicorn workers drop their entries on their next
+    lookup at the cost of a single stat() call.
+    """
+
+    def __init__(self, ttl=30.0, stamp_file=None):
+        self.ttl = ttl
+        self.stamp_file = stamp_file
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._stamp_seen = self._read_stamp()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'invalidations': 0, 'remote_invalidations': 0}
+
+    def _read_stamp(self):
+        if not self.stamp_file:
+            return None
+        try:
+            st = os.stat(self.stamp_file)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _sync_with_other_workers(self):
+        stamp = self._read_stamp()
+        if stamp != self._stamp_seen:
+            with self._lock:
+                self._stamp_seen = stamp
+                self._entries.clear()
+                self._stats['remote_invalidations'] += 1
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """Returns the cached value for key, computing it at most once per expiry."""
+        self._sync_with_other_workers()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._stats['hits'] += 1
+                return entry[1]
+            if entry:
+                self._stats['expired'] += 1
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent misses for the same key wait for the first computation.
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[0] > time.monotonic():
+                    self._stats['hits'] += 1
+                    return entry[1]
+                self._stats['misses'] += 1
+                generation = self._stats['invalidations'] + self._stats['remote_invalidations']
+            value = compute()
+            with self._lock:
+                # Do not store a value computed from data that was invalidated meanwhile.
+                if generation == self._stats['invalidations'] + self._stats['remote_invalidations']:
+                    self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            return value
+
+    def memoize(self, ttl=None):
+        """Decorator caching a function's result per positional/keyword arguments."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+                return self.get_or_compute(key, lambda: func(*args, **kwargs), ttl)
+
+            return wrapper
+
+        return decorator
+
+    def invalidate(self):
+        """Drops all entries in this process and signals the other workers."""
+        with self._lock:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+        if self.stamp_file:
+            tmp = f"{self.stamp_file}.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp, 'w') as f:
+                f.write(f"{os.getpid()} {time.time_ns()}\n")
+            os.replace(tmp, self.stamp_file)
+            with self._lock:
+                self._stamp_seen = self._read_stamp()
+
+    def stats(self):
+        """Returns hit/miss counters and the hit rate for this process."""
+        with self._lock:
+            snapshot = dict(self._stats, entries=len(self._entries), pid=os.getpid())
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_rate'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+        return snapshot
@@ -0,0 +1,553 @@
+"""SQLite connection management shared by every callback in the ledger app."""
+
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Pragmas applied to every pooled connection. WAL lets readers proceed while an
+# officer's checkpoint is being committed, and busy_timeout makes concurrent
+# writers wait for the lock instead of failing with "database is locked".
+CONNECTION_PRAGMAS = (
+    ("busy_timeout", 5000),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -20000),  # negative value is KiB, i.e. ~20 MB page cache
+    ("mmap_size", 268435456),
+    ("temp_store", "MEMORY"),
+    ("foreign_keys", "ON"),
+)
+
+
+class ConnectionPool:
+    """A per-process pool of long-lived SQLite connections.
+
+    Connections are handed out LIFO so the hottest connection (with a warm page
+    cache and statement cache) is reused first. The pool is rebuilt after a
+    fork, so gunicorn workers never share a connection inherited from the
+    master process.
+    """
+
+    def __init__(self, db_file, max_connections=8, acquire_timeout=30.0, cached_statements=256):
+        self.db_file = db_file
+        self.max_connections = max_connections
+        self.acquire_timeout = acquire_timeout
+        self.cached_statements = cached_statements
+        self._lock = threading.Lock()
+        self._trace = None
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._stats = {'checkouts': 0, 'hits': 0, 'misses': 0, 'waits': 0, 'wait_seconds': 0.0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=self.acquire_timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        for name, value in CONNECTION_PRAGMAS:
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _checkout(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            self._stats['checkouts'] += 1
+            try:
+                conn = self._idle.get_nowait()
+                self._stats['hits'] += 1
+                return conn
+            except queue.Empty:
+                pass
+            if self._created < self.max_connections:
+                self._created += 1
+                self._stats['misses'] += 1
+                create = True
+            else:
+                self._stats['waits'] += 1
+                create = False
+            idle = self._idle
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        started = time.perf_counter()
+        try:
+            return idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"Timed out after {self.acquire_timeout}s waiting for a database connection")
+        finally:
+            with self._lock:
+                self._stats['wait_seconds'] += time.perf_counter() - started
+
+    def _checkin(self, conn):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection; commits on success and rolls back on error."""
+        conn = self._checkout()
+        trace = self._trace
+        if trace:
+            conn.set_trace_callback(trace)
+        try:
+            with conn:
+                yield conn
+        finally:
+            if trace:
+                conn.set_trace_callback(None)
+            self._checkin(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._created -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        """Closes every idle connection held by this process."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def set_trace_callback(self, callback):
+        """Passes the statements run on connections borrowed from now on to callback; None stops tracing."""
+        self._trace = callback
+
+    def stats(self):
+        """Returns a snapshot of the pool's hit/wait counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update(pid=self._pid, open_connections=self._created, idle_connections=self._idle.qsize(),
+                            max_connections=self.max_connections)
+        checkouts = snapshot['checkouts']
+        snapshot['hit_rate'] = round(snapshot['hits'] / checkouts, 4) if checkouts else 0.0
+        snapshot['wait_seconds'] = round(snapshot['wait_seconds'], 6)
+        return snapshot
+
+
+def enable_wal(db_file):
+    """Switches the database to WAL journaling. The setting persists in the file."""
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    finally:
+        conn.close()
+
+
+# --- Schema migrations ---
+def _split_trucks_from_journeys(conn):
+    """Rebuilds the journeys table (vehicles) without UNIQUE on plate_number and links each journey to a truck.
+
+    SQLite cannot drop a constraint, so the table is copied into a new one
+    with the same ids, genesis hashes and statuses, which keeps every hash
+    chain, watermark and report key valid. Its indexes and triggers are
+    recreated from the stored schema. Existing journeys are linked to their
+    truck afterwards by backfill_truck_ids(), outside this transaction.
+    """
+    conn.execute("""CREATE TABLE IF NOT EXISTS trucks (
+                        id INTEGER PRIMARY KEY, plate_number TEXT NOT NULL UNIQUE, first_seen_at TIMESTAMP
+                    )""")
+    dependents = [sql for (sql,) in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = 'vehicles' AND type IN ('index', 'trigger') AND sql IS NOT NULL")]
+    columns = ("id, plate_number, driver_name, driver_id, driver_nationality, driver_passport_image_path, company_name, "
+               "company_till_number, invoice_number, amount_paid, origin, destination, fuel_volume, created_at, status, "
+               "unique_hash")
+    conn.execute("""CREATE TABLE vehicles_rebuilt (
+                        id INTEGER PRIMARY KEY, plate_number TEXT, driver_name TEXT, driver_id TEXT,
+                        driver_nationality TEXT, driver_passport_image_path TEXT, company_name TEXT,
+                        company_till_number TEXT, invoice_number TEXT, amount_paid REAL, origin TEXT,
+                        destination TEXT, fuel_volume REAL, created_at TIMESTAMP, status TEXT, unique_hash TEXT,
+                        truck_id INTEGER REFERENCES trucks (id)
+                    )""")
+    conn.execute(f"INSERT INTO vehicles_rebuilt ({columns}) SELECT {columns} FROM vehicles ORDER BY id")
+    conn.execute("DROP TABLE vehicles")
+    # Triggers on checkpoints name vehicles, which does not exist until the rename; legacy mode skips that check.
+    conn.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        conn.execute("ALTER TABLE vehicles_rebuilt RENAME TO vehicles")
+    finally:
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+    for sql in dependents:
+        conn.execute(sql)
+    for sql in ("""CREATE UNIQUE INDEX IF NOT EXISTS idx_vehicles_active_plate ON vehicles (plate_number)
+                       WHERE status = 'in_transit'""",
+                "CREATE INDEX IF NOT EXISTS idx_vehicles_truck ON vehicles (truck_id, created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_vehicles_truck_pending ON vehicles (id) WHERE truck_id IS NULL",
+                # New journeys are linked to their truck as they are registered, by whichever writer.
+                """CREATE TRIGGER IF NOT EXISTS trg_vehicles_link_truck AFTER INSERT ON vehicles
+                   WHEN NEW.truck_id IS NULL AND NEW.plate_number IS NOT NULL
+                   BEGIN
+                       INSERT OR IGNORE INTO trucks (plate_number, first_seen_at) VALUES (NEW.plate_number, NEW.created_at);
+                       UPDATE vehicles SET truck_id = (SELECT id FROM trucks WHERE plate_number = NEW.plate_number)
+                           WHERE id = NEW.id;
+                   END"""):
+        conn.execute(sql)
+
+
+# Each step is (version, description, script). Steps newer than the file's
+# PRAGMA user_version are applied in order, each in its own transaction.
+# A script may be a function of the connection; it runs with foreign key
+# enforcement off, as SQLite's table rebuild procedure requires, and the
+# foreign keys are checked before its transaction commits.
+SCHEMA_MIGRATIONS = [
+    (1, "secondary indexes for dashboard, monitor and checkpoint lookups", """
+        CREATE INDEX IF NOT EXISTS idx_vehicles_status_created ON vehicles (status, created_at, fuel_volume);
+        CREATE INDEX IF NOT EXISTS idx_vehicles_plate_status ON vehicles (plate_number, status, fuel_volume);
+        CREATE INDEX IF NOT EXISTS idx_vehicles_created ON vehicles (created_at);
+        CREATE INDEX IF NOT EXISTS idx_checkpoints_vehicle_ts
+            ON checkpoints (vehicle_id, timestamp, fuel_volume_check, checkpoint_name);
+        CREATE INDEX IF NOT EXISTS idx_checkpoints_ts_name ON checkpoints (timestamp, checkpoint_name);
+        CREATE INDEX IF NOT EXISTS idx_officers_location ON officers (checkpoint_location, name, badge_number);
+    """),
+    (2, "materialized dashboard KPI counters", """
+        CREATE TABLE IF NOT EXISTS kpi_summary (
+            id INTEGER PRIMARY KEY CHECK (id = 1), in_transit_count INTEGER NOT NULL DEFAULT 0,
+            in_transit_fuel REAL NOT NULL DEFAULT 0, overdue_count INTEGER NOT NULL DEFAULT 0,
+            overdue_cutoff TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS kpi_completed_daily (day TEXT PRIMARY KEY, completed INTEGER NOT NULL DEFAULT 0);
+
+        INSERT OR REPLACE INTO kpi_summary (id, in_transit_count, in_transit_fuel, overdue_count, overdue_cutoff)
+            SELECT 1, COUNT(*), COALESCE(SUM(fuel_volume), 0), 0, '' FROM vehicles WHERE status = 'in_transit';
+        DELETE FROM kpi_completed_daily;
+        INSERT INTO kpi_completed_daily (day, completed)
+            SELECT substr(created_at, 1, 10), COUNT(*) FROM vehicles WHERE status = 'completed' GROUP BY 1;
+
+        -- Journeys registered before overdue_cutoff are counted as overdue once
+        -- the cutoff is advanced past them; see kpis.read_kpis().
+        CREATE TRIGGER IF NOT EXISTS trg_kpi_vehicle_insert AFTER INSERT ON vehicles BEGIN
+            UPDATE kpi_summary SET
+                in_transit_count = in_transit_count + (NEW.status = 'in_transit'),
+                in_transit_fuel = in_transit_fuel + CASE WHEN NEW.status = 'in_transit' THEN COALESCE(NEW.fuel_volume, 0) ELSE 0 END,
+                overdue_count = overdue_count + (NEW.status = 'in_transit' AND NEW.created_at < overdue_cutoff)
+            WHERE id = 1;
+            INSERT INTO kpi_completed_daily (day, completed) SELECT substr(NEW.created_at, 1, 10), 1
+                WHERE NEW.status = 'completed' ON CONFLICT (day) DO UPDATE SET completed = completed + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_kpi_vehicle_delete AFTER DELETE ON vehicles BEGIN
+            UPDATE kpi_summary SET
+                in_transit_count = in_transit_count - (OLD.status = 'in_transit'),
+                in_transit_fuel = in_transit_fuel - CASE WHEN OLD.status = 'in_transit' THEN COALESCE(OLD.fuel_volume, 0) ELSE 0 END,
+                overdue_count = overdue_count - (OLD.status = 'in_transit' AND OLD.created_at < overdue_cutoff)
+            WHERE id = 1;
+            UPDATE kpi_completed_daily SET completed = completed - 1
+                WHERE OLD.status = 'completed' AND day = substr(OLD.created_at, 1, 10);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_kpi_vehicle_update AFTER UPDATE OF status, fuel_volume, created_at ON vehicles
+        BEGIN
+            UPDATE kpi_summary SET
+                in_transit_count = in_transit_count - (OLD.status = 'in_transit') + (NEW.status = 'in_transit'),
+                in_transit_fuel = in_transit_fuel
+                    - CASE WHEN OLD.status = 'in_transit' THEN COALESCE(OLD.fuel_volume, 0) ELSE 0 END
+                    + CASE WHEN NEW.status = 'in_transit' THEN COALESCE(NEW.fuel_volume, 0) ELSE 0 END,
+                overdue_count = overdue_count
+                    - (OLD.status = 'in_transit' AND OLD.created_at < overdue_cutoff)
+                    + (NEW.status = 'in_transit' AND NEW.created_at < overdue_cutoff)
+            WHERE id = 1;
+            UPDATE kpi_completed_daily SET completed = completed - 1
+                WHERE OLD.status = 'completed' AND day = substr(OLD.created_at, 1, 10);
+            INSERT INTO kpi_completed_daily (day, completed) SELECT substr(NEW.created_at, 1, 10), 1
+                WHERE NEW.status = 'completed' ON CONFLICT (day) DO UPDATE SET completed = completed + 1;
+        END;
+    """),
+    (3, "change feed for live dashboard updates", """
+        CREATE TABLE IF NOT EXISTS change_feed (
+            id INTEGER PRIMARY KEY, topic TEXT NOT NULL, vehicle_id INTEGER, created_at TIMESTAMP NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_change_feed_created ON change_feed (created_at);
+    """),
+    (4, "content-addressed evidence blobs", """
+        CREATE TABLE IF NOT EXISTS blobs (
+            digest TEXT PRIMARY KEY, size INTEGER NOT NULL, refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (digest) WHERE refcount <= 0;
+        ALTER TABLE checkpoints ADD COLUMN image_sha256 TEXT;
+    """),
+    (5, "company index for bulk report exports", """
+        CREATE INDEX IF NOT EXISTS idx_vehicles_company ON vehicles (company_name, status, created_at);
+    """),
+    (6, "per-journey hash-chain verification watermarks", """
+        CREATE TABLE IF NOT EXISTS chain_watermarks (
+            vehicle_id INTEGER PRIMARY KEY REFERENCES vehicles (id), checkpoint_id INTEGER NOT NULL,
+            tip_hash TEXT NOT NULL, status TEXT NOT NULL, broken_checkpoint_id INTEGER, reason TEXT,
+            verified_at TIMESTAMP NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_chain_watermarks_broken ON chain_watermarks (vehicle_id) WHERE status = 'broken';
+    """),
+    (7, "daily Merkle roll-ups of journey chain tips", """
+        CREATE TABLE IF NOT EXISTS merkle_rollups (
+            day TEXT PRIMARY KEY, root TEXT NOT NULL, leaf_count INTEGER NOT NULL, created_at TIMESTAMP NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS merkle_leaves (
+            day TEXT NOT NULL REFERENCES merkle_rollups (day), leaf_index INTEGER NOT NULL,
+            vehicle_id INTEGER NOT NULL, tip_hash TEXT NOT NULL, PRIMARY KEY (day, leaf_index)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_merkle_leaves_journey ON merkle_leaves (vehicle_id, tip_hash, day);
+    """),
+    (8, "idempotency keys for checkpoints synced from offline devices", """
+        CREATE TABLE IF NOT EXISTS checkpoint_submissions (
+            idempotency_key TEXT PRIMARY KEY, device_id TEXT NOT NULL, device_seq INTEGER NOT NULL,
+            checkpoint_id INTEGER NOT NULL REFERENCES checkpoints (id), signature_hash TEXT NOT NULL,
+            captured_at TIMESTAMP, received_at TIMESTAMP NOT NULL
+        ) WITHOUT ROWID;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_checkpoint_submissions_device
+            ON checkpoint_submissions (device_id, device_seq);
+    """),
+    (9, "per-journey checkpoint sequence numbers that refuse forked appends", """
+        ALTER TABLE checkpoints ADD COLUMN seq INTEGER;
+        UPDATE checkpoints SET seq = numbered.n FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY vehicle_id ORDER BY timestamp, id) AS n FROM checkpoints
+        ) AS numbered WHERE numbered.id = checkpoints.id;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_checkpoints_vehicle_seq ON checkpoints (vehicle_id, seq);
+        -- Lets foreign-key checks on checkpoint writes find referencing submissions without a scan.
+        CREATE INDEX IF NOT EXISTS idx_checkpoint_submissions_checkpoint ON checkpoint_submissions (checkpoint_id);
+        -- Whatever the writer, a checkpoint must take the next position and link to the entry before it.
+        CREATE TRIGGER IF NOT EXISTS checkpoints_extend_head BEFORE INSERT ON checkpoints
+        WHEN NEW.seq IS NULL
+            OR NEW.seq != COALESCE((SELECT MAX(seq) FROM checkpoints WHERE vehicle_id = NEW.vehicle_id), 0) + 1
+            OR NEW.previous_hash IS NOT COALESCE(
+                (SELECT signature_hash FROM checkpoints WHERE vehicle_id = NEW.vehicle_id AND seq = NEW.seq - 1),
+                (SELECT unique_hash FROM vehicles WHERE id = NEW.vehicle_id))
+        BEGIN
+            SELECT RAISE(ABORT, 'chain fork: checkpoint does not extend the head of its journey');
+        END;
+    """),
+    (10, "trucks table and repeated journeys per plate", _split_trucks_from_journeys),
+    (11, "catalog of journeys moved to monthly archive files", """
+        CREATE TABLE IF NOT EXISTS archived_journeys (
+            vehicle_id INTEGER PRIMARY KEY, month TEXT NOT NULL, plate_number TEXT, destination TEXT,
+            created_at TIMESTAMP, tip_hash TEXT NOT NULL, archived_at TIMESTAMP NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_archived_journeys_created ON archived_journeys (created_at, month);
+        CREATE INDEX IF NOT EXISTS idx_archived_journeys_month ON archived_journeys (month, vehicle_id, tip_hash);
+    """),
+    (12, "version stamp of the reference data cached by each worker", """
+        CREATE TABLE IF NOT EXISTS reference_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO reference_version (id, version) VALUES (1, 1);
+        CREATE TRIGGER IF NOT EXISTS trg_reference_officers_insert AFTER INSERT ON officers BEGIN
+            UPDATE reference_version SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_reference_officers_update AFTER UPDATE ON officers BEGIN
+            UPDATE reference_version SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_reference_officers_delete AFTER DELETE ON officers BEGIN
+            UPDATE reference_version SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_reference_payments_insert AFTER INSERT ON payment_validation BEGIN
+            UPDATE reference_version SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_reference_payments_update AFTER UPDATE ON payment_validation BEGIN
+            UPDATE reference_version SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_reference_payments_delete AFTER DELETE ON payment_validation BEGIN
+            UPDATE reference_version SET version = version + 1 WHERE id = 1;
+        END;
+    """),
+    (13, "indexes for the paginated report picker", """
+        ALTER TABLE archived_journeys ADD COLUMN company_name TEXT;
+        CREATE INDEX IF NOT EXISTS idx_vehicles_completed_destination ON vehicles (destination, created_at)
+            WHERE status = 'completed';
+        CREATE INDEX IF NOT EXISTS idx_archived_journeys_plate ON archived_journeys (plate_number, created_at);
+        CREATE INDEX IF NOT EXISTS idx_archived_journeys_company ON archived_journeys (company_name, created_at);
+        CREATE INDEX IF NOT EXISTS idx_archived_journeys_destination ON archived_journeys (destination, created_at);
+    """),
+    (14, "incremental Merkle roll-ups chained to the previous root", """
+        ALTER TABLE merkle_rollups ADD COLUMN previous_root TEXT;
+        ALTER TABLE merkle_rollups ADD COLUMN last_checkpoint_id INTEGER;
+        ALTER TABLE merkle_rollups ADD COLUMN last_vehicle_id INTEGER;
+    """),
+    (15, "evidence blobs without reference counts", """
+        DROP INDEX IF EXISTS idx_blobs_unreferenced;
+        ALTER TABLE blobs DROP COLUMN refcount;
+    """),
+    (16, "count of completed journeys for the route monitor", """
+        ALTER TABLE kpi_summary ADD COLUMN completed_count INTEGER NOT NULL DEFAULT 0;
+        UPDATE kpi_summary SET completed_count = (SELECT COUNT(*) FROM vehicles WHERE status = 'completed') WHERE id = 1;
+        DROP TRIGGER IF EXISTS trg_kpi_vehicle_insert;
+        DROP TRIGGER IF EXISTS trg_kpi_vehicle_delete;
+        DROP TRIGGER IF EXISTS trg_kpi_vehicle_update;
+        CREATE TRIGGER trg_kpi_vehicle_insert AFTER INSERT ON vehicles BEGIN
+            UPDATE kpi_summary SET
+                in_transit_count = in_transit_count + (NEW.status = 'in_transit'),
+                in_transit_fuel = in_transit_fuel + CASE WHEN NEW.status = 'in_transit' THEN COALESCE(NEW.fuel_volume, 0) ELSE 0 END,
+                overdue_count = overdue_count + (NEW.status = 'in_transit' AND NEW.created_at < overdue_cutoff),
+                completed_count = completed_count + (NEW.status = 'completed')
+            WHERE id = 1;
+            INSERT INTO kpi_completed_daily (day, completed) SELECT substr(NEW.created_at, 1, 10), 1
+                WHERE NEW.status = 'completed' ON CONFLICT (day) DO UPDATE SET completed = completed + 1;
+        END;
+        CREATE TRIGGER trg_kpi_vehicle_delete AFTER DELETE ON vehicles BEGIN
+            UPDATE kpi_summary SET
+                in_transit_count = in_transit_count - (OLD.status = 'in_transit'),
+                in_transit_fuel = in_transit_fuel - CASE WHEN OLD.status = 'in_transit' THEN COALESCE(OLD.fuel_volume, 0) ELSE 0 END,
+                overdue_count = overdue_count - (OLD.status = 'in_transit' AND OLD.created_at < overdue_cutoff),
+                completed_count = completed_count - (OLD.status = 'completed')
+            WHERE id = 1;
+            UPDATE kpi_completed_daily SET completed = completed - 1
+                WHERE OLD.status = 'completed' AND day = substr(OLD.created_at, 1, 10);
+        END;
+        CREATE TRIGGER trg_kpi_vehicle_update AFTER UPDATE OF status, fuel_volume, created_at ON vehicles
+        BEGIN
+            UPDATE kpi_summary SET
+                in_transit_count = in_transit_count - (OLD.status = 'in_transit') + (NEW.status = 'in_transit'),
+                in_transit_fuel = in_transit_fuel
+                    - CASE WHEN OLD.status = 'in_transit' THEN COALESCE(OLD.fuel_volume, 0) ELSE 0 END
+                    + CASE WHEN NEW.status = 'in_transit' THEN COALESCE(NEW.fuel_volume, 0) ELSE 0 END,
+                overdue_count = overdue_count
+                    - (OLD.status = 'in_transit' AND OLD.created_at < overdue_cutoff)
+                    + (NEW.status = 'in_transit' AND NEW.created_at < overdue_cutoff),
+                completed_count = completed_count - (OLD.status = 'completed') + (NEW.status = 'completed')
+            WHERE id = 1;
+            UPDATE kpi_completed_daily SET completed = completed - 1
+                WHERE OLD.status = 'completed' AND day = substr(OLD.created_at, 1, 10);
+            INSERT INTO kpi_completed_daily (day, completed) SELECT substr(NEW.created_at, 1, 10), 1
+                WHERE NEW.status = 'completed' ON CONFLICT (day) DO UPDATE SET completed = completed + 1;
+        END;
+    """),
+]
+
+
+def apply_migrations(conn, migrations=SCHEMA_MIGRATIONS):
+    """Brings the schema up to the latest migration version. Returns the new version."""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, description, script in migrations:
+        if version <= current:
+            continue
+        print(f"INFO: Applying schema migration {version}: {description}.")
+        if callable(script):
+            conn.commit()
+            foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+            conn.execute("PRAGMA foreign_keys = OFF")
+            try:
+                conn.execute("BEGIN")
+                script(conn)
+                violation = conn.execute("PRAGMA foreign_key_check").fetchone()
+                if violation:
+                    raise sqlite3.IntegrityError(f"Migration {version} leaves a dangling foreign key: {violation}")
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute(f"PRAGMA foreign_keys = {int(foreign_keys)}")
+        else:
+            conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {int(version)};\nCOMMIT;")
+        current = version
+    return current
+
+
+def backfill_truck_ids(db_file, batch_size=2000, pause=0.05):
+    """Links journeys registered before schema migration 10 to their truck. Returns the number linked.
+
+    Runs while the app serves requests: each batch is its own short write
+    transaction, with a pause between batches so officers' writes are not
+    held up, and a restart picks up where the last batch stopped. The
+    partial index on unlinked journeys finds each batch without a scan.
+    """
+    conn = sqlite3.connect(db_file, timeout=30)
+    linked = 0
+    try:
+        for name, value in CONNECTION_PRAGMAS:
+            conn.execute(f"PRAGMA {name} = {value}")
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [v_id for (v_id,) in conn.execute(
+                "SELECT id FROM vehicles WHERE truck_id IS NULL AND plate_number IS NOT NULL ORDER BY id LIMIT ?",
+                (batch_size,))]
+            if not ids:
+                conn.commit()
+                return linked
+            batch = json.dumps(ids)
+            # Batches go in id order, not time order, so a truck keeps the earliest journey seen in any batch.
+            conn.execute("""INSERT INTO trucks (plate_number, first_seen_at)
+                            SELECT plate_number, MIN(created_at) FROM vehicles
+                            WHERE id IN (SELECT value FROM json_each(?)) GROUP BY plate_number
+                            ON CONFLICT (plate_number) DO UPDATE
+                            SET first_seen_at = MIN(first_seen_at, excluded.first_seen_at)""", (batch,))
+            conn.execute("""UPDATE vehicles SET truck_id = (SELECT t.id FROM trucks t WHERE t.plate_number = vehicles.plate_number)
+                            WHERE id IN (SELECT value FROM json_each(?))""", (batch,))
+            conn.commit()
+            linked += len(ids)
+            time.sleep(pause)
+    finally:
+        conn.close()
+
+
+# --- Query plan audit ---
+QUERY_REGISTRY = []
+
+
+def register_query(sql, allow_scan=False):
+    """Records a statement for the startup plan audit and returns it unchanged.
+
+    Pass allow_scan=True only for statements that are meant to read a whole
+    table, such as seeding or one-off maintenance.
+    """
+    QUERY_REGISTRY.append((sql, allow_scan))
+    return sql
+
+
+def _placeholder_params(sql):
+    names = re.findall(r"(?<![:\w]):(\w+)", sql)
+    if names:
+        return {name: None for name in names}
+    return (None,) * sql.count('?')
+
+
+def full_scans(conn, sql):
+    """Returns the EXPLAIN QUERY PLAN lines in which SQLite scans a table without an index."""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", _placeholder_params(sql)).fetchall()
+    # Scans of CTEs and subqueries read rows already bounded by the inner query, and scans of
+    # table-valued functions such as json_each read the statement's own parameters.
+    derived = {name.lower() for name in re.findall(r"(\w+)\s+AS\s*(?:NOT\s+)?(?:MATERIALIZED\s*)?\(", sql, re.I)}
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        if not detail.startswith('SCAN ') or 'USING' in detail or 'VIRTUAL TABLE' in detail:
+            continue
+        source = detail.split()[1]
+        if source.startswith('(') or source.lower() in derived or source == 'CONSTANT':
+            continue
+        scans.append(detail)
+    return scans
+
+
+def audit_query_plans(conn, registry=None):
+    """Fails loudly if any registered statement falls back to a full table scan."""
+    offenders = []
+    for sql, allow_scan in (QUERY_REGISTRY if registry is None else registry):
+        if allow_scan:
+            continue
+        scans = full_scans(conn, sql)
+        if scans:
+            offenders.append(f"  {' '.join(sql.split())}\n    -> {'; '.join(scans)}")
+    if offenders:
+        raise RuntimeError("Query plan audit failed; these statements scan whole tables:\n" + "\n".join(offenders))
+    return len(QUERY_REGISTRY if registry is None else registry)
@@ -0,0 +1,124 @@
+"""Change feed that pushes ledger writes to browsers over Server-Sent Events.
+
+Write paths record an event in the change_feed table inside their own
+transaction, so an event exists if and only if the write committed. One
+watcher thread per worker process tails the table and fans new rows out to
+the SSE subscribers connected to that worker; events written by other
+workers therefore arrive too. The watcher only queries the table when
+PRAGMA data_version reports a commit from another connection, or when a
+local writer calls notify().
+
+Each SSE client holds its request open, so run gunicorn with threaded or
+async workers (e.g. --worker-class gthread --threads 32).
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import queries
+
+
+class ChangeFeed:
+    """Tails change_feed and delivers each new event to every subscriber queue."""
+
+    def __init__(self, db_file, poll_interval=1.0, keepalive=15.0, retention=timedelta(hours=1),
+                 max_queue=100):
+        self.db_file = db_file
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive
+        self.retention = retention
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._pid = None
+        self._subscribers = set()
+        self._wake = threading.Event()
+
+    # --- write side ---
+    @staticmethod
+    def record(conn, topic, vehicle_id=None):
+        """Adds an event to the feed as part of the caller's open transaction."""
+        conn.execute(queries.INSERT_CHANGE, (topic, vehicle_id, datetime.now()))
+
+    @staticmethod
+    def record_many(conn, events):
+        """Adds (topic, vehicle_id) events to the feed as part of the caller's open transaction."""
+        now = datetime.now()
+        conn.executemany(queries.INSERT_CHANGE, ((topic, vehicle_id, now) for topic, vehicle_id in events))
+
+    def notify(self):
+        """Wakes this worker's watcher right after a local commit."""
+        self._wake.set()
+
+    # --- read side ---
+    def subscribe(self):
+        """Registers a new subscriber and returns its event queue."""
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._ensure_watcher()
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def _ensure_watcher(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._subscribers = set()
+            threading.Thread(target=self._watch, name='change-feed-watcher', daemon=True).start()
+
+    def _watch(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout = 5000")
+        last_id = conn.execute(queries.LATEST_CHANGE_ID).fetchone()[0] or 0
+        data_version = None
+        next_prune = time.monotonic()
+        while True:
+            woken = self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if woken or version != data_version:
+                    data_version = version
+                    for change_id, topic, vehicle_id in conn.execute(queries.CHANGES_SINCE, (last_id,)).fetchall():
+                        last_id = change_id
+                        self._publish({'id': change_id, 'topic': topic, 'vehicle_id': vehicle_id})
+                if time.monotonic() >= next_prune:
+                    conn.execute(queries.PRUNE_CHANGES, (datetime.now() - self.retention,))
+                    conn.commit()
+                    next_prune = time.monotonic() + self.retention.total_seconds() / 4
+            except sqlite3.Error as e:
+                print(f"Change feed watcher error: {e}")
+
+    def _publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # A stalled client only needs to know that it must refresh everything.
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait({'id': event['id'], 'topic': 'resync', 'vehicle_id': None})
+
+    def stream(self):
+        """Yields Server-Sent Events for one client until it disconnects."""
+        q = self.subscribe()
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = q.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(q)
@@ -0,0 +1,82 @@
+"""Normalizes uploaded photos once so reports and pages only ever read small variants.
+
+Every image is stored as a bounded-size WebP master plus two derived files
+next to it: a JPEG sized for the 3 inch evidence slot in the PDF report and
+a small WebP thumbnail for the route monitor. EXIF orientation is applied
+while decoding, so phone photos are upright in every variant.
+"""
+
+import os
+import tempfile
+
+from PIL import Image as PILImage, ImageOps
+
+MASTER_MAX_SIDE = 2048
+MASTER_QUALITY = 82
+# Variant kind -> (longest side in pixels, file suffix, PIL format, save options).
+VARIANTS = {
+    'pdf': (900, '.pdf.jpg', 'JPEG', {'quality': 80, 'optimize': True}),
+    'thumb': (240, '.thumb.webp', 'WEBP', {'quality': 70, 'method': 4}),
+}
+
+
+def _open_normalized(src_path, max_side):
+    """Decodes an image at roughly max_side, upright and in RGB."""
+    img = PILImage.open(src_path)
+    # JPEGs can be decoded directly at a reduced scale, which is much cheaper than a full decode.
+    img.draft('RGB', (max_side, max_side))
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = PILImage.new('RGB', img.size, 'white')
+        background.paste(img, mask=img.getchannel('A'))
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.thumbnail((max_side, max_side), PILImage.Resampling.LANCZOS)
+    return img
+
+
+def _save_atomic(img, path, fmt, **options):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.img-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            img.save(f, fmt, **options)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _save_variants(img, root):
+    for max_side, suffix, fmt, options in VARIANTS.values():
+        variant = img.copy()
+        variant.thumbnail((max_side, max_side), PILImage.Resampling.LANCZOS)
+        _save_atomic(variant, f"{root}{suffix}", fmt, **options)
+
+
+def ingest_image(src_path, dest_dir, stem):
+    """Writes dest_dir/<stem>.webp and its variants from src_path and returns the master's path."""
+    root = os.path.join(dest_dir, stem)
+    img = _open_normalized(src_path, MASTER_MAX_SIDE)
+    _save_atomic(img, f"{root}.webp", 'WEBP', quality=MASTER_QUALITY, method=4)
+    _save_variants(img, root)
+    return f"{root}.webp"
+
+
+def variant_path(path, kind):
+    """Returns the path of an image's variant, deriving it first for images stored before ingestion existed.
+
+    Falls back to the image itself if the variant cannot be produced.
+    """
+    suffix = VARIANTS[kind][1]
+    root = os.path.splitext(path)[0]
+    candidate = f"{root}{suffix}"
+    if os.path.exists(candidate):
+        return candidate
+    try:
+        _save_variants(_open_normalized(path, max(v[0] for v in VARIANTS.values())), root)
+    except OSError as e:
+        print(f"Image variant error for {path}: {e}")
+        return path
+    return candidate
@@ -0,0 +1,154 @@
+"""Hash-chain verification for the checkpoint ledger.
+
+Every checkpoint's signature_hash is recomputed from the row with the same
+formula the app signs it with, and its previous_hash must equal the
+signature before it (or the journey's genesis hash). An entry that links to
+the same parent as the one before it is reported as a fork. Evidence blobs
+are rehashed against their recorded digest.
+
+Each journey keeps a watermark: the last checkpoint id that verified and
+the hash at that point. A normal run only hashes rows added since, so
+repeated audits cost as much as the new entries. Use --full to rehash
+everything. Journeys are verified in parallel across CPU cores.
+
+    python integrity.py [--full] [--workers N] [--db FILE]
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import queries
+from blobs import file_sha256
+from database import apply_migrations
+
+DEFAULT_DB_FILE = 'fuel_transport_ledger_v7.6_final.db'
+BATCH_SIZE = 500
+# Column order of the rows verify_chain() takes, as selected by queries.CHAIN_ROWS_AFTER.
+CHAIN_COLUMNS = ('id', 'vehicle_id', 'checkpoint_name', 'officer_name', 'timestamp', 'fuel_volume_check', 'notes',
+                 'image_path', 'image_sha256', 'previous_hash', 'signature_hash')
+
+
+def checkpoint_signature(vehicle_id, location, officer, timestamp, fuel, notes, image_path, image_sha256,
+                         previous_hash):
+    """The signature_hash of a checkpoint. notes=None is signed as 'None', as the app always has."""
+    return hashlib.sha256(
+        f"{vehicle_id}{location}{officer}{timestamp}{fuel}{notes}{image_path or ''}{image_sha256 or ''}"
+        f"{previous_hash}".encode()).hexdigest()
+
+
+def _signature_matches(row):
+    _, v_id, loc, officer, ts, fuel, notes, image_path, image_sha256, previous_hash, signature = row
+    if checkpoint_signature(v_id, loc, officer, ts, fuel, notes, image_path, image_sha256,
+                            previous_hash) == signature:
+        return True
+    # Earlier versions signed the reading as typed, so a whole number of liters may be signed without ".0".
+    fuel = float(fuel)
+    return fuel.is_integer() and checkpoint_signature(v_id, loc, officer, ts, int(fuel), notes, image_path,
+                                                      image_sha256, previous_hash) == signature
+
+
+def verify_chain(previous_hash, rows, check_blobs=True):
+    """Verifies checkpoint rows in chain order, starting from previous_hash.
+
+    rows are tuples in CHAIN_COLUMNS order. Returns (last_good_id, tip_hash,
+    rows_checked, broken_id, reason); broken_id is None when every row verified.
+    """
+    last_good_id, checked, parent = None, 0, None
+    for row in rows:
+        checked += 1
+        cp_id, image_path, image_sha256 = row[0], row[7], row[8]
+        if row[9] != previous_hash:
+            if last_good_id is not None and row[9] == parent:
+                return last_good_id, previous_hash, checked, cp_id, \
+                    f"fork: chains onto the same entry as checkpoint {last_good_id}"
+            return last_good_id, previous_hash, checked, cp_id, "previous_hash does not link to the prior entry"
+        if not _signature_matches(row):
+            return last_good_id, previous_hash, checked, cp_id, "signature does not match the entry's contents"
+        if check_blobs and image_sha256 and not (
+                os.path.exists(image_path) and file_sha256(image_path) == image_sha256):
+            return last_good_id, previous_hash, checked, cp_id, "evidence file is missing or altered"
+        last_good_id, parent, previous_hash = cp_id, previous_hash, row[10]
+    return last_good_id, previous_hash, checked, None, None
+
+
+def _verify_batch(db_file, journeys, check_blobs):
+    """Pool task: verifies journeys given as (vehicle_id, genesis_hash, watermark_id, watermark_hash)."""
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    results = []
+    try:
+        for v_id, genesis, mark_id, mark_hash in journeys:
+            start_id, start_hash = (mark_id, mark_hash) if mark_id is not None else (0, genesis)
+            rows = conn.execute(queries.CHAIN_ROWS_AFTER, (v_id, start_id)).fetchall()
+            last_id, tip, checked, broken_id, reason = verify_chain(start_hash, rows, check_blobs)
+            results.append((v_id, last_id if last_id is not None else start_id, tip, checked, broken_id, reason))
+    finally:
+        conn.close()
+    return results
+
+
+def verify_ledger(db_file, full=False, workers=None, check_blobs=True, batch_size=BATCH_SIZE):
+    """Verifies every journey's chain from its watermark (or from genesis if full) and advances the watermarks.
+
+    Returns a summary dict with the number of journeys and rows checked,
+    the broken journeys found and the throughput.
+    """
+    started = time.monotonic()
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        journeys = conn.execute(queries.ALL_JOURNEY_GENESIS if full else queries.UNVERIFIED_JOURNEYS).fetchall()
+        batches = [journeys[i:i + batch_size] for i in range(0, len(journeys), batch_size)]
+        if len(batches) > 1 and workers != 1:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                results = pool.map(_verify_batch, [db_file] * len(batches), batches, [check_blobs] * len(batches))
+                summary = _record_results(conn, results)
+        else:
+            summary = _record_results(conn, (_verify_batch(db_file, batch, check_blobs) for batch in batches))
+    finally:
+        conn.close()
+    elapsed = time.monotonic() - started
+    summary.update(elapsed=round(elapsed, 3), rows_per_s=round(summary['rows'] / elapsed, 1) if elapsed else 0.0)
+    return summary
+
+
+def _record_results(conn, batch_results):
+    summary = {'journeys': 0, 'rows': 0, 'broken': []}
+    now = datetime.now()
+    for results in batch_results:
+        with conn:
+            for v_id, last_id, tip, checked, broken_id, reason in results:
+                conn.execute(queries.UPSERT_WATERMARK, (v_id, last_id, tip, 'broken' if broken_id else 'ok',
+                                                        broken_id, reason, now))
+                summary['journeys'] += 1
+                summary['rows'] += checked
+                if broken_id:
+                    summary['broken'].append({'vehicle_id': v_id, 'checkpoint_id': broken_id, 'reason': reason})
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify the checkpoint hash chains of the fuel ledger.")
+    parser.add_argument('--db', default=DEFAULT_DB_FILE, help="ledger database file")
+    parser.add_argument('--full', action='store_true', help="rehash every entry instead of resuming at watermarks")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--skip-blobs', action='store_true', help="do not rehash evidence files")
+    args = parser.parse_args(argv)
+
+    with sqlite3.connect(args.db) as conn:
+        apply_migrations(conn)
+    summary = verify_ledger(args.db, full=args.full, workers=args.workers, check_blobs=not args.skip_blobs)
+    print(f"Verified {summary['rows']} checkpoints in {summary['journeys']} journeys "
+          f"in {summary['elapsed']}s ({summary['rows_per_s']} rows/s).")
+    for broken in summary['broken']:
+        print(f"BROKEN journey {broken['vehicle_id']} at checkpoint {broken['checkpoint_id']}: {broken['reason']}")
+    return 1 if summary['broken'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
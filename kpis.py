@@ -0,0 +1,56 @@
+"""Dashboard KPIs read from the materialized counters kept by the vehicles triggers."""
+
+from datetime import datetime, timedelta
+
+import queries
+from anomalies import overdue_cutoff
+
+# How far the overdue boundary may lag behind the clock before it is advanced.
+RECONCILE_INTERVAL = timedelta(minutes=1)
+
+
+def reconcile_overdue(conn, now=None):
+    """Advances the stored overdue boundary to the current cutoff.
+
+    Moving forward only counts the in-transit journeys that crossed the
+    boundary since the last move, which is an indexed range scan. If the clock
+    moved backwards the overdue count is recomputed from scratch.
+    """
+    cutoff = overdue_cutoff(now)
+    stored = conn.execute(queries.KPI_SUMMARY).fetchone()[3]
+    conn.execute(queries.RESET_OVERDUE_CUTOFF if stored > cutoff else queries.ADVANCE_OVERDUE_CUTOFF,
+                 {'cutoff': cutoff})
+    conn.commit()
+
+
+def _current_summary(conn, now):
+    """Returns the kpi_summary row, first moving a stale overdue boundary."""
+    row = conn.execute(queries.KPI_SUMMARY).fetchone()
+    if row is None:
+        raise RuntimeError("kpi_summary is missing; run init_database() to apply migrations.")
+    stored, cutoff = row[3], overdue_cutoff(now)
+    if not stored or stored > cutoff or \
+            datetime.fromisoformat(stored) + RECONCILE_INTERVAL <= datetime.fromisoformat(cutoff):
+        reconcile_overdue(conn, now)
+        row = conn.execute(queries.KPI_SUMMARY).fetchone()
+    return row
+
+
+def read_kpis(conn, now=None):
+    """Returns (active, completed_today, overdue, in_transit_fuel) without scanning journeys."""
+    now = now or datetime.now()
+    in_transit, fuel, overdue, _, _ = _current_summary(conn, now)
+    completed = conn.execute(queries.COMPLETED_ON_DAY, (now.strftime('%Y-%m-%d'),)).fetchone()
+    return in_transit - overdue, completed[0] if completed else 0, overdue, fuel
+
+
+def monitor_counts(conn, now=None):
+    """Returns the route monitor's journey count per status filter and the overdue boundary.
+
+    The counts are those of the stored boundary, so pages filtered with it
+    agree with the totals shown next to them.
+    """
+    in_transit, _, overdue, cutoff, completed = _current_summary(conn, now or datetime.now())
+    counts = {'all': in_transit + completed, 'in_transit': in_transit - overdue,
+              'overdue': overdue, 'completed': completed}
+    return counts, cutoff
@@ -0,0 +1,114 @@
+"""Appends checkpoint logs to the journeys' hash chains.
+
+append_checkpoints() is the write path shared by the checkpoint form, the
+offline sync and the batch API. It reads the chain head of every plate in a
+batch with one query, signs the entries in order and inserts them with
+executemany, so a convoy at a border post costs one transaction instead of
+one per truck. Run it in a transaction opened with begin_immediate(), which
+takes SQLite's write lock before the heads are read: no other writer can
+extend a chain between the read and the insert, and concurrent posters wait
+on busy_timeout instead of failing to upgrade a read lock. SQLite has a
+single writer anyway, so this adds no lock beyond the one every commit
+takes, and there is no application-level lock at all.
+
+Each checkpoint also carries its position in the journey (seq). A unique
+(vehicle_id, seq) index and an insert trigger (schema migration 9) refuse
+any row that does not take the next position and link to the entry before
+it, so a writer that skips this module still cannot fork a chain.
+"""
+
+import json
+import math
+from datetime import datetime, timedelta
+
+import queries
+from events import ChangeFeed
+from integrity import checkpoint_signature
+
+NOT_IN_TRANSIT = "Vehicle not found or not in transit."
+_TICK = timedelta(microseconds=1)
+
+
+def begin_immediate(conn):
+    """Starts a write transaction on conn, waiting for the database write lock."""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _invalid(entry, officers):
+    """Returns why an entry cannot be logged, or None."""
+    if entry.get('error'):
+        return entry['error']
+    if not all(isinstance(entry.get(name), str) and entry[name].strip() for name in ('plate', 'loc', 'officer')):
+        return "Plate, location and officer are required."
+    fuel = entry.get('fuel')
+    if isinstance(fuel, bool) or not isinstance(fuel, (int, float)) or not math.isfinite(fuel) or fuel < 0:
+        return "Fuel volume check must be a non-negative number."
+    if entry.get('notes') is not None and not isinstance(entry['notes'], str):
+        return "Notes must be text."
+    if entry['officer'] not in officers.get(entry['loc'], ()):
+        return f"{entry['officer']} is not an officer at {entry['loc']}."
+    return None
+
+
+def append_checkpoints(conn, entries):
+    """Validates entries and appends the valid ones to their journeys' chains in the caller's transaction.
+
+    entries are dicts with plate, loc, officer, fuel and notes, plus the
+    image_path and image_sha256 of an evidence blob already in the store;
+    an entry that carries an 'error' is rejected with it. Entries for the
+    same plate are chained in list order, and reaching the destination
+    completes the journey for the entries after it. Returns one result per
+    entry: {'status': 'created', 'checkpoint_id', 'journey_id', 'hash',
+    'completed'} or {'status': 'rejected', 'error'}.
+    """
+    plates = sorted({e['plate'].strip().upper() for e in entries if isinstance(e.get('plate'), str)})
+    locations = sorted({e['loc'] for e in entries if isinstance(e.get('loc'), str)})
+    officers = {}
+    for loc, name in conn.execute(queries.OFFICER_POSTINGS, (json.dumps(locations),)):
+        officers.setdefault(loc, set()).add(name)
+    heads = {plate: [v_id, dest, seq, tip, _parse_timestamp(ts)]
+             for plate, v_id, dest, seq, tip, ts in conn.execute(queries.CHAIN_HEADS, (json.dumps(plates),))}
+
+    now = datetime.now()
+    next_id = (conn.execute(queries.LAST_CHECKPOINT_ID).fetchone()[0] or 0) + 1
+    rows, completed, events, results = [], [], [], []
+    for entry in entries:
+        error = _invalid(entry, officers)
+        head = None if error else heads.get(entry['plate'].strip().upper())
+        if error or head is None:
+            results.append({'status': 'rejected', 'error': error or NOT_IN_TRANSIT})
+            continue
+        v_id, dest, seq, prev_hash, last_ts = head
+        # Reports and last readings list checkpoints by time, so each entry must be later than the one it extends.
+        ts = now if last_ts is None or now > last_ts else last_ts + _TICK
+        fuel = float(entry['fuel'])
+        image_path, image_sha256 = entry.get('image_path'), entry.get('image_sha256')
+        s_hash = checkpoint_signature(v_id, entry['loc'], entry['officer'], ts, fuel, entry.get('notes'), image_path,
+                                      image_sha256, prev_hash)
+        rows.append((v_id, seq + 1, entry['loc'], entry['officer'], ts, fuel, entry.get('notes'), image_path,
+                     image_sha256, prev_hash, s_hash))
+        head[2:] = seq + 1, s_hash, ts
+        events.append(('checkpoint_logged', v_id))
+        done = entry['loc'] == dest
+        if done:
+            completed.append((v_id,))
+            events.append(('journey_completed', v_id))
+            del heads[entry['plate'].strip().upper()]
+        results.append({'status': 'created', 'checkpoint_id': next_id + len(rows) - 1, 'journey_id': v_id,
+                        'hash': s_hash, 'completed': done})
+
+    if rows:
+        # Holding the write lock, the new rows take the ids after the current maximum, in order.
+        conn.executemany(queries.INSERT_CHECKPOINT, rows)
+        conn.executemany(queries.COMPLETE_JOURNEY, completed)
+        ChangeFeed.record_many(conn, events)
+    return results
@@ -0,0 +1,365 @@
+"""Synthetic ledger data and traffic for capacity testing.
+
+seed bulk-generates journeys with valid hash chains into a ledger database.
+Journeys are spread over the last --days days in id order, trucks make
+repeated trips, the last trip of some trucks is still in transit (some of
+them overdue) and a share of journeys carries a fuel anomaly at one stop,
+on the thresholds the monitor classifies. Worker processes build and sign
+batches of journeys; the parent inserts each batch with executemany in one
+transaction, together with the trucks whose first trip it holds. Ids are
+assigned before signing, because every signature covers its journey id,
+so nothing else may write journeys or trucks while it runs.
+Officers and invoices are created only if the database has none. Start
+from a database the app has initialized, e.g. a copy of a production one.
+
+replay drives a running app with concurrent registrations, through the
+upload and Dash callback endpoints the form uses, and checkpoints through
+/api/checkpoints, then prints throughput and p50/p95/p99 latency per
+operation. It reads officers, invoices and in-transit journeys from --db.
+
+    python loadgen.py seed --journeys 100000 [--db FILE] [--workers N] [--seed 1]
+    python loadgen.py replay --user U --password P [--url URL] [--duration 60] [--concurrency 16] [--json]
+"""
+
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import requests
+from PIL import Image as PILImage
+
+import queries
+from anomalies import CRITICAL_LOSS_LIMIT, FUEL_INCREASE_LIMIT, OVERDUE_AFTER, SUSPICIOUS_LOSS_LIMIT
+from database import CONNECTION_PRAGMAS, apply_migrations
+from events import ChangeFeed
+from integrity import checkpoint_signature
+from ledger import begin_immediate
+
+DEFAULT_DB_FILE = 'fuel_transport_ledger_v7.6_final.db'
+DEFAULT_URL = 'http://127.0.0.1:5112'
+BATCH_SIZE = 5000
+LOCATIONS = ('Juba', 'Wau', 'Malakal', 'Bor', 'Torit', 'Yei', 'Aweil', 'Bentiu', 'Rumbek', 'Yambio', 'Nimule',
+             'Kapoeta', 'Renk', 'Kuajok')
+OFFICERS_PER_LOCATION = 3
+DRIVERS = ('Ali Mohammed', 'Grace Nakato', 'Samuel Okech', 'Fatima Yusuf', 'Daniel Wani', 'Akol Deng',
+           'Rose Ajok', 'Moses Lomoro', 'Esther Ladu', 'Peter Gatluak')
+COMPANIES = ('Nile Petroleum', 'Savannah Fuels Ltd', 'Equator Energy', 'Sudan Oil Co', 'Juba Logistics',
+             'Anzo LDT', 'Imatong Haulage', 'Sudd Transport', 'Kiir Energy', 'Lakes Freight')
+NATIONALITIES = ('South Sudan', 'Uganda', 'Kenya', 'Sudan', 'Ethiopia', 'Democratic Republic of the Congo')
+PASSPORT_PATH = os.path.join('assets', 'passports', 'placeholder.png')
+EVIDENCE_PATH = os.path.join('assets', 'checkpoint_evidence', 'placeholder_evidence.PNG')
+# Fuel readings of one anomalous stop, relative to the previous reading, and the note the officer leaves.
+ANOMALIES = {
+    'fuel_increase': ((-FUEL_INCREASE_LIMIT + 1, 200), "Anomaly detected: Fuel volume increased."),
+    'suspicious_decrease': ((-CRITICAL_LOSS_LIMIT + 1, -SUSPICIOUS_LOSS_LIMIT - 1), "Suspicious fuel loss detected."),
+    'critical_decrease': ((-2500, -CRITICAL_LOSS_LIMIT - 1), "CRITICAL fuel loss detected."),
+}
+
+
+def _stops(rng, v_id, genesis, destination, fuel, created, officers, completed, anomaly, now):
+    """Checkpoint rows of one journey, chained from its genesis hash, and whether the anomalous reading is among them.
+
+    anomaly names an entry of ANOMALIES or is None. A journey still in
+    transit may have no stop yet, or none before now, to carry it.
+    """
+    locations = [loc for loc in officers if loc != destination]
+    count = rng.randint(3, 5) if completed else rng.randint(0, 2)
+    anomaly_stop = rng.randrange(count) if count and anomaly else None
+    anomalous = False
+    rows, previous, ts = [], genesis, created
+    for seq in range(1, count + 1):
+        ts += timedelta(hours=rng.uniform(5, 12))
+        if not completed and ts >= now:
+            break
+        loc = destination if completed and seq == count else rng.choice(locations)
+        notes = ''
+        if seq - 1 == anomaly_stop:
+            (low, high), notes = ANOMALIES[anomaly]
+            fuel += rng.uniform(low, high)
+            anomalous = True
+        else:
+            fuel -= rng.uniform(50, 250)
+        fuel = round(max(0.0, fuel), 2)
+        officer, image_path, timestamp = rng.choice(officers[loc]), EVIDENCE_PATH if completed else None, \
+            ts.isoformat(' ')
+        signature = checkpoint_signature(v_id, loc, officer, timestamp, fuel, notes, image_path, None, previous)
+        rows.append((v_id, seq, loc, officer, timestamp, fuel, notes, image_path, previous, signature))
+        previous = signature
+    return rows, anomalous
+
+
+def _generate(spec):
+    """Builds and signs one batch of journeys; returns (truck rows, vehicle rows, checkpoint rows, scenario counts).
+
+    A journey counts once for being overdue and once for the anomaly it
+    carries, and as 'normal' if neither applies.
+    """
+    rng = random.Random(spec['seed'] * 1_000_003 + spec['start'])
+    now, total, fleet = datetime.fromisoformat(spec['now']), spec['total'], spec['fleet']
+    officers, invoices = spec['officers'], spec['invoices']
+    first_created = now - timedelta(days=spec['days'])
+    span = timedelta(days=spec['days']) - OVERDUE_AFTER
+    trucks, vehicles, checkpoints, scenarios = [], [], [], {}
+    for i in range(spec['start'], spec['start'] + spec['count']):
+        v_id, truck_id = spec['first_id'] + i, spec['truck_base'] + i % fleet
+        plate = f"SYN-{truck_id:07d}"
+        # Only a truck's last trip can still be on the road, so no plate has two active journeys.
+        active = i >= total - fleet and rng.random() < spec['active_share']
+        overdue = active and rng.random() < spec['overdue_share']
+        if active:
+            created = now - timedelta(days=rng.uniform(3.5, 10) if overdue else rng.uniform(0.1, 2.9))
+        else:
+            created = first_created + span * ((i + rng.random()) / total)
+        anomaly = rng.choice(tuple(ANOMALIES)) if rng.random() < spec['anomaly_share'] else None
+        origin, destination = rng.sample(tuple(officers), 2)
+        driver = rng.choice(DRIVERS)
+        invoice, amount = rng.choice(invoices)
+        fuel = float(rng.choice((20000, 35000, 45000)))
+        created_at = created.isoformat(' ')
+        genesis = hashlib.sha256(f"{plate}{driver}{created_at}".encode()).hexdigest()
+        if i < fleet:
+            trucks.append((truck_id, plate, created_at))
+        vehicles.append((v_id, plate, driver, f"NAT{rng.randint(100000, 999999)}", rng.choice(NATIONALITIES),
+                         PASSPORT_PATH, rng.choice(COMPANIES), f"{rng.randint(100, 999)}-{rng.randint(100, 999)}",
+                         invoice, amount, origin, destination, fuel, created_at,
+                         'in_transit' if active else 'completed', genesis, truck_id))
+        rows, anomalous = _stops(rng, v_id, genesis, destination, fuel, created, officers, not active, anomaly, now)
+        checkpoints += rows
+        counted = (['overdue'] if overdue else []) + ([anomaly] if anomalous else [])
+        for scenario in counted or ['normal']:
+            scenarios[scenario] = scenarios.get(scenario, 0) + 1
+    return trucks, vehicles, checkpoints, scenarios
+
+
+def _reference_data(conn, invoice_count):
+    """Officers by location and (invoice, amount) pairs, creating them if the database has none."""
+    if not conn.execute(queries.ALL_OFFICERS).fetchone():
+        conn.executemany(queries.INSERT_OFFICER,
+                         [(f"Officer {loc} {n}", f"SY{i * OFFICERS_PER_LOCATION + n:04d}", loc)
+                          for i, loc in enumerate(LOCATIONS) for n in range(1, OFFICERS_PER_LOCATION + 1)])
+    if not conn.execute(queries.INVOICE_LIST).fetchone():
+        conn.executemany(queries.INSERT_PAYMENT, [(f"SYN{n:06d}", round(random.uniform(5000.0, 50000.0), 2))
+                                                  for n in range(1, invoice_count + 1)])
+    conn.commit()
+    officers = {}
+    for loc, name, _ in conn.execute(queries.ALL_OFFICERS):
+        officers.setdefault(loc, []).append(name)
+    if len(officers) < 3:
+        raise ValueError("Officers must be posted at three or more locations to generate routes.")
+    return officers, conn.execute(queries.INVOICE_LIST).fetchall()
+
+
+def seed(db_file, journeys, days=365, trips_per_truck=8, active_share=0.3, overdue_share=0.1, anomaly_share=0.05,
+         invoices=1000, batch_size=BATCH_SIZE, workers=None, seed=1, progress=None):
+    """Appends synthetic journeys to db_file and returns a summary of what was written."""
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        for name, value in CONNECTION_PRAGMAS:
+            conn.execute(f"PRAGMA {name} = {value}")
+        apply_migrations(conn)
+        officers, invoice_rows = _reference_data(conn, invoices)
+        fleet = max(1, journeys // trips_per_truck)
+        common = {'seed': seed, 'now': datetime.now().isoformat(' '), 'total': journeys, 'fleet': fleet,
+                  'days': days, 'active_share': active_share, 'overdue_share': overdue_share,
+                  'anomaly_share': anomaly_share, 'officers': officers, 'invoices': invoice_rows,
+                  'first_id': (conn.execute(queries.LAST_JOURNEY_ID).fetchone()[0] or 0) + 1,
+                  'truck_base': (conn.execute(queries.LAST_TRUCK_ID).fetchone()[0] or 0) + 1}
+        specs = (dict(common, start=start, count=min(batch_size, journeys - start))
+                 for start in range(0, journeys, batch_size))
+        summary = {'journeys': 0, 'checkpoints': 0, 'scenarios': {}}
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers) as pool:
+            # A bounded window of batches in flight keeps memory flat when inserting is the bottleneck.
+            pending = deque(pool.submit(_generate, spec) for spec in itertools.islice(specs, workers * 2))
+            while pending:
+                trucks, vehicles, checkpoints, scenarios = pending.popleft().result()
+                pending.extend(pool.submit(_generate, spec) for spec in itertools.islice(specs, 1))
+                begin_immediate(conn)
+                conn.executemany(queries.INSERT_SYNTHETIC_TRUCK, trucks)
+                conn.executemany(queries.INSERT_SYNTHETIC_VEHICLE, vehicles)
+                conn.executemany(queries.INSERT_SEED_CHECKPOINT, checkpoints)
+                conn.commit()
+                summary['journeys'] += len(vehicles)
+                summary['checkpoints'] += len(checkpoints)
+                for scenario, n in scenarios.items():
+                    summary['scenarios'][scenario] = summary['scenarios'].get(scenario, 0) + n
+                if progress:
+                    progress(summary['journeys'], journeys)
+        # Running workers reload their in-memory indexes instead of missing the bulk insert.
+        ChangeFeed.record(conn, 'resync')
+        conn.commit()
+    finally:
+        conn.close()
+    summary['seconds'] = round(time.perf_counter() - started, 1)
+    summary['journeys_per_second'] = round(summary['journeys'] / max(summary['seconds'], 0.1))
+    return summary
+
+
+# --- traffic replay ---
+def _percentile(values, fraction):
+    return values[int(fraction * (len(values) - 1))] if values else None
+
+
+def _passport_png():
+    buffer = io.BytesIO()
+    PILImage.new('RGB', (100, 120), color='grey').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TrafficReplay:
+    """Concurrent register and checkpoint traffic against a running app."""
+
+    def __init__(self, url, auth, db_file, checkpoint_share=0.8, arrival_share=0.25):
+        self.url = url.rstrip('/')
+        self.auth = auth
+        self.checkpoint_share = checkpoint_share
+        self.arrival_share = arrival_share
+        self._lock = threading.Lock()
+        self._plates = itertools.count(1)
+        self._passport = _passport_png()
+        self._samples = []
+        with closing(sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)) as conn:
+            self.officers = {}
+            for loc, name, _ in conn.execute(queries.ALL_OFFICERS):
+                self.officers.setdefault(loc, []).append(name)
+            self.invoices = conn.execute(queries.INVOICE_LIST).fetchall()
+            self._active = [list(row) for row in conn.execute(queries.ACTIVE_JOURNEY_ROUTES)]
+
+    def _register(self, session, rng):
+        upload = session.post(f"{self.url}/upload", files={'file': ('passport.png', self._passport, 'image/png')})
+        upload.raise_for_status()
+        plate = f"LG-{os.getpid()}-{next(self._plates)}"
+        origin, destination = rng.sample(tuple(self.officers), 2)
+        invoice, amount = rng.choice(self.invoices)
+        fuel = float(rng.choice((20000, 35000, 45000)))
+        states = {'plate-number': plate, 'driver-name': rng.choice(DRIVERS), 'driver-id': f"NAT{rng.randint(1, 10**6)}",
+                  'driver-nationality': rng.choice(NATIONALITIES), 'passport-upload': upload.json(),
+                  'company-name': rng.choice(COMPANIES), 'company-till': "100-200", 'invoice-number': invoice,
+                  'amount-paid': amount, 'origin': origin, 'destination': destination, 'fuel-volume': fuel}
+        body = {'output': 'register-output.children', 'outputs': {'id': 'register-output', 'property': 'children'},
+                'inputs': [{'id': 'register-btn', 'property': 'n_clicks', 'value': 1}],
+                'state': [{'id': component, 'property': 'data' if component == 'passport-upload' else 'value',
+                           'value': value} for component, value in states.items()],
+                'changedPropIds': ['register-btn.n_clicks']}
+        response = session.post(f"{self.url}/_dash-update-component", json=body)
+        ok = response.ok and 'Success!' in response.text
+        if ok:
+            with self._lock:
+                self._active.append([plate, destination, fuel])
+        return ok
+
+    def _checkpoint(self, session, rng):
+        with self._lock:
+            if not self._active:
+                return None
+            journey = self._active.pop(rng.randrange(len(self._active)))
+        plate, destination, fuel = journey
+        arrives = rng.random() < self.arrival_share
+        loc = destination if arrives else rng.choice([loc for loc in self.officers if loc != destination])
+        journey[2] = round(max(0.0, fuel - rng.uniform(50, 250)), 2)
+        record = {'plate': plate, 'loc': loc, 'officer': rng.choice(self.officers[loc]), 'fuel': journey[2]}
+        response = session.post(f"{self.url}/api/checkpoints", json=[record])
+        ok = response.ok and response.json()['results'][0]['status'] == 'created'
+        if not (ok and arrives):
+            with self._lock:
+                self._active.append(journey)
+        return ok
+
+    def _client(self, deadline, seed):
+        rng = random.Random(seed)
+        samples = []
+        with requests.Session() as session:
+            session.auth = self.auth
+            while time.monotonic() < deadline:
+                operation = 'checkpoint' if rng.random() < self.checkpoint_share else 'register'
+                started = time.perf_counter()
+                try:
+                    ok = getattr(self, f"_{operation}")(session, rng)
+                except (requests.RequestException, ValueError, KeyError):
+                    ok = False
+                if ok is None:
+                    operation, ok = 'register', self._register(session, rng)
+                samples.append((operation, time.perf_counter() - started, ok))
+        with self._lock:
+            self._samples += samples
+
+    def run(self, duration=60, concurrency=16, seed=1):
+        """Runs the clients for duration seconds; returns throughput and latency per operation."""
+        deadline = time.monotonic() + duration
+        started = time.perf_counter()
+        clients = [threading.Thread(target=self._client, args=(deadline, seed + n)) for n in range(concurrency)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - started
+        results = {}
+        for operation in ('register', 'checkpoint'):
+            timings = sorted(t for op, t, _ in self._samples if op == operation)
+            errors = sum(1 for op, _, ok in self._samples if op == operation and not ok)
+            results[operation] = {'requests': len(timings), 'errors': errors,
+                                  'per_second': round(len(timings) / elapsed, 1),
+                                  **{f"p{int(p * 100)}_ms": round(_percentile(timings, p) * 1e3, 1) if timings else None
+                                     for p in (0.5, 0.95, 0.99)}}
+        return {'seconds': round(elapsed, 1), 'concurrency': concurrency, 'operations': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic ledger data and traffic for capacity tests.")
+    parser.add_argument('--db', default=DEFAULT_DB_FILE, help="ledger database file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    seeding = commands.add_parser('seed', help="append synthetic journeys with valid hash chains")
+    seeding.add_argument('--journeys', type=int, required=True, help="number of journeys to generate")
+    seeding.add_argument('--days', type=int, default=365, help="days of history to spread them over")
+    seeding.add_argument('--trips', type=int, default=8, help="journeys per truck")
+    seeding.add_argument('--anomalies', type=float, default=0.05, help="share of journeys with a fuel anomaly")
+    seeding.add_argument('--batch', type=int, default=BATCH_SIZE, help="journeys per insert transaction")
+    seeding.add_argument('--workers', type=int, default=None, help="signing processes (default: CPU count)")
+    seeding.add_argument('--seed', type=int, default=1, help="random seed")
+    replay = commands.add_parser('replay', help="drive a running app with concurrent registrations and checkpoints")
+    replay.add_argument('--url', default=DEFAULT_URL, help="base URL of the app")
+    replay.add_argument('--user', required=True, help="basic auth user")
+    replay.add_argument('--password', required=True, help="basic auth password")
+    replay.add_argument('--duration', type=float, default=60, help="seconds to run")
+    replay.add_argument('--concurrency', type=int, default=16, help="concurrent clients")
+    replay.add_argument('--checkpoints', type=float, default=0.8, help="share of requests that log a checkpoint")
+    replay.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == 'seed':
+        summary = seed(args.db, args.journeys, days=args.days, trips_per_truck=args.trips,
+                       anomaly_share=args.anomalies, batch_size=args.batch, workers=args.workers, seed=args.seed,
+                       progress=lambda done, total: print(f"\r{done}/{total} journeys", end='', file=sys.stderr))
+        print(file=sys.stderr)
+        print(f"Inserted {summary['journeys']} journeys and {summary['checkpoints']} checkpoints in "
+              f"{summary['seconds']} s ({summary['journeys_per_second']} journeys/s).")
+        print(', '.join(f"{scenario}: {n}" for scenario, n in sorted(summary['scenarios'].items())))
+        return 0
+
+    results = TrafficReplay(args.url, (args.user, args.password), args.db, args.checkpoints).run(
+        args.duration, args.concurrency)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'operation':<12}{'requests':>10}{'errors':>8}{'per s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for operation, stats in results['operations'].items():
+        print(f"{operation:<12}{stats['requests']:>10}{stats['errors']:>8}{stats['per_second']:>8}"
+              f"{stats['p50_ms']!s:>10}{stats['p95_ms']!s:>10}{stats['p99_ms']!s:>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""Daily Merkle roll-ups over the tip hashes of the ledger's journeys.
+
+Each roll-up hashes the chain tips (last checkpoint signature, or genesis
+hash) of the journeys that were registered or extended since the previous
+roll-up into a Merkle tree, whose first leaf links the previous roll-up's
+root, and stores the root with the leaves it was built from. The roll-ups
+thus form a chain of their own: a journey's tip stays anchored in the
+roll-up that first contained it, archived or not, and every later root
+commits to it through the link. A journey report prints the root of that
+roll-up together with an inclusion proof of log2(leaves) hashes, so anyone
+holding the published roots can check the report against the whole ledger
+without a copy of the database.
+
+Leaves, links and inner nodes are hashed with distinct prefixes, and an
+unpaired node is promoted to the next level unchanged rather than
+duplicated.
+
+Run the roll-up once a day, e.g. from cron:
+
+    python merkle.py build [--day YYYY-MM-DD] [--db FILE]
+    python merkle.py prove JOURNEY_ID [--db FILE]
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+import queries
+from database import apply_migrations
+from ledger import begin_immediate
+
+DEFAULT_DB_FILE = 'fuel_transport_ledger_v7.6_final.db'
+
+# Trees of recent roll-ups, keyed by (day, root); a roll-up never changes once built.
+_levels_cache = {}
+_levels_lock = threading.Lock()
+_LEVELS_CACHE_SIZE = 4
+
+
+def leaf_hash(vehicle_id, tip_hash):
+    return hashlib.sha256(b'\x00' + f"{vehicle_id}:{tip_hash}".encode()).digest()
+
+
+def link_hash(previous_root):
+    return hashlib.sha256(b'\x02' + bytes.fromhex(previous_root)).digest()
+
+
+def _node_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def build_levels(leaves):
+    """Returns every level of the tree, from the leaf hashes up to the root."""
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def inclusion_proof(levels, index):
+    """Sibling hashes from a leaf to the root, as (side, hex) pairs where side is the sibling's side."""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(('L' if sibling < index else 'R', level[sibling].hex()))
+        index //= 2
+    return proof
+
+
+def verify_inclusion(vehicle_id, tip_hash, proof, root):
+    """True if the proof links the journey's tip to the given root (hex)."""
+    node = leaf_hash(vehicle_id, tip_hash)
+    for side, sibling in proof:
+        sibling = bytes.fromhex(sibling)
+        node = _node_hash(sibling, node) if side == 'L' else _node_hash(node, sibling)
+    return node.hex() == root
+
+
+def _first_leaves(previous_root):
+    return [link_hash(previous_root)] if previous_root else []
+
+
+def build_rollup(conn, day=None):
+    """Builds and stores the roll-up for day (default today) unless it exists. Returns (day, root, leaf_count).
+
+    Only the journeys whose tip changed since the previous roll-up are read,
+    found through the checkpoint and journey ids it recorded as covered.
+    """
+    day = day or datetime.now().strftime('%Y-%m-%d')
+    begin_immediate(conn)
+    try:
+        existing = conn.execute(queries.ROLLUP_FOR_DAY, (day,)).fetchone()
+        if existing:
+            conn.rollback()
+            return day, existing[0], existing[1]
+        previous_day, previous_root, checkpoint_id, vehicle_id = (
+            conn.execute(queries.LAST_ROLLUP).fetchone() or (None, None, None, None))
+        if previous_day and previous_day > day:
+            raise ValueError(f"The roll-up for {day} cannot follow the one for {previous_day}.")
+        last_checkpoint_id, last_vehicle_id = conn.execute(queries.LEDGER_HIGH_WATER).fetchone()
+        tips = conn.execute(queries.CHANGED_TIPS, {'checkpoint_id': checkpoint_id or 0,
+                                                   'vehicle_id': vehicle_id or 0}).fetchall()
+        first = _first_leaves(previous_root)
+        levels = build_levels(first + [leaf_hash(v_id, tip) for v_id, tip in tips])
+        root = levels[-1][0].hex() if levels[0] else hashlib.sha256(b'').hexdigest()
+        conn.execute(queries.INSERT_ROLLUP, (day, root, len(levels[0]), previous_root, last_checkpoint_id or 0,
+                                             last_vehicle_id or 0, datetime.now()))
+        conn.executemany(queries.INSERT_MERKLE_LEAF,
+                         ((day, len(first) + i, v_id, tip) for i, (v_id, tip) in enumerate(tips)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    _remember_levels(day, root, levels)
+    return day, root, len(levels[0])
+
+
+def _remember_levels(day, root, levels):
+    with _levels_lock:
+        _levels_cache[(day, root)] = levels
+        while len(_levels_cache) > _LEVELS_CACHE_SIZE:
+            del _levels_cache[next(iter(_levels_cache))]
+
+
+def _levels_for(conn, day, root):
+    with _levels_lock:
+        levels = _levels_cache.get((day, root))
+    if levels is None:
+        previous_root = conn.execute(queries.ROLLUP_FOR_DAY, (day,)).fetchone()[2]
+        levels = build_levels(_first_leaves(previous_root) + [
+            leaf_hash(v_id, tip) for v_id, tip in conn.execute(queries.ROLLUP_DAY_LEAVES, (day,))])
+        _remember_levels(day, root, levels)
+    return levels
+
+
+def journey_proof(conn, vehicle_id, tip_hash):
+    """Inclusion proof of a journey's tip in the first roll-up that contains it, or None if none does yet."""
+    anchor = conn.execute(queries.JOURNEY_ANCHOR, (vehicle_id, tip_hash)).fetchone()
+    if not anchor or anchor[0] is None:
+        return None
+    day, leaf_index, root, leaf_count = anchor
+    proof = inclusion_proof(_levels_for(conn, day, root), leaf_index)
+    return {'day': day, 'root': root, 'leaf_index': leaf_index, 'leaf_count': leaf_count,
+            'vehicle_id': vehicle_id, 'tip_hash': tip_hash, 'proof': proof}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merkle roll-ups of the fuel ledger's journey chains.")
+    parser.add_argument('--db', default=DEFAULT_DB_FILE, help="ledger database file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="build the roll-up for a day (default today)")
+    build.add_argument('--day', help="YYYY-MM-DD")
+    prove = commands.add_parser('prove', help="print a journey's inclusion proof as JSON")
+    prove.add_argument('journey_id', type=int)
+    args = parser.parse_args(argv)
+
+    with sqlite3.connect(args.db, timeout=30) as conn:
+        apply_migrations(conn)
+        if args.command == 'build':
+            try:
+                day, root, count = build_rollup(conn, args.day)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                return 1
+            print(f"Roll-up {day}: root {root} over {count} leaves.")
+            return 0
+        key = conn.execute(queries.REPORT_KEY, (args.journey_id,)).fetchone()
+        proof = journey_proof(conn, args.journey_id, key[1]) if key else None
+        if proof is None:
+            print(f"Journey {args.journey_id} is not in any roll-up yet.", file=sys.stderr)
+            return 1
+        print(json.dumps(proof, indent=2))
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""In-memory index of the plates of in-transit journeys, for the checkpoint form.
+
+The plate box suggests matching plates and shows the journey's last reading
+on every keystroke. Both are answered from a sorted list of plates (prefix
+search by bisection) and a dict of each journey's last checkpoint, loaded
+once per worker process. The index subscribes to the change feed and
+reloads only the journeys named by new events, so registrations and
+checkpoints written by any worker show up within the feed's poll interval.
+"""
+
+import bisect
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+import queries
+
+
+class PlateIndex:
+    """Prefix index of active plates with each journey's last reading."""
+
+    def __init__(self, db_file, change_feed):
+        self.db_file = db_file
+        self.change_feed = change_feed
+        self._lock = threading.Lock()
+        self._pid = None
+        self._events = None
+        self._plates = []
+        self._journeys = {}
+        self._plate_of = {}
+        self._stats = {'loads': 0, 'updates': 0, 'lookups': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True)
+        conn.execute("PRAGMA busy_timeout = 5000")
+        return conn
+
+    def _load(self):
+        """Reads every in-transit journey. Subscribes first, so no change between the two is missed."""
+        if self._events is not None:
+            self.change_feed.unsubscribe(self._events)
+        self._events = self.change_feed.subscribe()
+        conn = self._connect()
+        try:
+            rows = conn.execute(queries.ACTIVE_PLATE_SUMMARIES).fetchall()
+        finally:
+            conn.close()
+        self._journeys, self._plate_of = {}, {}
+        for row in rows:
+            self._store(row)
+        self._plates = sorted(self._journeys)
+        self._stats['loads'] += 1
+
+    def _store(self, row):
+        v_id, plate, status, initial_fuel, last_stop, last_time, last_fuel = row
+        if status != 'in_transit':
+            return False
+        previous = self._journeys.get(plate)
+        if previous and previous['vehicle_id'] != v_id:
+            self._plate_of.pop(previous['vehicle_id'], None)
+        self._journeys[plate] = {'vehicle_id': v_id, 'plate': plate, 'initial_fuel': initial_fuel,
+                                 'last_stop': last_stop, 'last_time': last_time, 'last_fuel': last_fuel}
+        self._plate_of[v_id] = plate
+        return True
+
+    def _apply_changes(self):
+        """Reloads the journeys touched by change events since the last call. Hold self._lock."""
+        vehicle_ids = set()
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if event['topic'] == 'resync':
+                self._load()
+                return
+            if event['vehicle_id'] is not None:
+                vehicle_ids.add(event['vehicle_id'])
+        if not vehicle_ids:
+            return
+        conn = self._connect()
+        try:
+            rows = conn.execute(queries.PLATE_SUMMARIES_FOR_IDS, (json.dumps(sorted(vehicle_ids)),)).fetchall()
+        finally:
+            conn.close()
+        for v_id in vehicle_ids:
+            plate = self._plate_of.pop(v_id, None)
+            if plate is not None:
+                del self._journeys[plate]
+                del self._plates[bisect.bisect_left(self._plates, plate)]
+        for row in rows:
+            known = row[1] in self._journeys
+            if self._store(row) and not known:
+                bisect.insort(self._plates, row[1])
+        self._stats['updates'] += len(vehicle_ids)
+
+    def _current(self):
+        if self._pid != os.getpid():
+            # A forked worker gets its own change feed subscription.
+            self._pid, self._events = os.getpid(), None
+            self._load()
+        else:
+            self._apply_changes()
+
+    def complete(self, prefix, limit=10):
+        """Active plates starting with prefix (case-insensitive), in order."""
+        prefix = (prefix or '').strip().upper()
+        with self._lock:
+            self._current()
+            start = bisect.bisect_left(self._plates, prefix)
+            matches = []
+            for plate in self._plates[start:start + limit]:
+                if not plate.startswith(prefix):
+                    break
+                matches.append(plate)
+            self._stats['lookups'] += 1
+            return matches
+
+    def lookup(self, plate):
+        """The in-transit journey for a plate with its last reading, or None."""
+        with self._lock:
+            self._current()
+            self._stats['lookups'] += 1
+            journey = self._journeys.get((plate or '').strip().upper())
+            return dict(journey) if journey else None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, plates=len(self._plates), pid=self._pid)
@@ -0,0 +1,258 @@
+"""SQL statements issued by the ledger app.
+
+Every statement is registered with the database layer so that the startup
+query-plan audit can check it against the live schema.
+"""
+
+from database import register_query as q
+
+# --- Seeder ---
+COUNT_OFFICERS = q("SELECT COUNT(*) FROM officers", allow_scan=True)
+INSERT_OFFICER = q("INSERT INTO officers (name, badge_number, checkpoint_location) VALUES (?, ?, ?)")
+INSERT_PAYMENT = q("INSERT OR IGNORE INTO payment_validation (invoice_number, amount_paid) VALUES (?, ?)")
+ALL_PAYMENTS = q("SELECT invoice_number, amount_paid FROM payment_validation", allow_scan=True)
+INSERT_SEED_VEHICLE = q('''INSERT INTO vehicles (plate_number, driver_name, driver_id, driver_nationality,
+                         driver_passport_image_path, company_name, company_till_number, invoice_number,
+                         amount_paid, origin, destination, fuel_volume, created_at, status, unique_hash)
+                         VALUES (:plate_number, :driver_name, :driver_id, :driver_nationality, :driver_passport_image_path,
+                         :company_name, :company_till_number, :invoice_number, :amount_paid, :origin, :destination,
+                         :fuel_volume, :created_at, :status, :unique_hash)''')
+VEHICLE_IDS_BY_PLATE = q("SELECT id, plate_number FROM vehicles")
+INSERT_SEED_CHECKPOINT = q('''INSERT INTO checkpoints (vehicle_id, seq, checkpoint_name, officer_name, timestamp,
+                         fuel_volume_check, notes, image_path, previous_hash, signature_hash)
+                         VALUES (?,?,?,?,?,?,?,?,?,?)''')
+# Synthetic journeys from loadgen.py, which signs the chains before inserting and so assigns the ids itself.
+INSERT_SYNTHETIC_VEHICLE = q('''INSERT INTO vehicles (id, plate_number, driver_name, driver_id, driver_nationality,
+                              driver_passport_image_path, company_name, company_till_number, invoice_number,
+                              amount_paid, origin, destination, fuel_volume, created_at, status, unique_hash,
+                              truck_id) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)''')
+INSERT_SYNTHETIC_TRUCK = q("INSERT INTO trucks (id, plate_number, first_seen_at) VALUES (?, ?, ?)")
+LAST_TRUCK_ID = q("SELECT MAX(id) FROM trucks")
+# In-transit journeys with their last fuel reading, or the loaded volume before the first checkpoint.
+ACTIVE_JOURNEY_ROUTES = q('''SELECT v.plate_number, v.destination, COALESCE((SELECT c.fuel_volume_check
+                             FROM checkpoints c WHERE c.vehicle_id = v.id ORDER BY c.seq DESC LIMIT 1), v.fuel_volume)
+                             FROM vehicles v WHERE v.status = 'in_transit' ORDER BY v.id''')
+
+# --- Reference data ---
+# Bumped by triggers on officers and payment_validation; see refdata.py.
+REFERENCE_VERSION = q("SELECT version FROM reference_version WHERE id = 1")
+ALL_OFFICERS = q("SELECT checkpoint_location, name, badge_number FROM officers ORDER BY checkpoint_location, name")
+INVOICE_LIST = q("SELECT invoice_number, amount_paid FROM payment_validation ORDER BY invoice_number")
+PAYMENT_FOR_INVOICE = q("SELECT amount_paid FROM payment_validation WHERE invoice_number = ?")
+# Officers posted at any of the locations passed as a JSON array.
+OFFICER_POSTINGS = q('''SELECT checkpoint_location, name FROM officers
+                        WHERE checkpoint_location IN (SELECT value FROM json_each(?))''')
+
+# --- Journeys ---
+JOURNEY_BY_ID = q('''SELECT id, plate_number, driver_name, driver_id, driver_nationality, driver_passport_image_path,
+                   company_name, company_till_number, invoice_number, amount_paid, origin, destination, fuel_volume,
+                   created_at, status, unique_hash, truck_id FROM vehicles WHERE id = ?''')
+JOURNEY_CHECKPOINTS = q("SELECT * FROM checkpoints WHERE vehicle_id = ? ORDER BY seq")
+ACTIVE_JOURNEY_FUEL = q("SELECT id, fuel_volume FROM vehicles WHERE plate_number = ? AND status = 'in_transit'")
+INSERT_VEHICLE = q('''INSERT INTO vehicles (plate_number, driver_name, driver_id, driver_nationality, driver_passport_image_path,
+                            company_name, company_till_number, invoice_number, amount_paid, origin, destination, fuel_volume, created_at, status, unique_hash)
+                            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)''')
+# Journeys made by the truck of the given journey, the given one included.
+TRUCK_TRIP_COUNT = q("SELECT COUNT(*) FROM vehicles WHERE truck_id = (SELECT truck_id FROM vehicles WHERE id = ?)")
+COMPLETE_JOURNEY = q("UPDATE vehicles SET status = 'completed' WHERE id = ?")
+# The plate, the hash at the tip of the journey's chain and the first Merkle roll-up containing that tip,
+# which together identify a rendered report.
+REPORT_KEY = q('''SELECT j.plate_number, j.tip, (SELECT MIN(m.day) FROM merkle_leaves m
+                    WHERE m.vehicle_id = j.id AND m.tip_hash = j.tip)
+                    FROM (SELECT v.id, v.plate_number, COALESCE((SELECT c.signature_hash FROM checkpoints c
+                          WHERE c.vehicle_id = v.id ORDER BY c.seq DESC LIMIT 1), v.unique_hash) AS tip
+                          FROM vehicles v WHERE v.id = ?) j''')
+COMPANY_NAMES = q("SELECT DISTINCT company_name FROM vehicles ORDER BY company_name")
+# Completed journeys for a bulk report export; company and destination are optional filters.
+EXPORT_JOURNEYS = q('''SELECT j.id, j.plate_number, j.created_at, j.tip, (SELECT MIN(m.day) FROM merkle_leaves m
+                         WHERE m.vehicle_id = j.id AND m.tip_hash = j.tip)
+                         FROM (SELECT v.id, v.plate_number, v.created_at, COALESCE((SELECT c.signature_hash
+                               FROM checkpoints c WHERE c.vehicle_id = v.id ORDER BY c.seq DESC LIMIT 1),
+                               v.unique_hash) AS tip
+                               FROM vehicles v WHERE v.status = 'completed' AND v.created_at >= :start
+                               AND v.created_at < :end AND (:company IS NULL OR v.company_name = :company)
+                               AND (:destination IS NULL OR v.destination = :destination)) j
+                         ORDER BY j.created_at''')
+RECENT_JOURNEYS = q(
+    "SELECT plate_number, driver_name, origin, destination, fuel_volume, created_at, status FROM vehicles ORDER BY created_at DESC LIMIT 10")
+
+# --- Archive ---
+LAST_JOURNEY_ID = q("SELECT MAX(id) FROM vehicles")
+# Completed journeys registered before :cutoff, in registration order after the last one seen.
+ARCHIVE_CANDIDATES = q('''SELECT id, unique_hash, substr(created_at, 1, 7), created_at FROM vehicles
+                          WHERE status = 'completed' AND created_at < :cutoff AND (created_at, id) > (:created_at, :id)
+                          ORDER BY created_at, id LIMIT :limit''')
+INSERT_ARCHIVED_JOURNEY = q('''INSERT OR REPLACE INTO archived_journeys (vehicle_id, month, plate_number, destination,
+                               company_name, created_at, tip_hash, archived_at)
+                               SELECT id, :month, plate_number, destination, company_name, created_at, :tip, :now
+                               FROM vehicles WHERE id = :id''')
+DELETE_JOURNEY_SUBMISSIONS = q(
+    "DELETE FROM checkpoint_submissions WHERE checkpoint_id IN (SELECT id FROM checkpoints WHERE vehicle_id = ?)")
+DELETE_JOURNEY_CHECKPOINTS = q("DELETE FROM checkpoints WHERE vehicle_id = ?")
+DELETE_JOURNEY_WATERMARK = q("DELETE FROM chain_watermarks WHERE vehicle_id = ?")
+DELETE_JOURNEY = q("DELETE FROM vehicles WHERE id = ?")
+# Adds archived journeys (a JSON array of ids) back to the daily completion counts their deletion took them out of.
+RECOUNT_ARCHIVED_COMPLETIONS = q('''INSERT INTO kpi_completed_daily (day, completed)
+                                    SELECT substr(created_at, 1, 10), COUNT(*) FROM archived_journeys
+                                    WHERE vehicle_id IN (SELECT value FROM json_each(?)) GROUP BY 1
+                                    ON CONFLICT (day) DO UPDATE SET completed = completed + excluded.completed''')
+ARCHIVED_JOURNEY_MONTH = q("SELECT month FROM archived_journeys WHERE vehicle_id = ?")
+ARCHIVED_MONTHS_BETWEEN = q(
+    "SELECT DISTINCT month FROM archived_journeys WHERE created_at >= ? AND created_at < ? ORDER BY month")
+ARCHIVED_MONTHS = q("SELECT month, COUNT(*) FROM archived_journeys GROUP BY month")
+ARCHIVED_JOURNEY_TIPS = q("SELECT vehicle_id, tip_hash FROM archived_journeys WHERE month = ?")
+# Catalog rows written before the catalog recorded companies (schema migration 13), and their fill from the month file.
+ARCHIVED_WITHOUT_COMPANY = q("SELECT month, vehicle_id FROM archived_journeys WHERE company_name IS NULL",
+                             allow_scan=True)
+JOURNEY_COMPANIES = q("SELECT id, company_name FROM vehicles WHERE id IN (SELECT value FROM json_each(?))")
+SET_ARCHIVED_COMPANY = q("UPDATE archived_journeys SET company_name = ? WHERE vehicle_id = ?")
+
+# --- Report picker ---
+# One page of the picker, newest first, after the keyset (:before_ts, :before_id) and registered since :since.
+# Each variant seeks on one filter's index; the other filters are checked on the rows it reads. A plate prefix
+# is the most selective filter, but the planner cannot tell from the range alone, so that variant names its index.
+_JOURNEY_PAGE = '''SELECT {id}, plate_number, destination, created_at FROM {source} WHERE {seek}
+                   AND created_at >= :since AND created_at <= :before_ts AND (created_at < :before_ts OR {id} < :before_id)
+                   AND (:plate IS NULL OR (plate_number >= :plate AND plate_number < :plate_end))
+                   AND (:company IS NULL OR company_name = :company)
+                   AND (:destination IS NULL OR destination = :destination)
+                   ORDER BY created_at DESC, {id} DESC LIMIT :limit'''
+_PLATE_SEEK = "plate_number >= :plate AND plate_number < :plate_end"
+COMPLETED_JOURNEY_PAGES = {
+    'plate': q(_JOURNEY_PAGE.format(id='id', source='vehicles INDEXED BY idx_vehicles_plate_status',
+                                    seek=f"{_PLATE_SEEK} AND status = 'completed'")),
+    'company': q(_JOURNEY_PAGE.format(id='id', source='vehicles', seek="company_name = :company AND status = 'completed'")),
+    'destination': q(_JOURNEY_PAGE.format(id='id', source='vehicles',
+                                          seek="destination = :destination AND status = 'completed'")),
+    None: q(_JOURNEY_PAGE.format(id='id', source='vehicles', seek="status = 'completed'")),
+}
+ARCHIVED_JOURNEY_PAGES = {
+    'plate': q(_JOURNEY_PAGE.format(id='vehicle_id', source='archived_journeys INDEXED BY idx_archived_journeys_plate',
+                                    seek=_PLATE_SEEK)),
+    'company': q(_JOURNEY_PAGE.format(id='vehicle_id', source='archived_journeys', seek="company_name = :company")),
+    'destination': q(_JOURNEY_PAGE.format(id='vehicle_id', source='archived_journeys', seek="destination = :destination")),
+    None: q(_JOURNEY_PAGE.format(id='vehicle_id', source='archived_journeys', seek="1")),
+}
+
+# --- Plate index ---
+_PLATE_SUMMARY = '''SELECT v.id, v.plate_number, v.status, v.fuel_volume, c.checkpoint_name, c.timestamp,
+                     c.fuel_volume_check FROM vehicles v LEFT JOIN checkpoints c ON c.id = (
+                         SELECT l.id FROM checkpoints l WHERE l.vehicle_id = v.id ORDER BY l.seq DESC LIMIT 1)'''
+ACTIVE_PLATE_SUMMARIES = q(f"{_PLATE_SUMMARY} WHERE v.status = 'in_transit'")
+# The journeys named by change events, passed as a JSON array of ids.
+PLATE_SUMMARIES_FOR_IDS = q(f"{_PLATE_SUMMARY} WHERE v.id IN (SELECT value FROM json_each(?))")
+
+# --- Checkpoints ---
+LAST_CHECKPOINT_FUEL = q(
+    "SELECT fuel_volume_check FROM checkpoints WHERE vehicle_id = ? ORDER BY seq DESC LIMIT 1")
+# Chain head of each plate's active journey: the last checkpoint's position, signature (or the genesis hash)
+# and time. The plates are passed as a JSON array.
+CHAIN_HEADS = q('''SELECT v.plate_number, v.id, v.destination, COALESCE(c.seq, 0), COALESCE(c.signature_hash, v.unique_hash),
+                   c.timestamp FROM vehicles v LEFT JOIN checkpoints c ON c.id = (
+                       SELECT l.id FROM checkpoints l WHERE l.vehicle_id = v.id ORDER BY l.seq DESC LIMIT 1)
+                   WHERE v.status = 'in_transit' AND v.plate_number IN (SELECT value FROM json_each(?))''')
+LAST_CHECKPOINT_ID = q("SELECT MAX(id) FROM checkpoints")
+INSERT_CHECKPOINT = q('''INSERT INTO checkpoints (vehicle_id, seq, checkpoint_name, officer_name, timestamp,
+                         fuel_volume_check, notes, image_path, image_sha256, previous_hash, signature_hash)
+                         VALUES (?,?,?,?,?,?,?,?,?,?,?)''')
+
+# --- Offline sync ---
+SUBMISSION_BY_KEY = q("SELECT checkpoint_id, signature_hash FROM checkpoint_submissions WHERE idempotency_key = ?")
+LAST_DEVICE_SEQ = q("SELECT MAX(device_seq) FROM checkpoint_submissions WHERE device_id = ?")
+INSERT_SUBMISSION = q('''INSERT INTO checkpoint_submissions (idempotency_key, device_id, device_seq, checkpoint_id,
+                         signature_hash, captured_at, received_at) VALUES (?, ?, ?, ?, ?, ?, ?)''')
+
+# --- Evidence blobs ---
+ADD_BLOB = q("INSERT INTO blobs (digest, size, created_at) VALUES (?, ?, ?) ON CONFLICT (digest) DO NOTHING")
+ALL_BLOBS = q("SELECT digest FROM blobs", allow_scan=True)
+
+# --- Chain verification ---
+# Journeys with checkpoints beyond their verification watermark, or never verified.
+UNVERIFIED_JOURNEYS = q('''SELECT v.id, v.unique_hash, w.checkpoint_id, w.tip_hash FROM vehicles v
+                           LEFT JOIN chain_watermarks w ON w.vehicle_id = v.id
+                           WHERE w.vehicle_id IS NULL OR EXISTS (
+                               SELECT 1 FROM checkpoints c WHERE c.vehicle_id = v.id AND c.id > w.checkpoint_id)''',
+                        allow_scan=True)
+ALL_JOURNEY_GENESIS = q("SELECT id, unique_hash, NULL, NULL FROM vehicles", allow_scan=True)
+CHAIN_ROWS_AFTER = q('''SELECT id, vehicle_id, checkpoint_name, officer_name, timestamp, fuel_volume_check, notes,
+                        image_path, image_sha256, previous_hash, signature_hash FROM checkpoints
+                        WHERE vehicle_id = ? AND id > ? ORDER BY seq''')
+UPSERT_WATERMARK = q('''INSERT INTO chain_watermarks (vehicle_id, checkpoint_id, tip_hash, status, broken_checkpoint_id,
+                        reason, verified_at) VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (vehicle_id) DO UPDATE SET checkpoint_id = excluded.checkpoint_id,
+                        tip_hash = excluded.tip_hash, status = excluded.status,
+                        broken_checkpoint_id = excluded.broken_checkpoint_id, reason = excluded.reason,
+                        verified_at = excluded.verified_at''')
+WATERMARK_SUMMARY = q('''SELECT COUNT(*), COALESCE(SUM(status = 'broken'), 0), MAX(verified_at)
+                         FROM chain_watermarks''', allow_scan=True)
+BROKEN_CHAINS = q('''SELECT w.vehicle_id, v.plate_number, w.broken_checkpoint_id, w.reason, w.verified_at
+                     FROM chain_watermarks w JOIN vehicles v ON v.id = w.vehicle_id
+                     WHERE w.status = 'broken' ORDER BY w.vehicle_id''')
+
+# --- Merkle roll-ups ---
+# Walks the primary key from the newest day, so the scan stops at the first row.
+LAST_ROLLUP = q("SELECT day, root, last_checkpoint_id, last_vehicle_id FROM merkle_rollups ORDER BY day DESC LIMIT 1",
+                allow_scan=True)
+LEDGER_HIGH_WATER = q("SELECT (SELECT MAX(id) FROM checkpoints), (SELECT MAX(id) FROM vehicles)")
+# Tips of the journeys registered or given a checkpoint after the given ids, read through the primary keys.
+CHANGED_TIPS = q('''SELECT v.id, COALESCE((SELECT c.signature_hash FROM checkpoints c WHERE c.vehicle_id = v.id
+                    ORDER BY c.seq DESC LIMIT 1), v.unique_hash) FROM vehicles v
+                    WHERE v.id IN (SELECT id FROM vehicles WHERE id > :vehicle_id
+                                   UNION SELECT vehicle_id FROM checkpoints WHERE id > :checkpoint_id)
+                    ORDER BY v.id''')
+ROLLUP_FOR_DAY = q("SELECT root, leaf_count, previous_root FROM merkle_rollups WHERE day = ?")
+INSERT_ROLLUP = q('''INSERT INTO merkle_rollups (day, root, leaf_count, previous_root, last_checkpoint_id,
+                     last_vehicle_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)''')
+INSERT_MERKLE_LEAF = q("INSERT INTO merkle_leaves (day, leaf_index, vehicle_id, tip_hash) VALUES (?, ?, ?, ?)")
+ROLLUP_DAY_LEAVES = q("SELECT vehicle_id, tip_hash FROM merkle_leaves WHERE day = ? ORDER BY leaf_index")
+# The first roll-up that contains a journey's tip, and the journey's position in it.
+JOURNEY_ANCHOR = q('''SELECT m.day, m.leaf_index, r.root, r.leaf_count FROM merkle_leaves m
+                      JOIN merkle_rollups r ON r.day = m.day
+                      WHERE m.vehicle_id = ? AND m.tip_hash = ? ORDER BY m.day LIMIT 1''')
+# Walks the primary key from the newest day, so the scan stops at the limit.
+RECENT_ROLLUPS = q("SELECT day, root, leaf_count, created_at FROM merkle_rollups ORDER BY day DESC LIMIT ?",
+                   allow_scan=True)
+
+# --- Dashboard ---
+KPI_SUMMARY = q('''SELECT in_transit_count, in_transit_fuel, overdue_count, overdue_cutoff, completed_count
+                   FROM kpi_summary WHERE id = 1''')
+COMPLETED_ON_DAY = q("SELECT completed FROM kpi_completed_daily WHERE day = ?")
+# Moves the overdue boundary forward, counting only the journeys that crossed it since the last move.
+ADVANCE_OVERDUE_CUTOFF = q('''
+    UPDATE kpi_summary SET overdue_count = overdue_count + (
+        SELECT COUNT(*) FROM vehicles WHERE status = 'in_transit'
+        AND created_at >= kpi_summary.overdue_cutoff AND created_at < :cutoff
+    ), overdue_cutoff = :cutoff WHERE id = 1 AND overdue_cutoff < :cutoff''')
+RESET_OVERDUE_CUTOFF = q('''
+    UPDATE kpi_summary SET overdue_count = (
+        SELECT COUNT(*) FROM vehicles WHERE status = 'in_transit' AND created_at < :cutoff
+    ), overdue_cutoff = :cutoff WHERE id = 1''')
+STATUS_TIMELINE = q("SELECT status, created_at FROM vehicles")
+CHECKPOINT_ACTIVITY = q(
+    "SELECT checkpoint_name, COUNT(*) as count FROM checkpoints WHERE timestamp > date('now', '-1 day') GROUP BY checkpoint_name")
+
+# --- Change feed ---
+INSERT_CHANGE = q("INSERT INTO change_feed (topic, vehicle_id, created_at) VALUES (?, ?, ?)")
+LATEST_CHANGE_ID = q("SELECT MAX(id) FROM change_feed")
+CHANGES_SINCE = q("SELECT id, topic, vehicle_id FROM change_feed WHERE id > ? ORDER BY id")
+PRUNE_CHANGES = q("DELETE FROM change_feed WHERE created_at < ?")
+
+# --- Route monitor ---
+# One statement per status filter so the filter is applied by the index rather
+# than in Python. The page of journeys is selected first and then joined to
+# its checkpoints, so the cost of a refresh is bounded by the page size.
+MONITOR_FILTERS = {
+    'all': "1 = 1",
+    'in_transit': "status = 'in_transit' AND created_at >= :overdue_threshold",
+    'overdue': "status = 'in_transit' AND created_at < :overdue_threshold",
+    'completed': "status = 'completed'",
+}
+MONITOR_PAGE = {name: q(f'''
+    WITH page AS (
+        SELECT id, plate_number, origin, destination, fuel_volume, created_at, status FROM vehicles
+        WHERE {where} AND created_at <= :before_ts AND (created_at < :before_ts OR id < :before_id)
+        ORDER BY created_at DESC, id DESC LIMIT :limit
+    )
+    SELECT page.*, c.id AS checkpoint_id, c.checkpoint_name, c.fuel_volume_check, c.timestamp, c.image_path
+    FROM page LEFT JOIN checkpoints c ON c.vehicle_id = page.id
+    ORDER BY page.created_at DESC, page.id DESC, c.seq''') for name, where in MONITOR_FILTERS.items()}
@@ -0,0 +1,83 @@
+"""Versioned in-process cache of the reference data behind the forms' dropdowns.
+
+Checkpoint locations, the officers posted at each location and the invoice
+list only change when an administrator edits the officers or
+payment_validation tables. Triggers (schema migration 12) bump a version
+number on every such edit, whichever tool makes it. Each worker holds one
+snapshot of all three lists and compares its version with the database's
+at most every `recheck` seconds, so page navigation and dropdown callbacks
+are answered from memory and an edit reaches every worker within that
+interval. invalidate() makes this worker check on its next lookup.
+"""
+
+import sqlite3
+import threading
+import time
+
+import queries
+
+
+class ReferenceData:
+    """Snapshot of locations, officers by location and invoices, reloaded when their version changes."""
+
+    def __init__(self, db_file, recheck=5.0):
+        self.db_file = db_file
+        self.recheck = recheck
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._next_check = 0.0
+        self._stats = {'hits': 0, 'checks': 0, 'loads': 0}
+
+    def _load(self, conn):
+        """Reads every list in one read transaction, so the snapshot matches its version."""
+        conn.execute("BEGIN")
+        try:
+            version = conn.execute(queries.REFERENCE_VERSION).fetchone()[0]
+            officers = {}
+            for location, name, badge in conn.execute(queries.ALL_OFFICERS):
+                officers.setdefault(location, []).append((name, badge))
+            invoices = tuple(conn.execute(queries.INVOICE_LIST).fetchall())
+        finally:
+            conn.rollback()
+        self._stats['loads'] += 1
+        return {'version': version, 'locations': tuple(officers),
+                'officers': {location: tuple(names) for location, names in officers.items()}, 'invoices': invoices}
+
+    def _current(self):
+        # Hits are counted under the lock as well, since concurrent increments of the same entry can be lost.
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() < self._next_check:
+                self._stats['hits'] += 1
+            else:
+                conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True)
+                try:
+                    conn.execute("PRAGMA busy_timeout = 5000")
+                    self._stats['checks'] += 1
+                    version = conn.execute(queries.REFERENCE_VERSION).fetchone()[0]
+                    if self._snapshot is None or version != self._snapshot['version']:
+                        self._snapshot = self._load(conn)
+                finally:
+                    conn.close()
+                self._next_check = time.monotonic() + self.recheck
+            return self._snapshot
+
+    def locations(self):
+        """Checkpoint locations with at least one officer, in name order."""
+        return list(self._current()['locations'])
+
+    def officers(self, location):
+        """(name, badge_number) of the officers posted at a location, in name order."""
+        return list(self._current()['officers'].get(location, ()))
+
+    def invoices(self):
+        """(invoice_number, amount_paid) of every recorded payment, in invoice order."""
+        return list(self._current()['invoices'])
+
+    def invalidate(self):
+        """Makes the next lookup compare versions, e.g. right after this worker edited reference data."""
+        self._next_check = 0.0
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return dict(self._stats, version=snapshot['version'] if snapshot else None)
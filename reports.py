@@ -0,0 +1,482 @@
+"""PDF journey reports, rendered in a process pool and cached per chain tip.
+
+A report only changes when a checkpoint is appended to its journey, so the
+rendered bytes are cached under the journey id, the hash at the tip of its
+chain and the day of the Merkle roll-up that first anchored that tip.
+Completed journeys are therefore rendered at most twice: once when they
+finish and once after the next roll-up. Rendering runs
+in worker processes so that a download never holds a web worker for the
+time it takes to build the document. Bulk exports reuse the same pool and
+cache and stream the reports into a ZIP as they finish. Journeys moved to
+the monthly archive files are read from there (see archive.py).
+"""
+
+import base64
+import csv
+import glob
+import io
+import json
+import multiprocessing
+import os
+import re
+import secrets
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import closing
+
+import pandas as pd
+import qrcode
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, Flowable
+
+import queries
+import repository
+from anomalies import checkpoint_deltas
+from archive import ARCHIVE_DIR, LedgerArchive
+from images import variant_path
+from integrity import CHAIN_COLUMNS, verify_chain
+from merkle import journey_proof
+
+LOGO_PATH = os.path.join('assets', 'logo.PNG')
+# Bulk export progress files are kept this long, in seconds.
+EXPORT_RETENTION = 24 * 3600
+
+
+def generate_qr_code_b64(data):
+    """Generates a QR code and returns it as a Base64 encoded string."""
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class CHRL(Flowable):
+    """A custom ReportLab flowable for a horizontal line."""
+
+    def __init__(self, width, thickness=1, color=colors.black):
+        Flowable.__init__(self)
+        self.width = width
+        self.thickness = thickness
+        self.color = color
+
+    def draw(self):
+        self.canv.setStrokeColor(self.color)
+        self.canv.setLineWidth(self.thickness)
+        self.canv.line(0, 0, self.width, 0)
+
+
+PDF_SEVERITY_STYLES = {
+    'increase': (colors.red, "<b>ANOMALY (INCREASE)</b>"),
+    'critical': (colors.darkred, "<b>CRITICAL LOSS</b>"),
+    'suspicious': (colors.orange, "<b>SUSPICIOUS LOSS</b>"),
+    'normal': (colors.darkgreen, "Normal Consumption"),
+}
+
+
+def create_journey_pdf(conn, journey_id, logo_path=LOGO_PATH):
+    """Generates a comprehensive PDF report for a given journey ID."""
+    try:
+        vehicle = repository.journey(conn, journey_id)
+        if vehicle is None:
+            raise KeyError(f"Journey {journey_id} does not exist.")
+        checkpoints = pd.read_sql_query(queries.JOURNEY_CHECKPOINTS, conn, params=[journey_id])
+
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter, leftMargin=0.5 * inch, rightMargin=0.5 * inch,
+                                topMargin=0.5 * inch, bottomMargin=0.5 * inch)
+
+        styles = getSampleStyleSheet()
+        styles.add(ParagraphStyle(name='ReportTitle', fontSize=22, fontName='Helvetica-Bold', alignment=TA_RIGHT,
+                                  textColor=colors.HexColor("#0D47A1")))
+        styles.add(ParagraphStyle(name='ReportSubtitle', fontSize=11, fontName='Helvetica-Oblique', alignment=TA_RIGHT,
+                                  textColor=colors.grey))
+        styles.add(
+            ParagraphStyle(name='SectionHeader', fontSize=16, fontName='Helvetica-Bold', spaceBefore=24, spaceAfter=12,
+                           textColor=colors.HexColor("#0D47A1")))
+        styles.add(ParagraphStyle(name='DetailKey', fontSize=9, fontName='Helvetica-Bold'))
+        styles.add(ParagraphStyle(name='DetailValue', fontSize=11, fontName='Helvetica'))
+        styles.add(ParagraphStyle(name='NotesStyle', fontSize=9, fontName='Helvetica', leading=12))
+        styles.add(ParagraphStyle(name='FooterText', fontSize=8, fontName='Helvetica', alignment=TA_CENTER,
+                                  textColor=colors.grey))
+        styles.add(ParagraphStyle(name='RightAlign', alignment=TA_RIGHT))
+        # Style for the hash values to make them smaller
+        styles.add(ParagraphStyle(name='HashStyle', fontSize=7, fontName='Courier', leading=8))
+
+        story = []
+
+        logo_img = Image(logo_path, width=1.5 * inch, height=0.75 * inch, kind='proportional') if os.path.exists(
+            logo_path) else Paragraph("[Logo]", styles['Normal'])
+        header_data = [[logo_img, [Paragraph("Official Journey Report", styles['ReportTitle']), Spacer(1, 12),
+                                   Paragraph(f"Vehicle: <b>{vehicle.plate_number}</b>", styles['ReportSubtitle'])]]]
+        header_table = Table(header_data, colWidths=[2.0 * inch, 5.5 * inch])
+        header_table.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'BOTTOM')]))
+        story.append(header_table)
+        story.append(CHRL(7.5 * inch, thickness=2, color=colors.HexColor("#0D47A1")))
+        story.append(Spacer(1, 0.3 * inch))
+
+        passport_image = Paragraph("[No Image]", styles['Normal'])
+        if vehicle.driver_passport_image_path and os.path.exists(vehicle.driver_passport_image_path):
+            try:
+                passport_image = Image(variant_path(vehicle.driver_passport_image_path, 'pdf'), width=1.0 * inch,
+                                       height=1.2 * inch)
+            except Exception:
+                passport_image = Paragraph("[Error]", styles['Normal'])
+
+        final_hash = checkpoints['signature_hash'].iloc[-1] if not checkpoints.empty else vehicle.unique_hash
+        anchor = journey_proof(conn, journey_id, final_hash)
+        qr_fields = {'plate': vehicle.plate_number, 'final_hash': final_hash}
+        if anchor:
+            qr_fields.update(rollup_day=anchor['day'], merkle_root=anchor['root'], leaf_index=anchor['leaf_index'])
+        qr_data = json.dumps(qr_fields)
+        qr_code_image = Image(io.BytesIO(base64.b64decode(generate_qr_code_b64(qr_data))), width=1.2 * inch,
+                              height=1.2 * inch)
+
+        details_data = [
+            [Paragraph("<b>Company</b>", styles['DetailKey']),
+             Paragraph(vehicle.company_name, styles['DetailValue']), Paragraph("<b>Driver</b>", styles['DetailKey']),
+             Paragraph(f"{vehicle.driver_name} ({vehicle.driver_nationality})", styles['DetailValue']),
+             passport_image],
+            [Paragraph("<b>Route</b>", styles['DetailKey']),
+             Paragraph(f"{vehicle.origin} ➔ {vehicle.destination}", styles['DetailValue']),
+             Paragraph("<b>Dispatched</b>", styles['DetailKey']),
+             Paragraph(f"{pd.to_datetime(vehicle.created_at).strftime('%Y-%m-%d %H:%M')}", styles['DetailValue']),
+             ''],
+            [Paragraph("<b>Invoice No.</b>", styles['DetailKey']),
+             Paragraph(vehicle.invoice_number, styles['DetailValue']),
+             Paragraph("<b>Amount Paid</b>", styles['DetailKey']),
+             Paragraph(f"${vehicle.amount_paid:,.2f}", styles['DetailValue']), qr_code_image],
+            [Paragraph("<b>Initial Fuel</b>", styles['DetailKey']),
+             Paragraph(f"{vehicle.fuel_volume:,.0f} Liters", styles['DetailValue']), '', '', '']
+        ]
+        details_table = Table(details_data, colWidths=[1.0 * inch, 2.0 * inch, 1.0 * inch, 2.0 * inch, 1.5 * inch])
+        details_table.setStyle(TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'), ('GRID', (0, 0), (-2, -1), 1, colors.lightgrey),
+            ('SPAN', (4, 0), (4, 1)), ('ALIGN', (4, 0), (4, 1), 'CENTER'),
+            ('SPAN', (4, 2), (4, 3)), ('ALIGN', (4, 2), (4, 3), 'CENTER'),
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor("#E3F2FD")),
+            ('BACKGROUND', (2, 0), (2, -1), colors.HexColor("#E3F2FD")),
+        ]))
+        story.append(details_table)
+        story.append(Spacer(1, 0.3 * inch))
+
+        # Every entry is re-signed from its contents, not just checked for linkage.
+        *_, broken_id, reason = verify_chain(vehicle.unique_hash,
+                                             checkpoints[list(CHAIN_COLUMNS)].itertuples(index=False, name=None))
+        integrity_p = Paragraph(
+            f'✔ <font color="#2E7D32"><b>Chain Verified:</b> The log is complete and untampered.</font>' if broken_id is None else f'❌ <font color="#C62828"><b>Chain Broken:</b> The log integrity is compromised at entry {broken_id} ({reason})!</font>',
+            styles['Normal'])
+        story.append(integrity_p)
+        story.append(Spacer(1, 0.2 * inch))
+
+        # Add Genesis Hash
+        story.append(Paragraph(
+            f"<b>Genesis Hash:</b> <font size=7 face=Courier>{vehicle.unique_hash[:12]}...{vehicle.unique_hash[-12:]}</font>",
+            styles['Normal']))
+        story.append(Spacer(1, 0.2 * inch))
+
+        # The roll-up root and the sibling hashes that lead to it from this journey's tip.
+        if anchor:
+            story.append(Paragraph(
+                f"<b>Ledger Roll-up ({anchor['day']}):</b> <font size=7 face=Courier>{anchor['root']}</font>",
+                styles['Normal']))
+            story.append(Paragraph(
+                f"Leaf {anchor['leaf_index'] + 1} of {anchor['leaf_count']}; inclusion proof "
+                f"(sibling side, hash) from leaf to root:", styles['NotesStyle']))
+            proof_lines = [f"{side} {sibling}" for side, sibling in anchor['proof']] or ["(single leaf)"]
+            story.append(Paragraph("<br/>".join(proof_lines), styles['HashStyle']))
+        else:
+            story.append(Paragraph("<b>Ledger Roll-up:</b> pending; this tip is not yet in a daily roll-up.",
+                                   styles['Normal']))
+        story.append(Spacer(1, 0.2 * inch))
+
+        story.append(Paragraph("Checkpoint Ledger", styles['SectionHeader']))
+        story.append(CHRL(7.5 * inch, color=colors.HexColor("#B0BEC5")))
+
+        if not checkpoints.empty:
+            checkpoints = checkpoint_deltas(checkpoints, vehicle.fuel_volume)
+        for i, row in checkpoints.iterrows():
+            discrepancy = row['discrepancy']
+            disc_color, disc_text = PDF_SEVERITY_STYLES[row['severity']]
+
+            cp_header_data = [[Paragraph(f"<b>Checkpoint {i + 1}:</b> {row['checkpoint_name']}", styles['Normal']),
+                               Paragraph(
+                                   f"<b>Timestamp:</b> {pd.to_datetime(row['timestamp']).strftime('%Y-%m-%d %H:%M')}",
+                                   styles['RightAlign'])]]
+            story.append(Table(cp_header_data, colWidths=[3.75 * inch, 3.75 * inch],
+                               style=TableStyle([('BACKGROUND', (0, 0), (-1, -1), colors.HexColor("#E3F2FD"))])))
+
+            cp_details_data = [
+                [Paragraph("<b>Officer:</b>", styles['DetailKey']),
+                 Paragraph(row['officer_name'], styles['DetailValue'])],
+                [Paragraph("<b>Fuel Check:</b>", styles['DetailKey']),
+                 Paragraph(f"{row['fuel_volume_check']:,.0f} L", styles['DetailValue'])],
+                [Paragraph("<b>Discrepancy:</b>", styles['DetailKey']),
+                 Paragraph(f"<font color='{disc_color.hexval()}'>{disc_text}: {discrepancy:,.1f} L</font>",
+                           styles['DetailValue'])]
+            ]
+
+            if row['notes']:
+                cp_details_data.append(
+                    [Paragraph("<b>Notes:</b>", styles['DetailKey']), Paragraph(row['notes'], styles['NotesStyle'])])
+
+            # Truncated hashes link each checkpoint to the one before it.
+            if 'previous_hash' in row and row['previous_hash']:
+                prev_hash = row['previous_hash']
+                prev_hash_display = f"{prev_hash[:12]}...{prev_hash[-12:]}"
+                cp_details_data.append([Paragraph("<b>Prev Hash:</b>", styles['DetailKey']),
+                                        Paragraph(prev_hash_display, styles['HashStyle'])])
+
+            if 'signature_hash' in row and row['signature_hash']:
+                sig_hash = row['signature_hash']
+                sig_hash_display = f"{sig_hash[:12]}...{sig_hash[-12:]}"
+                cp_details_data.append([Paragraph("<b>Checkpoint Hash:</b>", styles['DetailKey']),
+                                        Paragraph(sig_hash_display, styles['HashStyle'])])
+
+            if 'image_path' in row and row['image_path'] and os.path.exists(row['image_path']):
+                try:
+                    # The PDF variant is already sized for this slot, so ReportLab decodes a small JPEG.
+                    img = Image(variant_path(row['image_path'], 'pdf'), width=3 * inch, kind='proportional')
+                    img.hAlign = 'LEFT'
+                    cp_details_data.append([Paragraph("<b>Evidence:</b>", styles['DetailKey']), img])
+                except Exception as e:
+                    print(f"PDF Image Error: Could not load or process image from path {row['image_path']}. Error: {e}")
+                    cp_details_data.append([Paragraph("<b>Evidence:</b>", styles['DetailKey']),
+                                            Paragraph("[Image File Error]", styles['NotesStyle'])])
+
+            cp_details_table = Table(cp_details_data, colWidths=[1.2 * inch, 6.3 * inch])
+            cp_details_table.setStyle(
+                TableStyle([('VALIGN', (0, 0), (-1, -1), 'TOP'), ('GRID', (0, 0), (-1, -1), 1, colors.lightgrey)]))
+            story.append(cp_details_table)
+            story.append(Spacer(1, 0.3 * inch))
+
+        def footer(canvas, doc):
+            canvas.saveState()
+            footer_text = "Defyhatenow EA Office | Juba, Hai-Malakal, Nimule Street | Tel: +211 922 007 505"
+            page_num_text = f"Page {doc.page}"
+            canvas.setFont('Helvetica', 8)
+            canvas.setFillColor(colors.grey)
+            canvas.drawCentredString(letter[0] / 2.0, 0.3 * inch, footer_text)
+            canvas.drawRightString(letter[0] - 0.5 * inch, 0.3 * inch, page_num_text)
+            canvas.restoreState()
+
+        doc.build(story, onFirstPage=footer, onLaterPages=footer)
+        buffer.seek(0)
+        return buffer.getvalue()
+    except Exception as e:
+        print(f"CRITICAL ERROR in create_journey_pdf: {e}")
+        return None
+
+
+def _render_report(db_file, journey_id, path, logo_path, archive_dir):
+    """Process pool task: renders one report into the cache and drops the journey's stale copies."""
+    conn = LedgerArchive(db_file, archive_dir).open_journey(journey_id)
+    try:
+        pdf_bytes = create_journey_pdf(conn, journey_id, logo_path)
+    finally:
+        conn.close()
+    if pdf_bytes is None:
+        raise RuntimeError(f"The report for journey {journey_id} could not be rendered.")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(pdf_bytes)
+    os.replace(tmp, path)
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f"journey-{journey_id}-*.pdf")):
+        if stale != path:
+            os.remove(stale)
+    return path
+
+
+class _ZipSink(io.RawIOBase):
+    """Non-seekable file that collects what zipfile writes until the next drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ReportService:
+    """Hands out cached reports and schedules renders for missing ones."""
+
+    def __init__(self, db_file, cache_dir, max_workers=None, logo_path=LOGO_PATH, archive_dir=ARCHIVE_DIR):
+        self.db_file = db_file
+        self.archive = LedgerArchive(db_file, archive_dir)
+        self.cache_dir = cache_dir
+        self.export_dir = os.path.join(cache_dir, 'exports')
+        # None uses one worker process per CPU.
+        self.max_workers = max_workers
+        self.logo_path = logo_path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._jobs = {}
+
+    def _pool(self):
+        if self._pid != os.getpid():
+            # Spawned workers do not inherit this process's threads, locks or open connections.
+            self._pid = os.getpid()
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            self._jobs = {}
+        return self._executor
+
+    def cache_path(self, journey_id, tip_hash, anchor_day=None):
+        anchor = f"-{anchor_day}" if anchor_day else ''
+        return os.path.join(self.cache_dir, f"journey-{journey_id}-{tip_hash[:16]}{anchor}.pdf")
+
+    def _submit(self, journey_id, path):
+        """Returns the render future for path, starting one unless it is already in flight. Hold self._lock."""
+        future = self._jobs.get(path)
+        if future is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            future = self._jobs[path] = self._pool().submit(_render_report, self.db_file, journey_id, path,
+                                                            self.logo_path, self.archive.archive_dir)
+        return future
+
+    def request(self, conn, journey_id):
+        """Returns the report job for a journey, scheduling a render if the cached copy is missing.
+
+        The job is a JSON-serializable dict whose 'state' is 'ready',
+        'rendering' or 'failed'; calling request() again polls it.
+        """
+        row = conn.execute(queries.REPORT_KEY, (journey_id,)).fetchone()
+        month = self.archive.month_of(conn, journey_id) if row is None else None
+        if month:
+            with closing(self.archive.connect(month)) as archive:
+                row = archive.execute(queries.REPORT_KEY, (journey_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Journey {journey_id} does not exist.")
+        plate, tip_hash, anchor_day = row
+        path = self.cache_path(journey_id, tip_hash, anchor_day)
+        job = {'journey_id': journey_id, 'plate': plate, 'path': path}
+        if os.path.exists(path):
+            return dict(job, state='ready')
+        with self._lock:
+            future = self._submit(journey_id, path)
+            if not future.done():
+                return dict(job, state='rendering')
+            del self._jobs[path]
+        error = future.exception()
+        return dict(job, state='failed', error=str(error)) if error else dict(job, state='ready')
+
+    # --- bulk export ---
+    def _export_path(self, export_id):
+        return os.path.join(self.export_dir, f"{export_id}.json")
+
+    def _save_export(self, export):
+        tmp = f"{self._export_path(export['id'])}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(export, f)
+        os.replace(tmp, self._export_path(export['id']))
+
+    def create_export(self, filters, total):
+        """Registers a bulk export and returns its id. State is kept in a file so any worker can serve it."""
+        os.makedirs(self.export_dir, exist_ok=True)
+        for entry in os.scandir(self.export_dir):
+            if time.time() - entry.stat().st_mtime > EXPORT_RETENTION:
+                os.remove(entry.path)
+        export = {'id': secrets.token_hex(8), 'filters': filters, 'state': 'pending', 'total': total, 'done': 0,
+                  'failed': 0, 'bytes': 0, 'elapsed': 0.0, 'reports_per_s': 0.0, 'mb_per_s': 0.0}
+        self._save_export(export)
+        return export['id']
+
+    def load_export(self, export_id):
+        """Returns the export's state and progress, or None for an unknown id."""
+        if not re.fullmatch(r'[0-9a-f]{16}', export_id or ''):
+            return None
+        try:
+            with open(self._export_path(export_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def stream_export(self, export, journeys, chunk_size=1 << 20):
+        """Yields a ZIP of the journeys' reports, adding each one as soon as it is rendered.
+
+        journeys are (id, plate_number, created_at, tip_hash, anchor_day) rows. Cached
+        reports go first while the rest render in parallel. Only one chunk of
+        one report is held in memory at a time; PDFs are already compressed,
+        so entries are stored. A cached report removed by a newer render
+        before it is read is left out and marked 'superseded' in the manifest.
+        """
+        sink = _ZipSink()
+        manifest = io.StringIO()
+        writer = csv.writer(manifest)
+        writer.writerow(['journey_id', 'plate_number', 'created_at', 'tip_hash', 'file', 'status'])
+        cached, pending = [], {}
+        with self._lock:
+            for journey_id, plate, created_at, tip_hash, anchor_day in journeys:
+                row = (journey_id, plate, created_at, tip_hash, f"Report-{plate}-{journey_id}.pdf")
+                path = self.cache_path(journey_id, tip_hash, anchor_day)
+                if os.path.exists(path):
+                    cached.append((row, path, None))
+                else:
+                    pending[self._submit(journey_id, path)] = (row, path)
+
+        def finished():
+            yield from cached
+            for future in as_completed(pending):
+                row, path = pending[future]
+                with self._lock:
+                    if self._jobs.get(path) is future:
+                        del self._jobs[path]
+                yield row, path, future.exception()
+
+        started = time.monotonic()
+        export.update(state='streaming', total=len(journeys), done=0, failed=0, bytes=0)
+        try:
+            with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as zf:
+                for row, path, error in finished():
+                    status = 'ok' if error is None else 'failed'
+                    if error is None:
+                        try:
+                            # Once open, the copy can be read to the end even if it is removed meanwhile.
+                            src = open(path, 'rb')
+                        except FileNotFoundError:
+                            # A render of a newer state of the journey dropped this copy after it was looked up.
+                            status = 'superseded'
+                    if status == 'ok':
+                        with src, zf.open(row[4], 'w') as dst:
+                            while chunk := src.read(chunk_size):
+                                dst.write(chunk)
+                                data = sink.drain()
+                                export['bytes'] += len(data)
+                                yield data
+                    else:
+                        reason = f"failed to render: {error}" if error else "its cached report was superseded"
+                        print(f"Export {export['id']}: journey {row[0]} {reason}")
+                        export['failed'] += 1
+                    writer.writerow([*row, status])
+                    export['done'] += 1
+                    elapsed = time.monotonic() - started
+                    export.update(elapsed=round(elapsed, 2), reports_per_s=round(export['done'] / elapsed, 2),
+                                  mb_per_s=round(export['bytes'] / elapsed / 1e6, 2))
+                    self._save_export(export)
+                zf.writestr('manifest.csv', manifest.getvalue())
+            data = sink.drain()
+            export['bytes'] += len(data)
+            export['state'] = 'done'
+            yield data
+        finally:
+            # A client that disconnects leaves the remaining renders to finish into the cache.
+            if export['state'] != 'done':
+                export['state'] = 'aborted'
+            self._save_export(export)
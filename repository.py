@@ -0,0 +1,62 @@
+"""Row-mapping reads for point lookups and small result sets.
+
+pandas.read_sql_query builds a DataFrame, with an index and one array per
+column, even when the query returns a single row, and iterrows() then
+builds a Series per row. The functions here iterate the cursor and map each
+row onto a namedtuple instead: fields are read by attribute, the tuples
+carry no per-instance dict, and nothing is allocated beyond the rows
+themselves. Keep pandas for analytics over many rows, such as the
+dashboard charts, monitor anomalies and checkpoint deltas.
+
+    python bench_repository.py    # per-call latency and allocations of both
+"""
+
+from collections import namedtuple
+from heapq import merge
+
+import queries
+
+PAGE_SIZE = 20
+
+# Columns selected by queries.JOURNEY_BY_ID, in order.
+Journey = namedtuple('Journey', (
+    'id', 'plate_number', 'driver_name', 'driver_id', 'driver_nationality', 'driver_passport_image_path',
+    'company_name', 'company_till_number', 'invoice_number', 'amount_paid', 'origin', 'destination', 'fuel_volume',
+    'created_at', 'status', 'unique_hash', 'truck_id'))
+JourneyOption = namedtuple('JourneyOption', ('id', 'plate_number', 'destination', 'created_at'))
+
+
+def _rows(conn, sql, row_type, params=()):
+    return list(map(row_type._make, conn.execute(sql, params)))
+
+
+def journey(conn, journey_id):
+    """The journey with the given id, or None."""
+    row = conn.execute(queries.JOURNEY_BY_ID, (journey_id,)).fetchone()
+    return Journey._make(row) if row else None
+
+
+def journey_page(conn, plate=None, company=None, destination=None, since=None, until=None, after=None,
+                 limit=PAGE_SIZE):
+    """One page of completed and archived journeys for the report picker, newest first.
+
+    plate is a prefix, since and until bound created_at as [since, until),
+    and after is the (created_at, id) of the last journey on the previous
+    page. Returns the journeys and the cursor of the next page, or None on
+    the last page.
+    """
+    plate = (plate or '').strip().upper() or None
+    before = (until or '9999-12-31', 0)
+    if after and tuple(after) < before:
+        before = tuple(after)
+    params = {'plate': plate, 'plate_end': plate and plate[:-1] + chr(ord(plate[-1]) + 1), 'company': company,
+              'destination': destination, 'since': since or '', 'before_ts': before[0], 'before_id': before[1],
+              'limit': limit + 1}
+    variant = 'plate' if plate else 'company' if company else 'destination' if destination else None
+    # Archived journeys are in their own catalog; both sides are read past the same cursor and merged.
+    hot = _rows(conn, queries.COMPLETED_JOURNEY_PAGES[variant], JourneyOption, params)
+    archived = _rows(conn, queries.ARCHIVED_JOURNEY_PAGES[variant], JourneyOption, params)
+    journeys = list(merge(hot, archived, key=lambda j: (j.created_at, j.id), reverse=True))
+    if len(journeys) <= limit:
+        return journeys, None
+    return journeys[:limit], (journeys[limit - 1].created_at, journeys[limit - 1].id)
@@ -0,0 +1,106 @@
+"""Streaming image uploads that hand the Dash callbacks a short handle instead of file contents.
+
+The browser posts the file to /upload as multipart form data. The body is
+parsed incrementally and the file part is written straight into the
+incoming directory, so a photo never passes through a callback or sits in
+worker memory. The image is then normalized by images.ingest_image and the
+original is discarded. Callbacks resolve the handle with path() and move
+the master and its variants into the blob store.
+"""
+
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+
+from PIL import Image as PILImage, UnidentifiedImageError
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.formparser import FormDataParser
+
+from images import ingest_image
+
+MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+ALLOWED_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP', 'GIF', 'BMP', 'TIFF'}
+
+_HANDLE_RE = re.compile(r'^[0-9a-f]{32}\.webp$')
+
+
+class UploadStore:
+    """Holds uploaded files under opaque handles until a callback claims them."""
+
+    def __init__(self, root, max_bytes=MAX_UPLOAD_BYTES, max_age=6 * 3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._next_prune = 0.0
+        self._prune_lock = threading.Lock()
+
+    def receive(self, request, field='file'):
+        """Streams the multipart file field of a Flask request to disk and returns (handle, filename)."""
+        if request.content_length is None:
+            raise BadRequest("Upload must declare its Content-Length.")
+        if request.content_length > self.max_bytes:
+            raise RequestEntityTooLarge(f"Uploads are limited to {self.max_bytes // (1024 * 1024)} MB.")
+        os.makedirs(self.root, exist_ok=True)
+        self._prune()
+
+        def stream_factory(total_content_length, content_type, filename, content_length=None):
+            return tempfile.NamedTemporaryFile('wb+', dir=self.root, prefix='.partial-', delete=False)
+
+        parser = FormDataParser(stream_factory=stream_factory, max_content_length=self.max_bytes)
+        _, _, files = parser.parse(request.stream, request.mimetype, request.content_length,
+                                   request.mimetype_params)
+        partials = [f.stream.name for f in files.values()]
+        try:
+            upload = files.get(field)
+            if upload is None or not upload.filename:
+                raise BadRequest(f"Missing file field '{field}'.")
+            upload.stream.close()
+            self._check_format(upload.stream.name)
+            token = secrets.token_hex(16)
+            try:
+                ingest_image(upload.stream.name, self.root, token)
+            except (OSError, ValueError, PILImage.DecompressionBombError):
+                raise UnsupportedMediaType("The image could not be decoded.")
+            return f"{token}.webp", os.path.basename(upload.filename)
+        finally:
+            for f in files.values():
+                f.stream.close()
+            for name in partials:
+                os.remove(name)
+
+    @staticmethod
+    def _check_format(path):
+        """Identifies the image format from the file header rather than the client's filename."""
+        try:
+            with PILImage.open(path) as img:
+                fmt = img.format
+        except PILImage.DecompressionBombError:
+            raise RequestEntityTooLarge("The image has too many pixels.")
+        except (UnidentifiedImageError, OSError):
+            fmt = None
+        if fmt not in ALLOWED_FORMATS:
+            raise UnsupportedMediaType("Only JPEG, PNG, WebP, GIF, BMP and TIFF images are accepted.")
+
+    def path(self, handle):
+        """Returns the file path for a pending handle, or None if it is invalid or expired."""
+        if not handle or not _HANDLE_RE.match(handle):
+            return None
+        path = os.path.join(self.root, handle)
+        return path if os.path.exists(path) else None
+
+    def _prune(self):
+        """Deletes uploads that were never claimed, at most once a minute."""
+        now = time.time()
+        with self._prune_lock:
+            if now < self._next_prune:
+                return
+            self._next_prune = now + 60
+        for entry in os.scandir(self.root):
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime > self.max_age:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass